@@ -0,0 +1,6 @@
+"""
+Benchmarks for MorphoMeasure, run with `python -m benchmarks`.
+Modules:
+    synthetic: Generates synthetic SWC neurons of controllable size, depth and compartment tags.
+    bench: Times extract_features, run_batch and the summary stage, and compares the results to stored baselines.
+"""
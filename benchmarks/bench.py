@@ -0,0 +1,201 @@
+# benchmarks/bench.py
+"""
+This module times the main stages of MorphoMeasure on synthetic neurons and checks them against baselines.
+Functions:
+    run_case(stage, backend, swc_dir, repeat, lm_exe_path): Times one stage on a dataset.
+    run_benchmarks(stages, backends, sizes, neurons, repeat, lm_exe_path): Times every combination.
+    compare(results, baseline, tolerance): Lists the regressions of `results` against a baseline.
+    main(argv): Command-line entry point, `python -m benchmarks`.
+Notes:
+    - Stages: 'extract' (LMeasureWrapper.extract_features, one tag), 'batch' (run_batch with tags 3.0 and 4.0
+      in 'all' mode) and 'summary' (summarize on precomputed tables; independent of the backend).
+    - Every case runs in a fresh process, so that its peak RSS (including child processes such as the
+      persistent worker) is its own. After one untimed warm-up round, the best of `repeat` timings is kept.
+    - Baselines are machine-specific and are not committed: record them with --update-baseline on the machine
+      that then runs --check, which fails when throughput drops, or peak RSS grows, by more than the tolerance.
+      The CI benchmark job (.github/workflows/benchmarks.yml) records them on its runner from the base commit,
+      timed with the same harness, and checks the new commit against them.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from .synthetic import generate_dataset
+
+SIZES = {"small": 500, "medium": 5_000, "large": 50_000}
+STAGES = ("extract", "batch", "summary")
+BACKENDS = ("native", "worker", "lm")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def run_case(stage, backend, swc_dir, repeat=3, lm_exe_path=None):
+    """
+    Times one stage on every SWC file of `swc_dir`.
+
+    Parameters:
+        stage (str): One of STAGES.
+        backend (str): Backend of the LMeasureWrapper ('native', 'worker' or 'lm').
+        swc_dir (str): Directory of the synthetic dataset.
+        repeat (int): Number of timings; the best is kept.
+        lm_exe_path (str, optional): L-Measure executable for the 'lm' backend.
+
+    Returns:
+        dict: neurons, seconds, neurons_per_sec and peak_rss_mb (None where unavailable).
+    """
+    from morphomeasure import LMeasureWrapper
+    from morphomeasure.features import features, summary_logic
+    from morphomeasure.summary import summarize
+
+    swc_paths = sorted(os.path.join(swc_dir, f) for f in os.listdir(swc_dir) if f.endswith(".swc"))
+    lm = LMeasureWrapper(lm_exe_path, backend=backend)
+    if stage == "summary":
+        frames = [(path, tag, lm.extract_features(path, features, tag)) for path in swc_paths for tag in ("3.0", "4.0")]
+
+    timings = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        # The first, untimed round starts the worker and warms up imports and caches
+        for _ in range(repeat + 1):
+            start = time.perf_counter()
+            if stage == "extract":
+                for path in swc_paths:
+                    lm.extract_features(path, features, "3.0")
+            elif stage == "batch":
+                lm.run_batch(swc_dir, out_dir, ["3.0", "4.0"], features_mode="all", resume=False)
+            elif stage == "summary":
+                summarize(frames, summary_logic)
+            else:
+                raise ValueError(f"Unknown stage '{stage}', expected one of {', '.join(STAGES)}")
+            timings.append(time.perf_counter() - start)
+    timings = timings[1:]
+    if lm.worker is not None:
+        lm.worker.close()
+    seconds = min(timings)
+    return {
+        "neurons": len(swc_paths),
+        "seconds": seconds,
+        "neurons_per_sec": len(swc_paths) / seconds,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_benchmarks(stages=STAGES, backends=("native", "worker"), sizes=tuple(SIZES), neurons=4, repeat=3, lm_exe_path=None):
+    """
+    Times every combination of stage, backend and size, each in a fresh process.
+
+    Returns:
+        dict: "stage/backend/size" to the result of `run_case`. The summary stage is run once per size,
+        under the backend 'any'.
+    """
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as data_dir:
+        for size in sizes:
+            swc_dir = os.path.join(data_dir, size)
+            generate_dataset(swc_dir, neurons, n_nodes=SIZES[size], depth=5, tags=(3, 4, 7))
+            for stage in stages:
+                for backend in (("native",) if stage == "summary" else backends):
+                    with context.Pool(1) as pool:
+                        result = pool.apply(run_case, (stage, backend, swc_dir, repeat, lm_exe_path))
+                    key = f"{stage}/{'any' if stage == 'summary' else backend}/{size}"
+                    results[key] = result
+                    print(f"{key:<24} {result['neurons_per_sec']:>10.2f} neurons/s  "
+                          f"peak RSS {result['peak_rss_mb'] or float('nan'):>8.1f} MB", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance=0.3):
+    """
+    Lists the cases of `results` that regressed against `baseline`.
+
+    A case regresses when its throughput is below (1 - tolerance) times the baseline, or its peak RSS above
+    (1 + tolerance) times the baseline. Cases missing from the baseline are not compared.
+
+    Returns:
+        list of str: One message per regression.
+    """
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        if result["neurons_per_sec"] < reference["neurons_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: {result['neurons_per_sec']:.2f} neurons/s, baseline {reference['neurons_per_sec']:.2f}"
+            )
+        if result["peak_rss_mb"] and reference.get("peak_rss_mb") and (
+            result["peak_rss_mb"] > reference["peak_rss_mb"] * (1 + tolerance)
+        ):
+            regressions.append(f"{key}: peak RSS {result['peak_rss_mb']:.1f} MB, baseline {reference['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def main(argv=None):
+    """
+    Runs the benchmarks, optionally recording them as the baseline or checking them against it.
+    Exits with status 1 when --check finds a regression.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="MorphoMeasure benchmarks")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=['native', 'worker'],
+                        help="Backends to time (default: native worker; 'lm' needs --lm_exe_path or the bundled Lm.exe)")
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES),
+                        help='Neuron sizes: ' + ', '.join(f'{k} ({v} nodes)' for k, v in SIZES.items()))
+    parser.add_argument('--neurons', type=int, default=4, help='Neurons per dataset (default: 4)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timings per case; the best is kept (default: 3)')
+    parser.add_argument('--lm_exe_path', default=None, help='L-Measure executable for the lm backend')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline file (default: benchmarks/baselines.json, not committed)')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='Allowed relative drop in throughput or growth in peak RSS (default: 0.3)')
+    parser.add_argument('--check', action='store_true', help='Fail if a case regressed against the baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--json', default=None, help='Also write the results to this file')
+    args = parser.parse_args(argv)
+    if args.check and not args.update_baseline and not os.path.exists(args.baseline):
+        parser.error(f"no baseline at {args.baseline}; record one on this machine with --update-baseline")
+
+    results = run_benchmarks(args.stages, args.backends, args.sizes, args.neurons, args.repeat, args.lm_exe_path)
+    document = {
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "neurons": args.neurons,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    if args.check:
+        with open(args.baseline) as f:
+            reference = json.load(f)
+        if reference.get("machine") != document["machine"]:
+            print(f"WARNING the baseline was recorded on another machine ({reference.get('machine')}), "
+                  f"the comparison is not meaningful")
+        regressions = compare(results, reference["results"], args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
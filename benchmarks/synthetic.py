@@ -0,0 +1,99 @@
+# benchmarks/synthetic.py
+"""
+This module generates synthetic SWC neurons for benchmarks and tests.
+Functions:
+    synthetic_swc(n_nodes, depth, tags, stems_per_tag, seed): Returns the SWC text of one neuron.
+    write_synthetic_swc(path, **kwargs): Writes one neuron to a file.
+    generate_dataset(directory, count, **kwargs): Writes `count` neurons with different seeds.
+Notes:
+    - A neuron is a one-node soma (type 1) with `stems_per_tag` stems per compartment tag (3 basal, 4 apical,
+      7 glia). Every stem grows a full binary tree of `depth` bifurcation levels, and the nodes are spread
+      evenly over its branches, so `n_nodes` is matched exactly.
+    - Branches follow a random walk with decreasing radius; apical stems point up (+y), the others in
+      random directions. The same arguments always produce the same file.
+"""
+
+import os
+
+import numpy as np
+
+
+def synthetic_swc(n_nodes=1000, depth=6, tags=(3, 4), stems_per_tag=2, seed=0):
+    """
+    Generates one synthetic neuron.
+
+    Parameters:
+        n_nodes (int): Total number of SWC samples, including the soma.
+        depth (int): Bifurcation levels below each stem (0 gives unbranched stems).
+        tags (iterable of int): Compartment types of the stems, e.g. (3, 4, 7).
+        stems_per_tag (int): Stems grown per tag.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        str: SWC content.
+
+    Raises:
+        ValueError: If `n_nodes` is too small to give every branch at least one node.
+    """
+    tags = tuple(tags)
+    branches_per_stem = 2 ** (depth + 1) - 1
+    n_branches = len(tags) * stems_per_tag * branches_per_stem
+    if n_nodes - 1 < n_branches:
+        raise ValueError(f"{n_nodes} nodes cannot fill {n_branches} branches; lower depth or stems_per_tag")
+    per_branch, extra = divmod(n_nodes - 1, n_branches)
+    rng = np.random.default_rng(seed)
+
+    lines = [f"# synthetic neuron: n_nodes={n_nodes} depth={depth} tags={tags} seed={seed}"]
+    lines.append("1 1 0.0 0.0 0.0 5.0 -1")
+    next_id = 2
+    branch = 0
+    for tag in tags:
+        for _ in range(stems_per_tag):
+            if tag == 4:
+                direction = np.array([0.0, 1.0, 0.0])
+            else:
+                direction = rng.normal(size=3)
+                direction /= np.linalg.norm(direction)
+            # Breadth-first over the branches of the stem: (parent id, start, direction, level, radius)
+            queue = [(1, direction * 5.0, direction, 0, 1.5)]
+            while queue:
+                parent, position, direction, level, radius = queue.pop(0)
+                n = per_branch + (1 if branch < extra else 0)
+                branch += 1
+                steps = rng.normal(size=(n, 3)) * 0.3 + direction
+                steps *= rng.uniform(1.0, 3.0, size=(n, 1)) / np.linalg.norm(steps, axis=1, keepdims=True)
+                points = position + np.cumsum(steps, axis=0)
+                radii = np.maximum(radius * np.linspace(1.0, 0.8, n), 0.1)
+                for k in range(n):
+                    x, y, z = points[k]
+                    lines.append(f"{next_id} {tag} {x:.3f} {y:.3f} {z:.3f} {radii[k]:.3f} {parent}")
+                    parent = next_id
+                    next_id += 1
+                if level < depth:
+                    for sign in (1.0, -1.0):
+                        turn = direction + sign * 0.6 * rng.normal(size=3)
+                        queue.append((parent, points[-1], turn / np.linalg.norm(turn), level + 1, radii[-1] * 0.8))
+    return "\n".join(lines) + "\n"
+
+
+def write_synthetic_swc(path, **kwargs):
+    """
+    Writes one synthetic neuron to `path` (see `synthetic_swc` for the keyword arguments) and returns the path.
+    """
+    with open(path, "w") as f:
+        f.write(synthetic_swc(**kwargs))
+    return path
+
+
+def generate_dataset(directory, count, seed=0, **kwargs):
+    """
+    Writes `count` synthetic neurons, neuron_000.swc, neuron_001.swc, ..., with seeds seed, seed + 1, ...
+
+    Returns:
+        list of str: Paths of the files written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    return [
+        write_synthetic_swc(os.path.join(directory, f"neuron_{i:03d}.swc"), seed=seed + i, **kwargs)
+        for i in range(count)
+    ]
@@ -0,0 +1,13 @@
+# conftest.py
+"""
+Root pytest configuration: puts the source checkout on sys.path, so that the tests can import the
+`benchmarks` package (not installed with morphomeasure) whether pytest is run as `pytest` or
+`python -m pytest`, from any directory.
+"""
+
+import os
+import sys
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
@@ -1,10 +1,17 @@
 __version__ = "0.1.2"
 
-from .lmwrapper import LMeasureWrapper
+__all__ = ["LMeasureWrapper"]
+
+
+def __getattr__(name):
+    # LMeasureWrapper pulls in pandas and NumPy, so it is only imported on first access
+    if name == "LMeasureWrapper":
+        from .lmwrapper import LMeasureWrapper
+        return LMeasureWrapper
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 """
-Initializes the MorphoMeasure package by importing the LMeasureWrapper class from the lmwrapper module.
+Initializes the MorphoMeasure package. LMeasureWrapper is imported lazily from the lmwrapper module on first
+access, so that `import morphomeasure` and `morphomeasure --help` do not import pandas or NumPy.
 Imports:
     LMeasureWrapper (from .lmwrapper): A wrapper class for LMeasure functionality.
 """
-
-
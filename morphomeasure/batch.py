@@ -0,0 +1,152 @@
+# morphomeasure/batch.py
+"""
+This module computes the morphometrics of many small neurons at once, for datasets where per-file overhead
+dominates, such as tens of thousands of glia reconstructions.
+Functions:
+    concat_trees(trees): Concatenates reconstructions into one ragged SWCTree with node offsets.
+    batch_arrays(tree, owner, n_neurons, resolved): Computes every feature for all neurons of a ragged tree.
+    stack_batch(names, tag, arrays): Lays the ragged values out as the stacked table used by the summaries.
+    summarize_batch(swc_files, tag, ...): Returns the per-neuron summary rows of a list of SWC files.
+Notes:
+    - The neurons of a chunk are concatenated into one SWCTree whose disconnected trees are the neurons, so
+      the topology (pointer jumping, branch segmentation) and every feature of `features.py` are computed by
+      one vectorized pass over all of them. Each value is traced back to its neuron through the node it
+      belongs to; per-neuron functions (Soma_Surface, Width, Height, Depth, Sholl analysis) use grouped reductions.
+    - Values are the same as those of the native backend run on each file, and the summary rows are those
+      written to All_Morphometrics_<tag>.csv, e.g. All_Morphometrics_glia.csv for tag 7.0.
+    - Files are processed in chunks of `chunk_size` neurons to bound memory.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .features import features, summary_logic
+from .native import grouped_function, parse_feature_flag, sholl_step
+from .sources import SWCBytes
+from .summary import summarize_stacked
+from .swc import NODE_DTYPE, SWCTree, load_swc
+
+
+def _load_tree(path, sidecar):
+    if path.endswith(".gz"):
+        return SWCBytes.from_path(path).tree()
+    return load_swc(path, sidecar)
+
+
+def concat_trees(trees):
+    """
+    Concatenates reconstructions into one tree.
+
+    Parameters:
+        trees (list of SWCTree): The reconstructions.
+
+    Returns:
+        tuple: (tree, offsets) where the nodes of trees[i] are rows offsets[i]:offsets[i + 1] of `tree`.
+        Sample ids are renumbered so that they are unique; parents that did not resolve in their own file
+        stay roots.
+    """
+    counts = np.array([len(t) for t in trees], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    nodes = np.concatenate([t.nodes for t in trees]) if trees else np.zeros(0, dtype=NODE_DTYPE)
+    parent = np.concatenate([t.parent for t in trees]) if trees else np.zeros(0, dtype=np.int64)
+    # Row index + 1 is a unique id; parents point to the id of their (already resolved) parent row
+    row_parent = np.where(parent >= 0, parent + np.repeat(offsets[:-1], counts), -1)
+    nodes["id"] = np.arange(1, len(nodes) + 1)
+    nodes["parent"] = np.where(row_parent >= 0, row_parent + 1, -1)
+    return SWCTree(nodes), offsets
+
+
+def batch_arrays(tree, owner, n_neurons, resolved):
+    """
+    Computes features for every neuron of a ragged tree.
+
+    Parameters:
+        tree (SWCTree): Concatenated reconstructions (see `concat_trees`).
+        owner (numpy.ndarray): Neuron index of every node.
+        n_neurons (int): Number of neurons.
+        resolved (dict): Feature name to L-Measure flag, with '{TAG}' already substituted.
+
+    Returns:
+        dict: Feature name to (values, neurons), where neurons holds the neuron index of each value; the
+        values of a neuron are in the order the native backend returns them.
+    """
+    arrays = {}
+    for feature_name, feature_flag in resolved.items():
+        filters, function_id = parse_feature_flag(feature_flag)
+        arrays[feature_name] = grouped_function(
+            tree, function_id, filters, owner, n_neurons, sholl_step(feature_flag)
+        )
+    return arrays
+
+
+def stack_batch(names, tag, arrays):
+    """
+    Lays ragged feature values out as one table with a row block per neuron.
+
+    Parameters:
+        names (list of str): Neuron names, by neuron index.
+        tag (str): Tag of the values.
+        arrays (dict): Feature name to (values, neurons), as returned by `batch_arrays`.
+
+    Returns:
+        pd.DataFrame: float64 feature columns indexed by (neuron, tag, row), padded with NaN like the tables
+        of `LMeasureWrapper.extract_features` stacked by `summary.stack_frames`.
+    """
+    n = len(names)
+    counts = {name: np.bincount(neurons, minlength=n) for name, (_, neurons) in arrays.items()}
+    rows = np.max(np.vstack(list(counts.values())), axis=0) if counts else np.zeros(n, dtype=np.int64)
+    row_offsets = np.concatenate([[0], np.cumsum(rows)])
+    matrix = np.full((int(row_offsets[-1]), len(arrays)), np.nan)
+    for j, (name, (values, neurons)) in enumerate(arrays.items()):
+        order = np.argsort(neurons, kind="stable")
+        values, neurons = values[order], neurons[order]
+        starts = np.concatenate([[0], np.cumsum(counts[name])[:-1]])
+        matrix[row_offsets[neurons] + np.arange(len(values)) - starts[neurons], j] = values
+    index = pd.MultiIndex.from_arrays(
+        [
+            np.repeat(np.asarray(names, dtype=object), rows),
+            np.full(int(row_offsets[-1]), tag, dtype=object),
+            np.arange(int(row_offsets[-1])) - np.repeat(row_offsets[:-1], rows),
+        ],
+        names=["neuron", "tag", "row"],
+    )
+    return pd.DataFrame(matrix, index=index, columns=list(arrays))
+
+
+def summarize_batch(swc_files, tag="7.0", features_dict=features, summary_logic=summary_logic, names=None,
+                    chunk_size=4096, sidecar=None):
+    """
+    Computes the summary row of every neuron of a list of SWC files in vectorized chunks.
+
+    Parameters:
+        swc_files (list of str or SWCTree): SWC (or .swc.gz) file paths, or already loaded reconstructions.
+        tag (str): Tag substituted for '{TAG}'. Default is '7.0' (glia).
+        features_dict (dict): Feature names to L-Measure flags. Default is `features`.
+        summary_logic (dict): {column_name: (operation, output_label)}. Default is `summary_logic`.
+        names (list of str, optional): Key of each neuron in the result. Default: the file names, or the
+            position for reconstructions.
+        chunk_size (int): Neurons concatenated per vectorized pass. Default is 4096.
+        sidecar (bool or str, optional): Binary sidecar location of the parsed files (see `swc.load_swc`).
+
+    Returns:
+        dict: Neuron name to summary row ({output_label: value}), in input order, as used for the
+        All_Morphometrics tables (see `morphomeasure.output.write_summary_tables`).
+    """
+    if names is None:
+        names = [os.path.basename(f) if isinstance(f, str) else i for i, f in enumerate(swc_files)]
+    resolved = {name: flag.replace('{TAG}', tag) for name, flag in features_dict.items()}
+    rows = {}
+    for start in range(0, len(swc_files), chunk_size):
+        chunk = swc_files[start:start + chunk_size]
+        chunk_names = list(names[start:start + chunk_size])
+        trees = [f if isinstance(f, SWCTree) else _load_tree(f, sidecar) for f in chunk]
+        tree, offsets = concat_trees(trees)
+        owner = np.repeat(np.arange(len(trees)), np.diff(offsets))
+        stacked = stack_batch(chunk_names, tag, batch_arrays(tree, owner, len(trees), resolved))
+        tag_summaries, _ = summarize_stacked(
+            stacked, [(name, tag) for name in chunk_names], summary_logic, combined=False
+        )
+        rows.update({name: tag_summaries[(name, tag)] for name in chunk_names})
+    return rows
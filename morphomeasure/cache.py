@@ -0,0 +1,169 @@
+# morphomeasure/cache.py
+"""
+This module implements a persistent, content-addressed cache of per-feature L-Measure results.
+Classes:
+    FeatureCache: On-disk cache with LRU eviction under a size cap.
+Functions:
+    file_digest(path): SHA-256 of a file's bytes.
+    bytes_digest(data): SHA-256 of an in-memory buffer.
+Notes:
+    - Keys combine the hash of the SWC bytes, the resolved feature flag (after '{TAG}' substitution) and a
+      hash of the engine (the L-Measure binary, or the native backend's source), so identical SWC files
+      stored under different names share entries, and updating the engine invalidates them.
+    - Entries are small JSON files written atomically, so several worker processes can share one cache.
+    - Reading an entry refreshes its modification time, which is used as the LRU clock for eviction.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+_CHUNK = 1 << 20
+# Bumped when the format of the cached values changes
+_KEY_VERSION = "2"
+
+
+def bytes_digest(data):
+    """
+    Returns the hex SHA-256 digest of a bytes buffer.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path):
+    """
+    Returns the hex SHA-256 digest of a file, read in 1 MiB chunks.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, cache_dir, max_bytes=1 << 30):
+        """
+        Opens (and creates if needed) a cache directory.
+
+        Args:
+            cache_dir (str): Directory holding the cache entries.
+            max_bytes (int, optional): Size cap; the least recently used entries are evicted beyond it.
+                Default is 1 GiB.
+
+        Attributes:
+            hits (int): Number of lookups served from the cache.
+            misses (int): Number of lookups that were not in the cache.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(swc_digest, feature_flag, engine_digest):
+        """
+        Builds the cache key of one feature of one SWC file.
+
+        Parameters:
+            swc_digest (str): Digest of the SWC file content.
+            feature_flag (str): Resolved L-Measure flag, with '{TAG}' substituted.
+            engine_digest (str): Digest identifying the engine that computes the feature.
+
+        Returns:
+            str: Hex digest used as entry name.
+        """
+        return bytes_digest("\0".join((_KEY_VERSION, swc_digest, feature_flag, engine_digest)).encode())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        """
+        Returns the cached values for `key`, or None if the entry does not exist.
+        """
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return values
+
+    def put(self, key, values):
+        """
+        Stores the values of one feature and evicts old entries if the cache exceeds its size cap.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(values, f)
+        size = os.path.getsize(tmp_path)
+        try:
+            # Overwriting an entry only adds the difference in size
+            size -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".json"):
+                    yield entry
+
+    def size(self):
+        """
+        Returns the total size in bytes of the cache entries.
+        """
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self, target_bytes=None):
+        """
+        Deletes least recently used entries until the cache holds at most `target_bytes`
+        (default: 90% of the size cap).
+        """
+        if target_bytes is None:
+            target_bytes = int(self.max_bytes * 0.9)
+        entries = []
+        for entry in self._entries():
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+    def clear(self):
+        """
+        Deletes every cache entry.
+        """
+        self.evict(target_bytes=0)
@@ -1,53 +1,324 @@
 import argparse
 import os
-import pandas as pd
-
-from morphomeasure.features import features, TAG_LABELS, output_order, summary_logic
-from .lmwrapper import LMeasureWrapper, get_default_lm_exe
+import sys
+
+
+def _report_failures(lm, output_dir, shard=None):
+    """Prints the failed SWC files of the last run to stderr."""
+    if not lm.last_failures:
+        return
+    from .discovery import parse_shard
+    from .manifest import failure_report_name
+
+    report = os.path.join(output_dir, failure_report_name(parse_shard(shard) if shard else None))
+    for failure in lm.last_failures:
+        state = "quarantined, failed in a previous run" if failure["quarantined"] else "failed"
+        message = (failure["message"].splitlines() or [""])[0]
+        print(f"  {failure['swc_file']}: {state}: {failure['error']}: {message}", file=sys.stderr)
+    print(f"{len(lm.last_failures)} SWC files were left out; details in {report}", file=sys.stderr, flush=True)
+
+
+def _duration(seconds):
+    """Formats seconds as h:mm:ss."""
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def _report_plan(stats):
+    """Prints the plan of a dry run (see `LMeasureWrapper.run_batch`)."""
+    pending = stats['swc_files'] - stats['skipped_files']
+    print(f"{pending} SWC files to process ({stats['skipped_files']} skipped).")
+    if stats['lm_invocations']:
+        print(f"Planned L-Measure invocations: {stats['lm_invocations']} "
+              f"({stats['planned_invocations']} feature extractions, {stats['naive_invocations']} without planning).")
+    else:
+        print(f"Planned feature extractions: {stats['planned_invocations']} "
+              f"({stats['naive_invocations']} without planning).")
+    calibration = (f"calibrated on {stats['calibration_samples']} timed neurons" if stats['calibration_samples']
+                   else "uncalibrated, no timings recorded yet")
+    print(f"Estimated wall time: {_duration(stats['estimated_seconds'])} with {stats['jobs']} jobs ({calibration}).")
+
+
+def merge_main(argv):
+    """
+    Entry point of `morphomeasure merge`.
+    Combines the summary rows recorded by the manifests of a sharded run (or of several runs) into the final
+    All_Morphometrics tables, without extracting or summarizing anything again.
+    Command-line Arguments:
+        --output_dir: Directory to write the All_Morphometrics tables to. Required.
+        --inputs: Output directories of the shards to merge. Default: --output_dir.
+        --output_format: 'csv' (default), 'parquet' or 'feather'.
+        --summary_layout: 'wide' (default) or 'long'.
+    Raises:
+        FileNotFoundError: If an input directory holds no manifest.
+        ValueError: If there is nothing to merge or the shards were run with different settings.
+    """
+    parser = argparse.ArgumentParser(prog="morphomeasure merge", description="Merge the shards of a MorphoMeasure run")
+    parser.add_argument('--output_dir', required=True, help='Directory to write the All_Morphometrics tables to')
+    parser.add_argument('--inputs', nargs='+', default=None,
+                        help='Output directories of the shards to merge (default: --output_dir)')
+    parser.add_argument('--output_format', '--output-format', choices=['csv', 'parquet', 'feather'], default='csv',
+                        help='Format of the summary tables (default: csv); parquet and feather require pyarrow')
+    parser.add_argument('--summary_layout', '--summary-layout', choices=['wide', 'long'], default='wide',
+                        help='Layout of the All_Morphometrics tables: wide (default) or long')
+    args = parser.parse_args(argv)
+
+    from .manifest import load_summaries
+    from .output import check_output_format, write_summary_tables
+
+    check_output_format(args.output_format)
+    tags, all_summaries, all_summaries_combined = load_summaries(args.inputs or [args.output_dir])
+    os.makedirs(args.output_dir, exist_ok=True)
+    paths = write_summary_tables(
+        args.output_dir, tags, all_summaries, all_summaries_combined,
+        output_format=args.output_format, layout=args.summary_layout
+    )
+    print(f"Merged {len(all_summaries_combined)} neurons into {len(paths)} summary tables.")
 
 
-def abel(df, path_col, contract_col):
-    """
-    Calculates the mean of the element-wise product of two columns in a DataFrame.
+def _add_engine_arguments(parser):
+    """Adds the options that configure the LMeasureWrapper (see `_wrapper`)."""
+    parser.add_argument(
+        '--lm_exe_path',
+        default=None,
+        help="Path to L-Measure executable (default: bundled with package)"
+    )
+    parser.add_argument('--backend', choices=['lm', 'native', 'worker'], default='lm',
+                        help='Feature backend: lm (L-Measure executable), native (in-process NumPy, no Lm.exe needed) '
+                             'or worker (native backend in one persistent process per job)')
+    parser.add_argument('--cache_dir', default=None,
+                        help='Directory of a persistent feature cache reused across runs (default: no cache)')
+    parser.add_argument('--cache_max_mb', type=float, default=1024,
+                        help='Size cap of the feature cache in MB; least recently used entries are evicted (default: 1024)')
+    parser.add_argument('--per_feature', action='store_true',
+                        help='Run L-Measure once per feature instead of once per group of features sharing the same filters')
+    parser.add_argument('--lm_output', choices=['file', 'stdout'], default='file',
+                        help='Read L-Measure results from an output file (default) or from its standard output')
+    parser.add_argument('--max_concurrency', type=int, default=None,
+                        help='Maximum number of L-Measure processes running at once (default: number of CPUs)')
+    parser.add_argument('--lm_timeout', type=float, default=None,
+                        help='Seconds after which a hung L-Measure process is killed (default: no timeout)')
+    parser.add_argument('--neuron_timeout', type=float, default=None,
+                        help='Seconds after which the extraction of one SWC file is stopped and recorded as failed, '
+                             'for any backend (default: no timeout)')
+    parser.add_argument('--lm_retries', type=int, default=2,
+                        help='Extra attempts for L-Measure runs that time out or fail without output (default: 2)')
+    parser.add_argument('--swc_sidecar', default=None,
+                        help='Native backend: directory of binary (.npz) sidecars of the parsed SWC files and their '
+                             'topology, so that later runs skip parsing (default: none)')
+
+
+def _batch_parser(prog, description):
+    """Returns a parser with the options shared by `morphomeasure` and `morphomeasure watch`."""
+    parser = argparse.ArgumentParser(prog=prog, description=description)
+    parser.add_argument('--tag', nargs='+', required=True, help='Tags to process (e.g., 3.0 4.0 7.0)')
+    parser.add_argument('--features', choices=['all', 'branch', 'combined'], default='all',
+                        help='Which outputs to produce: all, branch, or combined')
+    parser.add_argument('--sholl', action='store_true',
+                        help='Also extract the Sholl analysis features (per-radius intersections in the branch tables, '
+                             'critical radius, maximum intersections and regression coefficient)')
+    parser.add_argument('--swc_dir', required=True,
+                        help='Directory with input SWC files (.swc or .swc.gz), or a zip/tar archive of them')
+    parser.add_argument('--output_dir', required=True, help='Directory to save output features')
+    parser.add_argument('--tmp_dir', default='tmp', help='Temporary directory (default: ./tmp)')
+    _add_engine_arguments(parser)
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of SWC files to process in parallel (default: 1; 0 uses all CPUs)')
+    parser.add_argument('--output_format', '--output-format', choices=['csv', 'parquet', 'feather'], default='csv',
+                        help='Format of the output tables (default: csv); parquet and feather require pyarrow')
+    parser.add_argument('--summary_layout', '--summary-layout', choices=['wide', 'long'], default='wide',
+                        help='Layout of the All_Morphometrics tables: wide (one column per neuron, default) '
+                             'or long (one row per neuron, tag and feature)')
+    parser.add_argument('--sqlite', default=None, metavar='PATH',
+                        help='Also store branch values and summary rows in this SQLite database, indexed by neuron, '
+                             'tag and feature')
+    parser.add_argument('--fail_fast', action='store_true',
+                        help='Stop at the first SWC file that fails instead of recording it in '
+                             'morphomeasure_failures.json and going on')
+    parser.add_argument('--retry_failed', action='store_true',
+                        help='Process SWC files again that failed in a previous run (default: skip them until they change)')
+    parser.add_argument('--no_resume', action='store_true',
+                        help='Process every SWC file again instead of skipping unchanged files completed by a previous run')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time every stage, write a Chrome trace (morphomeasure_trace.json) to the output directory '
+                             'and print the slowest features and neurons')
+    parser.add_argument('--profile_top', type=int, default=10,
+                        help='Number of features and neurons listed by --profile (default: 10)')
+    parser.add_argument('--include', nargs='+', default=['*.swc', '*.swc.gz'],
+                        help="Glob patterns of the SWC files to process, relative to --swc_dir "
+                             "(default: '*.swc' '*.swc.gz')")
+    parser.add_argument('--exclude', nargs='+', default=[],
+                        help='Glob patterns of SWC files to leave out, relative to --swc_dir')
+    parser.add_argument('--no_recursive', action='store_true',
+                        help='Only process SWC files at the top level of --swc_dir instead of searching subdirectories')
+    return parser
+
+
+def _wrapper(args):
+    """Builds the LMeasureWrapper configured by the parsed options."""
+    from .lmwrapper import LMeasureWrapper, get_default_lm_exe
+    from .profiling import Profiler
+
+    if args.backend in ("native", "worker"):
+        lm_exe_path = args.lm_exe_path
+    else:
+        lm_exe_path = args.lm_exe_path or get_default_lm_exe()
+
+        if not os.path.isfile(lm_exe_path):
+            raise FileNotFoundError(
+                f"Lm.exe not found at {lm_exe_path}. "
+                "Please ensure it is included in your install or specify --lm_exe_path."
+            )
+
+    return LMeasureWrapper(
+        lm_exe_path,
+        fused=not args.per_feature,
+        backend=args.backend,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=int(args.cache_max_mb * 1024 * 1024),
+        lm_output=args.lm_output,
+        max_concurrency=args.max_concurrency,
+        lm_timeout=args.lm_timeout,
+        neuron_timeout=args.neuron_timeout,
+        lm_retries=args.lm_retries,
+        profiler=Profiler() if getattr(args, "profile", False) else None,
+        swc_sidecar=args.swc_sidecar
+    )
 
-    Parameters:
-        df (pd.DataFrame): The input DataFrame containing the data.
-        path_col (str): The name of the column representing the 'path' values.
-        contract_col (str): The name of the column representing the 'contract' values.
 
-    Returns:
-        float or None: The mean of the element-wise product of the specified columns,
-                       or None if either column is not present in the DataFrame.
+def watch_main(argv):
     """
-    if path_col in df.columns and contract_col in df.columns:
-        p = pd.to_numeric(df[path_col], errors="coerce")
-        c = pd.to_numeric(df[contract_col], errors="coerce")
-        return (p * c).mean()
-    return None
-
-def bapl(df, col):
+    Entry point of `morphomeasure watch`.
+    Watches --swc_dir and keeps the branch tables and All_Morphometrics tables of its SWC files up to date: new
+    or modified files are extracted once they are fully written, and removed files leave the summary tables
+    (see `morphomeasure.watch`). Runs until interrupted.
+    Command-line Arguments:
+        The options of `morphomeasure` except --shard, plus:
+        --interval: Seconds between two polls of --swc_dir. Default: 2.
+    With --jobs N, N worker processes are kept warm for the whole session. With --profile, the trace and report
+    are written when the session ends.
     """
-    Calculates the mean of a specified column in a DataFrame, coercing non-numeric values to NaN.
+    parser = _batch_parser("morphomeasure watch", "Keep the MorphoMeasure outputs of a directory up to date")
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help='Seconds between two polls of --swc_dir (default: 2)')
+    args = parser.parse_args(argv)
 
-    Parameters:
-        df (pandas.DataFrame): The DataFrame containing the data.
-        col (str): The name of the column to calculate the mean for.
+    from morphomeasure.features import features, sholl_features, summary_logic
+    from .watch import watch
 
-    Returns:
-        float or None: The mean of the column as a float if the column exists, otherwise None.
-    """
-    if col in df.columns:
-        return pd.to_numeric(df[col], errors="coerce").mean()
-    return None
+    lm = _wrapper(args)
+    if not os.path.isdir(args.swc_dir):
+        raise FileNotFoundError(f"Input SWC folder not found: {args.swc_dir}")
 
-def main():
+    def report(stats):
+        print(
+            f"Updated {stats['swc_files']} SWC files: {stats['swc_files'] - stats['skipped_files']} extracted, "
+            f"{stats['skipped_files']} unchanged.", flush=True
+        )
+        _report_failures(lm, args.output_dir)
+
+    print(f"Watching {args.swc_dir} (Ctrl+C to stop).", flush=True)
+    try:
+        watch(
+            lm, args.swc_dir, args.output_dir, args.tag,
+            interval=args.interval,
+            jobs=args.jobs,
+            on_update=report,
+            features_mode=args.features,
+            features_dict={**features, **sholl_features} if args.sholl else features,
+            summary_logic=summary_logic,
+            resume=not args.no_resume,
+            output_format=args.output_format,
+            summary_layout=args.summary_layout,
+            include=args.include,
+            exclude=args.exclude,
+            recursive=not args.no_recursive,
+            store=args.sqlite,
+            fail_fast=args.fail_fast,
+            retry_failed=args.retry_failed,
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.profile:
+            os.makedirs(args.output_dir, exist_ok=True)
+            trace_path = os.path.join(args.output_dir, "morphomeasure_trace.json")
+            lm.profiler.write_chrome_trace(trace_path)
+            print(lm.profiler.report(args.profile_top))
+            print(f"Chrome trace written to {trace_path}")
+
+
+def serve_main(argv):
+    """
+    Entry point of `morphomeasure serve`.
+    Runs a local HTTP extraction service over warm workers until interrupted (see `morphomeasure.server`):
+    POST /extract with an SWC upload or path returns its branch tables and summary rows as JSON or Arrow.
+    Command-line Arguments:
+        --host: Address to bind. Default: 127.0.0.1.
+        --port: Port to bind. Default: 8765.
+        --tag: Tags of requests that do not give any. Default: 3.0 4.0.
+        --swc_root: Directory that path requests are resolved against and must stay in. Default: none, path
+                    requests are refused and only SWC content is accepted.
+        --jobs: Worker processes, each extracting one batch at a time. Default: 1 (0 uses all CPUs).
+        --max_batch: Maximum number of neurons extracted together. Default: 32.
+        --batch_window_ms: Milliseconds a batch waits for more requests. Default: 5.
+        --max_queue: Requests waiting beyond which new ones get 503 (backpressure). Default: 256.
+        --request_timeout: Seconds after which a request gets 504, and a batch still running is stopped
+                           (its worker processes are replaced). Default: 300.
+        The engine options of `morphomeasure` (--backend, --lm_exe_path, --cache_dir, ...).
+    """
+    parser = argparse.ArgumentParser(prog="morphomeasure serve", description="Local HTTP extraction service")
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port to bind (default: 8765)')
+    parser.add_argument('--tag', nargs='+', default=['3.0', '4.0'],
+                        help='Tags of requests that do not give any (default: 3.0 4.0)')
+    parser.add_argument('--swc_root', default=None,
+                        help='Directory that path requests are resolved against and must stay in '
+                             '(default: none, path requests are refused)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Worker processes, each extracting one batch at a time (default: 1; 0 uses all CPUs)')
+    parser.add_argument('--max_batch', type=int, default=32,
+                        help='Maximum number of neurons extracted together (default: 32)')
+    parser.add_argument('--batch_window_ms', type=float, default=5,
+                        help='Milliseconds a batch waits for more requests after its first one (default: 5)')
+    parser.add_argument('--max_queue', type=int, default=256,
+                        help='Waiting requests beyond which new ones are rejected with 503 (default: 256)')
+    parser.add_argument('--request_timeout', type=float, default=300,
+                        help='Seconds after which a request is answered with 504 and a batch still running is '
+                             'stopped (default: 300)')
+    _add_engine_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from .server import ExtractionService, make_server
+
+    service = ExtractionService(
+        _wrapper(args), jobs=args.jobs, max_batch=args.max_batch,
+        batch_window=args.batch_window_ms / 1000, max_queue=args.max_queue, timeout=args.request_timeout,
+    )
+    httpd = make_server(service, args.host, args.port, args.swc_root, args.tag, args.request_timeout)
+    host, port = httpd.server_address[:2]
+    print(f"Serving on http://{host}:{port} (Ctrl+C to stop).", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+
+
+def main(argv=None):
     """
     Entry point for the MorphoMeasure CLI.
     Parses command-line arguments to process SWC files and extract morphometric features using L-Measure.
     Supports multiple tags, feature output modes, and customizable directories for input, output, and temporary files.
+    `morphomeasure merge ...` runs `merge_main` instead, to combine the shards of a sharded run,
+    `morphomeasure watch ...` runs `watch_main`, to keep the outputs of a directory up to date, and
+    `morphomeasure serve ...` runs `serve_main`, a local HTTP extraction service.
     Workflow:
         1. Validates input SWC directory and creates output/tmp directories if needed.
-        2. For each SWC file:
+        2. Runs `LMeasureWrapper.run_batch`, which for each SWC file (optionally in parallel):
             - Extracts features for specified tags using L-Measure.
             - Saves branch-by-branch morphometrics and computes summary statistics.
             - Optionally combines features across tags.
@@ -56,10 +327,48 @@ def main():
     Command-line Arguments:
         --tag: List of tags to process (e.g., 3.0 4.0 7.0). Required.
         --features: Output mode ('all', 'branch', 'combined'). Default: 'all'.
-        --swc_dir: Directory containing input SWC files. Required.
+        --sholl: Also extract the Sholl analysis features (`sholl_features`), computed by the native backend
+                 whatever --backend is. Default: off.
+        --swc_dir: Directory containing input SWC files, or a zip or tar archive (.zip, .tar, .tar.gz, ...) of
+                   them, read without extracting it. Files ending in '.swc.gz' are decompressed in memory. Required.
         --output_dir: Directory to save output features. Required.
         --tmp_dir: Temporary directory for intermediate files. Default: './tmp'.
         --lm_exe_path: Path to L-Measure executable. Default: bundled with package.
+        --backend: 'lm' (L-Measure executable, default), 'native' (in-process NumPy) or 'worker'
+                   (native backend in a persistent worker process).
+        --jobs: Number of worker processes for SWC files. Default: 1 (0 uses all CPUs).
+        --cache_dir: Directory of a persistent feature cache. Default: no cache.
+        --cache_max_mb: Size cap of the feature cache in MB. Default: 1024.
+        --per_feature: Run L-Measure once per feature (slower fallback to the fused default).
+        --lm_output: 'file' (default) or 'stdout'; where results of the L-Measure executable are read from.
+        --max_concurrency: Maximum number of L-Measure processes running at once. Default: number of CPUs.
+        --lm_timeout: Seconds after which a hung L-Measure process is killed. Default: no timeout.
+        --neuron_timeout: Seconds after which the extraction of one SWC file is stopped and the file recorded as
+                          failed, with any backend. Default: no timeout.
+        --lm_retries: Extra attempts for L-Measure runs that time out or fail without output. Default: 2.
+        --output_format: 'csv' (default), 'parquet' or 'feather'. Columnar formats write the branch tables as one
+                         dataset partitioned by tag, with a neuron column, and typed summary tables (requires pyarrow).
+        --summary_layout: 'wide' (default, one column per neuron) or 'long' (neuron, tag, feature, value rows)
+                          for the All_Morphometrics tables.
+        --no_resume: Process every SWC file again instead of skipping the ones completed by a previous
+                     run into the same output directory.
+        --sqlite: SQLite database that also receives the branch values and summary rows, upserted per neuron
+                  (see `morphomeasure.store`). Default: none.
+        --fail_fast: Stop at the first failing SWC file. By default a failing file is recorded in
+                     <output_dir>/morphomeasure_failures.json, left out of the summaries and quarantined
+                     until it changes, and the run goes on.
+        --retry_failed: Process SWC files again that failed in a previous run.
+        --swc_sidecar: Directory of binary sidecars of the parsed SWC files, reused by later runs (native backend).
+        --profile: Time every stage, write a Chrome trace to <output_dir>/morphomeasure_trace.json and print
+                   the time per stage and the slowest features and neurons.
+        --profile_top: Number of features and neurons listed by --profile. Default: 10.
+        --include: Glob patterns of the SWC files to process, relative to --swc_dir. Default: '*.swc' '*.swc.gz'.
+        --exclude: Glob patterns of SWC files to leave out (e.g. 'drafts/*'). Default: none.
+        --no_recursive: Only process SWC files at the top level of --swc_dir.
+        --shard: 'i/N' to process only the SWC files of shard i of N (0-based), e.g. $SLURM_ARRAY_TASK_ID/N.
+                 Shards skip the All_Morphometrics tables; combine them with `morphomeasure merge`.
+        --dry_run: Print the SWC files to process, the planned L-Measure invocations and the estimated wall
+                   time (see `morphomeasure.costmodel`), without processing or writing anything.
     Raises:
         FileNotFoundError: If the input SWC directory does not exist.
     Outputs:
@@ -67,247 +376,70 @@ def main():
         - Summary CSVs for all morphometrics, basal, apical, and glia (as applicable).
         - Cleans up temporary files after processing.
     """
-    parser = argparse.ArgumentParser(description="MorphoMeasure CLI")
-    parser.add_argument('--tag', nargs='+', required=True, help='Tags to process (e.g., 3.0 4.0 7.0)')
-    parser.add_argument('--features', choices=['all', 'branch', 'combined'], default='all',
-                        help='Which outputs to produce: all, branch, or combined')
-    parser.add_argument('--swc_dir', required=True, help='Directory with input SWC files')
-    parser.add_argument('--output_dir', required=True, help='Directory to save output features')
-    parser.add_argument('--tmp_dir', default='tmp', help='Temporary directory (default: ./tmp)')
-    parser.add_argument(
-        '--lm_exe_path',
-        default=None,
-        help="Path to L-Measure executable (default: bundled with package)"
-    )
-
-
-    args = parser.parse_args()
-
-    lm_exe_path = args.lm_exe_path or get_default_lm_exe()
-
-    if not os.path.isfile(lm_exe_path):
-        raise FileNotFoundError(
-            f"Lm.exe not found at {lm_exe_path}. "
-            "Please ensure it is included in your install or specify --lm_exe_path."
-        )
-
+    parser = _batch_parser(None, "MorphoMeasure CLI")
+    parser.add_argument('--shard', default=None,
+                        help="Process only shard i of N ('i/N', 0-based) of the SWC files, for cluster array jobs; "
+                             "combine the shards with `morphomeasure merge`")
+    parser.add_argument('--dry_run', '--dry-run', action='store_true',
+                        help='Print the planned L-Measure invocations and the estimated wall time, without processing '
+                             'or writing anything')
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "merge":
+        return merge_main(argv[1:])
+    if argv and argv[0] == "watch":
+        return watch_main(argv[1:])
+    if argv and argv[0] == "serve":
+        return serve_main(argv[1:])
+    args = parser.parse_args(argv)
+
+    # Imported after parsing so that --help and argument errors do not pay for pandas/NumPy
+    from morphomeasure.features import features, sholl_features, summary_logic
+
+    lm = _wrapper(args)
 
     if not os.path.exists(args.swc_dir):
         raise FileNotFoundError(f"Input SWC folder not found: {args.swc_dir}")
 
-    os.makedirs(args.output_dir, exist_ok=True)
-    os.makedirs(args.tmp_dir, exist_ok=True)
-
-    lm = LMeasureWrapper(lm_exe_path)
-    tags = args.tag
-    features_mode = args.features
-
-    all_summaries_combined = {}
-    all_summaries = {t: {} for t in tags}
-
-    for swc_filename in os.listdir(args.swc_dir):
-        if not swc_filename.endswith(".swc"):
-            continue
-        swc_path = os.path.join(args.swc_dir, swc_filename)
-        swc_base = os.path.splitext(swc_filename)[0]
-        per_tag_dfs = {}
-
-        # Branch-by-branch
-        if features_mode in ['branch', 'combined']:
-            for tag in tags:
-                tag_dir = os.path.join(args.output_dir, TAG_LABELS.get(tag, f"tag_{tag}"))
-                os.makedirs(tag_dir, exist_ok=True)
-                df_tag = lm.extract_features(
-                    swc_file=swc_path,
-                    features_dict=features,
-                    tag=tag
-                )
-
-                if "Branch_pathlength" in df_tag.columns and "Contraction" in df_tag.columns:
-                    df_tag["ABEL"] = pd.to_numeric(df_tag["Branch_pathlength"], errors="coerce") * pd.to_numeric(df_tag["Contraction"], errors="coerce")
-                if "Branch_pathlength_terminal" in df_tag.columns and "Contraction_terminal" in df_tag.columns:
-                    df_tag["ABEL_Terminal"] = pd.to_numeric(df_tag["Branch_pathlength_terminal"], errors="coerce") * pd.to_numeric(df_tag["Contraction_terminal"], errors="coerce")
-                if "Branch_pathlength_internal" in df_tag.columns and "Contraction_internal" in df_tag.columns:
-                    df_tag["ABEL_Internal"] = pd.to_numeric(df_tag["Branch_pathlength_internal"], errors="coerce") * pd.to_numeric(df_tag["Contraction_internal"], errors="coerce")
-
-                if "Branch_pathlength" in df_tag.columns:
-                    df_tag["BAPL"] = pd.to_numeric(df_tag["Branch_pathlength"], errors="coerce")
-                if "Branch_pathlength_terminal" in df_tag.columns:
-                    df_tag["BAPL_Terminal"] = pd.to_numeric(df_tag["Branch_pathlength_terminal"], errors="coerce")
-                if "Branch_pathlength_internal" in df_tag.columns:
-                    df_tag["BAPL_Internal"] = pd.to_numeric(df_tag["Branch_pathlength_internal"], errors="coerce")
-
-                # # Drop raw intermediate columns before saving
-                # cols_to_drop = [
-                #     "Branch_pathlength_terminal", "Contraction_terminal",
-                #     "Branch_pathlength_internal", "Contraction_internal"
-                # ]
-                # df_tag = df_tag.drop(columns=[col for col in cols_to_drop if col in df_tag.columns])
-
-                morpho_outfile = os.path.join(tag_dir, f"Branch_Morphometrics_{swc_base}.csv")
-                # Create a copy for CSV output and drop unwanted columns
-                cols_to_drop = [
-                    "Branch_pathlength_terminal", "Contraction_terminal",
-                    "Branch_pathlength_internal", "Contraction_internal"
-                ]
-                df_out = df_tag.drop(columns=[col for col in cols_to_drop if col in df_tag.columns])
-                df_out.to_csv(morpho_outfile, index=False)
-                per_tag_dfs[tag] = df_tag  # keep full set (with all columns) for summary
-
-                # Summary logic
-                summary = {}
-                for col, (op, out_label) in summary_logic.items():
-                    if col in df_tag.columns:
-                        col_numeric = pd.to_numeric(df_tag[col], errors="coerce")
-                        if op == "sum":
-                            summary[out_label] = col_numeric.sum()
-                        elif op == "mean":
-                            summary[out_label] = col_numeric.mean()
-                        elif op == "max":
-                            summary[out_label] = col_numeric.max()
-                        elif op == "first":
-                            summary[out_label] = col_numeric.iloc[0] if not col_numeric.empty else None
-                if "EucDistance" in df_tag.columns:
-                    summary["Sum_EucDistance"] = pd.to_numeric(df_tag["EucDistance"], errors="coerce").sum()
-                if "PathDistance" in df_tag.columns:
-                    summary["Sum_PathDistance"] = pd.to_numeric(df_tag["PathDistance"], errors="coerce").sum()
-                summary["ABEL"] = abel(df_tag, "Branch_pathlength", "Contraction")
-                summary["ABEL_Terminal"] = abel(df_tag, "Branch_pathlength_terminal", "Contraction_terminal")
-                summary["ABEL_Internal"] = abel(df_tag, "Branch_pathlength_internal", "Contraction_internal")
-                summary["BAPL"] = bapl(df_tag, "Branch_pathlength")
-                summary["BAPL_Terminal"] = bapl(df_tag, "Branch_pathlength_terminal")
-                summary["BAPL_Internal"] = bapl(df_tag, "Branch_pathlength_internal")
-                all_summaries[tag][swc_filename] = summary
-
-        # For All_Morphometrics summary
-        if features_mode in ['all', 'combined']:
-            if features_mode == 'all':
-                for tag in tags:
-                    df_tag = lm.extract_features(
-                        swc_file=swc_path,
-                        features_dict=features,
-                        tag=tag
-                    )
-                    per_tag_dfs[tag] = df_tag
-
-                    summary = {}
-                    for col, (op, out_label) in summary_logic.items():
-                        if col in df_tag.columns:
-                            col_numeric = pd.to_numeric(df_tag[col], errors="coerce")
-                            if op == "sum":
-                                summary[out_label] = col_numeric.sum()
-                            elif op == "mean":
-                                summary[out_label] = col_numeric.mean()
-                            elif op == "max":
-                                summary[out_label] = col_numeric.max()
-                            elif op == "first":
-                                summary[out_label] = col_numeric.iloc[0] if not col_numeric.empty else None
-                    if "EucDistance" in df_tag.columns:
-                        summary["Sum_EucDistance"] = pd.to_numeric(df_tag["EucDistance"], errors="coerce").sum()
-                    if "PathDistance" in df_tag.columns:
-                        summary["Sum_PathDistance"] = pd.to_numeric(df_tag["PathDistance"], errors="coerce").sum()
-                    summary["ABEL"] = abel(df_tag, "Branch_pathlength", "Contraction")
-                    summary["ABEL_Terminal"] = abel(df_tag, "Branch_pathlength_terminal", "Contraction_terminal")
-                    summary["ABEL_Internal"] = abel(df_tag, "Branch_pathlength_internal", "Contraction_internal")
-                    summary["BAPL"] = bapl(df_tag, "Branch_pathlength")
-                    summary["BAPL_Terminal"] = bapl(df_tag, "Branch_pathlength_terminal")
-                    summary["BAPL_Internal"] = bapl(df_tag, "Branch_pathlength_internal")
-                    all_summaries[tag][swc_filename] = summary
-            if per_tag_dfs:
-                df_combined = pd.concat(list(per_tag_dfs.values()), axis=0, ignore_index=True)
-                summary = {}
-                for col, (op, out_label) in summary_logic.items():
-                    if col in df_combined.columns:
-                        col_numeric = pd.to_numeric(df_combined[col], errors="coerce")
-                        if op == "sum":
-                            summary[out_label] = col_numeric.sum()
-                        elif op == "mean":
-                            summary[out_label] = col_numeric.mean()
-                        elif op == "max":
-                            summary[out_label] = col_numeric.max()
-                        elif op == "first":
-                            summary[out_label] = col_numeric.iloc[0] if not col_numeric.empty else None
-                if "EucDistance" in df_combined.columns:
-                    summary["Sum_EucDistance"] = pd.to_numeric(df_combined["EucDistance"], errors="coerce").sum()
-                if "PathDistance" in df_combined.columns:
-                    summary["Sum_PathDistance"] = pd.to_numeric(df_combined["PathDistance"], errors="coerce").sum()
-                summary["ABEL"] = abel(df_combined, "Branch_pathlength", "Contraction")
-                summary["ABEL_Terminal"] = abel(df_combined, "Branch_pathlength_terminal", "Contraction_terminal")
-                summary["ABEL_Internal"] = abel(df_combined, "Branch_pathlength_internal", "Contraction_internal")
-                summary["BAPL"] = bapl(df_combined, "Branch_pathlength")
-                summary["BAPL_Terminal"] = bapl(df_combined, "Branch_pathlength_terminal")
-                summary["BAPL_Internal"] = bapl(df_combined, "Branch_pathlength_internal")
-                all_summaries_combined[swc_filename] = summary
-
-    # Write All_Morphometrics summaries
-    if features_mode in ['all', 'combined'] and all_summaries_combined:
-        neuron_names = sorted(all_summaries_combined.keys())
-        all_features = output_order
-
-        def build_df_out(result_frames, column_name_func):
-            df_out = pd.DataFrame({"Features": all_features})
-            for df, neuron in result_frames:
-                colname = column_name_func(df, neuron)
-                df1 = df.set_index("Features")[df.columns[1]]
-                df_out[colname] = df1.reindex(all_features).values
-            return df_out
-
-        only_glia = (len(tags) == 1 and tags[0] == "7.0")
-        contains_glia = "7.0" in tags
-
-        if set(tags) == {"3.0", "4.0"} and not contains_glia:
-            result_frames_combined = []
-            for neuron in neuron_names:
-                comb = all_summaries_combined[neuron]
-                df = pd.DataFrame({"combined": comb})
-                df.insert(0, "Features", df.index)
-                df.reset_index(drop=True, inplace=True)
-                result_frames_combined.append((df, neuron))
-            df_out_combined = build_df_out(result_frames_combined, lambda df, n: f"{n.replace('.swc','')}_combined")
-            df_out_combined.to_csv(os.path.join(args.output_dir, "All_Morphometrics.csv"), index=False)
-
-            result_frames_basal = []
-            for neuron in neuron_names:
-                tag_label = TAG_LABELS["3.0"]
-                val = all_summaries["3.0"].get(neuron, {})
-                df = pd.DataFrame({tag_label: val})
-                df.insert(0, "Features", df.index)
-                df.reset_index(drop=True, inplace=True)
-                result_frames_basal.append((df, neuron))
-            df_out_basal = build_df_out(result_frames_basal, lambda df, n: f"{n.replace('.swc','')}_basal_dendrites")
-            df_out_basal.to_csv(os.path.join(args.output_dir, "All_Morphometrics_basal.csv"), index=False)
-
-            result_frames_apical = []
-            for neuron in neuron_names:
-                tag_label = TAG_LABELS["4.0"]
-                val = all_summaries["4.0"].get(neuron, {})
-                df = pd.DataFrame({tag_label: val})
-                df.insert(0, "Features", df.index)
-                df.reset_index(drop=True, inplace=True)
-                result_frames_apical.append((df, neuron))
-            df_out_apical = build_df_out(result_frames_apical, lambda df, n: f"{n.replace('.swc','')}_apical_dendrites")
-            df_out_apical.to_csv(os.path.join(args.output_dir, "All_Morphometrics_apical.csv"), index=False)
-
-        else:
-            for tag in tags:
-                tag_label = TAG_LABELS.get(tag, f"tag_{tag}")
-                result_frames = []
-                for neuron in neuron_names:
-                    val = all_summaries[tag].get(neuron, {})
-                    df = pd.DataFrame({tag_label: val})
-                    df.insert(0, "Features", df.index)
-                    df.reset_index(drop=True, inplace=True)
-                    result_frames.append((df, neuron))
-                if tag == "3.0":
-                    outname = "All_Morphometrics_basal.csv"
-                elif tag == "4.0":
-                    outname = "All_Morphometrics_apical.csv"
-                elif tag == "7.0":
-                    outname = "All_Morphometrics_glia.csv"
-                else:
-                    outname = f"All_Morphometrics_{tag_label}.csv"
-                df_out = build_df_out(result_frames, lambda df, n: f"{n.replace('.swc','')}_{tag_label}")
-                df_out.to_csv(os.path.join(args.output_dir, outname), index=False)
+    if not args.dry_run:
+        os.makedirs(args.output_dir, exist_ok=True)
+        os.makedirs(args.tmp_dir, exist_ok=True)
+
+    lm.run_batch(
+        swc_dir=args.swc_dir,
+        output_dir=args.output_dir,
+        tags=args.tag,
+        features_mode=args.features,
+        features_dict={**features, **sholl_features} if args.sholl else features,
+        summary_logic=summary_logic,
+        jobs=args.jobs,
+        resume=not args.no_resume,
+        output_format=args.output_format,
+        summary_layout=args.summary_layout,
+        include=args.include,
+        exclude=args.exclude,
+        recursive=not args.no_recursive,
+        shard=args.shard,
+        store=args.sqlite,
+        fail_fast=args.fail_fast,
+        retry_failed=args.retry_failed,
+        dry_run=args.dry_run,
+    )
+    stats = lm.last_plan_stats
+    if args.dry_run:
+        return _report_plan(stats)
+    print(
+        f"Processed {stats['swc_files'] - stats['skipped_files']} SWC files "
+        f"({stats['skipped_files']} unchanged files skipped) with {stats['planned_invocations']} feature extractions "
+        f"({stats['avoided_invocations']} redundant extractions avoided)."
+    )
+    _report_failures(lm, args.output_dir, args.shard)
+    if args.profile:
+        trace_path = os.path.join(args.output_dir, "morphomeasure_trace.json")
+        lm.profiler.write_chrome_trace(trace_path)
+        print(lm.profiler.report(args.profile_top))
+        print(f"Chrome trace written to {trace_path}")
 
     # Clean up tmp folder
     for fname in os.listdir(args.tmp_dir):
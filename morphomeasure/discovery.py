@@ -0,0 +1,99 @@
+# morphomeasure/discovery.py
+"""
+This module finds the SWC files of a batch and splits them into shards for cluster array jobs.
+Functions:
+    discover_swc(swc_dir, include, exclude, recursive): Lists SWC files, relative to `swc_dir`, in sorted order.
+    swc_stem(swc_file): Relative path of an SWC file without its .swc or .swc.gz extension.
+    parse_shard(text): Parses an "i/N" shard specification.
+    select_shard(swc_files, index, count): Keeps the files assigned to one shard.
+Attributes:
+    SWC_PATTERNS (tuple): Default include patterns: SWC files and gzip-compressed SWC files.
+Notes:
+    - Directories are walked with os.scandir; symbolic links to directories are not followed.
+    - Paths are relative to `swc_dir` and use '/' separators on every platform, so that glob patterns,
+      sorting and shard assignment do not depend on the machine.
+    - Shards are assigned by CRC-32 of the relative path, so each neuron always goes to the same one of N
+      array tasks regardless of which other files are present or of the listing order.
+"""
+
+import fnmatch
+import os
+import zlib
+
+SWC_PATTERNS = ("*.swc", "*.swc.gz")
+
+
+def discover_swc(swc_dir, include=SWC_PATTERNS, exclude=(), recursive=True):
+    """
+    Lists the SWC files of a directory.
+
+    Parameters:
+        swc_dir (str): Directory to search.
+        include (iterable of str): Glob patterns a relative path must match (any of them). Default: '*.swc'
+            and '*.swc.gz'.
+        exclude (iterable of str): Glob patterns of relative paths to leave out, e.g. 'drafts/*'.
+        recursive (bool): Also search subdirectories. Default is True.
+
+    Returns:
+        list of str: Relative paths, with '/' separators, sorted.
+    """
+    include = tuple(include)
+    exclude = tuple(exclude)
+    found = []
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(swc_dir, rel_dir) if rel_dir else swc_dir) as entries:
+            for entry in entries:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(rel_path)
+                elif entry.is_file():
+                    if any(fnmatch.fnmatchcase(rel_path, p) for p in include) and not any(
+                        fnmatch.fnmatchcase(rel_path, p) for p in exclude
+                    ):
+                        found.append(rel_path)
+    return sorted(found)
+
+
+def swc_stem(swc_file):
+    """
+    Returns a relative SWC path without its extension, e.g. 'sub/cell' for 'sub/cell.swc' or 'sub/cell.swc.gz';
+    outputs are named after it.
+    """
+    if swc_file.endswith(".gz"):
+        swc_file = swc_file[:-3]
+    return os.path.splitext(swc_file)[0]
+
+
+def parse_shard(text):
+    """
+    Parses a shard specification.
+
+    Parameters:
+        text (str or tuple): "i/N" with 0 <= i < N, or an (i, N) tuple.
+
+    Returns:
+        tuple: (index, count).
+
+    Raises:
+        ValueError: If the specification is malformed or out of range.
+    """
+    if isinstance(text, str):
+        try:
+            index, count = (int(part) for part in text.split("/"))
+        except ValueError:
+            raise ValueError(f"Invalid shard '{text}', expected 'i/N' (e.g. 0/10)") from None
+    else:
+        index, count = text
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {index}/{count}: the index must be between 0 and N-1")
+    return index, count
+
+
+def select_shard(swc_files, index, count):
+    """
+    Returns the files of `swc_files` (relative paths) assigned to shard `index` of `count`.
+    """
+    return [f for f in swc_files if zlib.crc32(f.encode()) % count == index]
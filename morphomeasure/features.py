@@ -3,9 +3,13 @@
 This module defines feature extraction parameters, tag labels, output order, and summary logic for morphometric analysis.
 Attributes:
     features (dict): Maps feature names to their corresponding extraction command strings, with optional {TAG} placeholders for tag-specific features.
+    sholl_features (dict): Sholl analysis features, in the same format; not part of `features`, they are extracted on request.
     TAG_LABELS (dict): Maps tag values to human-readable labels for different neuronal or glial structures.
     output_order (list): Specifies the order in which features should appear in output summaries or reports.
-    summary_logic (dict): Maps feature names to a tuple specifying the aggregation method (e.g., 'sum', 'mean', 'max', 'first') and the corresponding feature key.
+    sholl_output_order (list): Order of the Sholl summaries, written after `output_order` when they were extracted.
+    summary_logic (dict): Maps feature names to a tuple specifying the aggregation method (e.g., 'sum', 'mean', 'max', 'first';
+                          'min', 'median', 'std', 'count' and percentiles such as 'p90' are also supported, see summary.py)
+                          and the corresponding feature key.
 Usage:
     - Use `features` to retrieve the extraction command for a given feature.
     - Use `TAG_LABELS` to interpret tag values in feature extraction.
@@ -48,6 +52,15 @@ features = {
     "Contraction_internal": "-l1,2,8,{TAG} -l1,3,19,1.0 -f24,0,0,10.0"
 }
 
+# Sholl analysis (computed by morphomeasure.native); the last -f parameter is the radius step in um.
+# Opt-in: use {**features, **sholl_features} to extract them with the default features.
+sholl_features = {
+    "Sholl_Intersections": "-l1,2,8,{TAG} -f100,0,0,10.0",
+    "Sholl_Critical_Radius": "-l1,2,8,{TAG} -f101,0,0,10.0",
+    "Sholl_Max_Intersections": "-l1,2,8,{TAG} -f102,0,0,10.0",
+    "Sholl_Regression": "-l1,2,8,{TAG} -f103,0,0,10.0"
+}
+
 TAG_LABELS = {
     '3.0': 'basal_dendrites',
     '4.0': 'apical_dendrites',
@@ -66,6 +79,11 @@ output_order = [
     "BAPL", "BAPL_Terminal", "BAPL_Internal"
 ]
 
+# Rows appended to the summary tables of runs that extract the Sholl features
+sholl_output_order = [
+    "Sholl_Intersections", "Sholl_Critical_Radius", "Sholl_Max_Intersections", "Sholl_Regression"
+]
+
 # Optional: Export your summary logic as a dictionary (for reuse)
 summary_logic = {
     "Soma_Surface":        ("first",   "Soma_Surface"),
@@ -96,5 +114,9 @@ summary_logic = {
     "Bif_torque_remote":   ("mean",    "Bif_torque_remote"),
     "Helix":               ("mean",    "Helix"),
     "Fractal_Dim":         ("mean",    "Fractal_Dim"),
+    "Sholl_Intersections": ("mean",    "Sholl_Intersections"),
+    "Sholl_Critical_Radius": ("max",   "Sholl_Critical_Radius"),
+    "Sholl_Max_Intersections": ("max", "Sholl_Max_Intersections"),
+    "Sholl_Regression":    ("mean",    "Sholl_Regression"),
 }
 
@@ -1,8 +1,29 @@
+import copy
+import functools
 import os
+import signal
 import subprocess
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
 import pandas as pd
 import tempfile
-from .features import features, TAG_LABELS, output_order, summary_logic
+import time
+import traceback
+from . import native
+from .cache import FeatureCache, bytes_digest, file_digest
+from .costmodel import CostModel, longest_first, makespan, swc_size
+from .features import features, summary_logic
+from .discovery import SWC_PATTERNS, discover_swc, parse_shard, select_shard, swc_stem
+from .manifest import RunManifest, failure_report_name, manifest_name, write_failure_report
+from .output import SUMMARY_LAYOUTS, BranchDatasetWriter, branch_dataset_neurons, branch_output_path, check_output_format
+from .output import write_summary_tables, write_table
+from .planner import ExtractionPlan
+from .profiling import NULL_PROFILER
+from .scheduler import LmScheduler, gather_all
+from .store import ResultStore
+from .sources import SWCBytes, is_archive, iter_archive, scan_archive
+from .summary import summarize
+from .worker import LmWorker
 
 def get_default_lm_exe():
     package_root = os.path.dirname(os.path.abspath(__file__))
@@ -13,7 +34,11 @@ def get_default_lm_exe():
 
     return lm_path
 
-DEFAULT_LM_EXE = get_default_lm_exe()
+def __getattr__(name):
+    # Resolved on first use, so that importing the module does not fail when Lm.exe is missing
+    if name == "DEFAULT_LM_EXE":
+        return get_default_lm_exe()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def abel(df, path_col, contract_col):
     """
@@ -48,104 +73,664 @@ def bapl(df, col):
         return pd.to_numeric(df[col], errors="coerce").mean()
     return None
 
+def feature_frame(feature_arrays):
+    """
+    Builds the per-feature DataFrame returned by `extract_features`.
+
+    Parameters:
+        feature_arrays (dict): Feature name to list of values.
+
+    Returns:
+        pd.DataFrame: One column per feature, with all arrays padded to the same length with None values.
+    """
+    max_len = max((len(arr) for arr in feature_arrays.values()), default=0)
+    padded = {}
+    for key, arr in feature_arrays.items():
+        if len(arr) < max_len:
+            arr = arr + [None] * (max_len - len(arr))
+        padded[key] = arr
+    return pd.DataFrame(padded)
+
+def branch_table(frame):
+    """
+    Builds the branch-by-branch table of one tag from its feature table.
+
+    Parameters:
+        frame (pd.DataFrame): Feature table of the tag, as returned by `extract_features`.
+
+    Returns:
+        pd.DataFrame: The features with the ABEL and BAPL columns (and their terminal and internal variants)
+        added, without the terminal and internal source columns.
+    """
+    df_tag = frame.copy()
+
+    if "Branch_pathlength" in df_tag.columns and "Contraction" in df_tag.columns:
+        df_tag["ABEL"] = pd.to_numeric(df_tag["Branch_pathlength"], errors="coerce") * pd.to_numeric(df_tag["Contraction"], errors="coerce")
+    if "Branch_pathlength_terminal" in df_tag.columns and "Contraction_terminal" in df_tag.columns:
+        df_tag["ABEL_Terminal"] = pd.to_numeric(df_tag["Branch_pathlength_terminal"], errors="coerce") * pd.to_numeric(df_tag["Contraction_terminal"], errors="coerce")
+    if "Branch_pathlength_internal" in df_tag.columns and "Contraction_internal" in df_tag.columns:
+        df_tag["ABEL_Internal"] = pd.to_numeric(df_tag["Branch_pathlength_internal"], errors="coerce") * pd.to_numeric(df_tag["Contraction_internal"], errors="coerce")
+
+    if "Branch_pathlength" in df_tag.columns:
+        df_tag["BAPL"] = pd.to_numeric(df_tag["Branch_pathlength"], errors="coerce")
+    if "Branch_pathlength_terminal" in df_tag.columns:
+        df_tag["BAPL_Terminal"] = pd.to_numeric(df_tag["Branch_pathlength_terminal"], errors="coerce")
+    if "Branch_pathlength_internal" in df_tag.columns:
+        df_tag["BAPL_Internal"] = pd.to_numeric(df_tag["Branch_pathlength_internal"], errors="coerce")
+
+    # Drop the source columns of the terminal and internal variants
+    cols_to_drop = [
+        "Branch_pathlength_terminal", "Contraction_terminal",
+        "Branch_pathlength_internal", "Contraction_internal"
+    ]
+    return df_tag.drop(columns=[col for col in cols_to_drop if col in df_tag.columns])
+
+def split_feature_flag(feature_flag):
+    """
+    Splits a resolved L-Measure feature flag into its specificity and function parts.
+
+    Parameters:
+        feature_flag (str): A flag such as "-l1,2,8,3.0 -l1,2,19,1.0 -f23,0,0,10.0".
+
+    Returns:
+        tuple: (specificity, function) where specificity holds the space-joined '-l' filters
+               and function holds the '-f' token(s).
+    """
+    tokens = feature_flag.split()
+    spec = " ".join(t for t in tokens if not t.startswith("-f"))
+    func = " ".join(t for t in tokens if t.startswith("-f"))
+    return spec, func
+
+def parse_output(text):
+    """
+    Splits raw L-Measure output into blocks of numeric values.
+
+    Every non-numeric line (file name or function header) closes the current block,
+    so a run with several '-f' functions yields one block per function. Only the first
+    comma-separated field of each line is read, and NaN entries are skipped.
+
+    Parameters:
+        text (str): L-Measure output, from stdout or from the file written through '-s'.
+
+    Returns:
+        list of numpy.ndarray: The float64 values of each non-empty block, in output order.
+    """
+    sections = []
+    current = []
+    for line in text.splitlines():
+        field = line.split(",", 1)[0].strip()
+        if not field:
+            continue
+        try:
+            value = float(field)
+        except ValueError:
+            if current:
+                sections.append(np.array(current))
+            current = []
+            continue
+        if value == value:
+            current.append(value)
+    if current:
+        sections.append(np.array(current))
+    return sections
+
+def read_output_sections(out_path):
+    """
+    Reads a raw L-Measure output file and splits it into blocks of numeric values (see `parse_output`).
+
+    Parameters:
+        out_path (str): Path to the output file written through '-s'.
+
+    Returns:
+        list of numpy.ndarray: The float64 values of each non-empty block, in file order.
+    """
+    with open(out_path) as f:
+        return parse_output(f.read())
+
+@functools.lru_cache(maxsize=None)
+def _native_sources():
+    """Source of the native backend, which identifies its results in cache keys."""
+    package_root = os.path.dirname(os.path.abspath(__file__))
+    sources = []
+    for name in ("native.py", "swc.py"):
+        with open(os.path.join(package_root, name), "rb") as f:
+            sources.append(f.read())
+    return b"".join(sources)
+
+def _own_group(initializer=None):
+    """Initializer of `process_pool` workers: starts a process group, then runs `initializer`."""
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    if initializer is not None:
+        initializer()
+
+
+def process_pool(max_workers, initializer=None):
+    """
+    Returns a ProcessPoolExecutor whose workers lead their own process group, so that `run_batch` can stop a
+    neuron together with the processes it started (e.g. a persistent worker). The workers do not receive the
+    terminal's Ctrl+C; `run_batch` kills its pool when it is interrupted.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=_own_group, initargs=(initializer,))
+
+
+def _terminate_pool(executor):
+    """Kills the worker processes of a ProcessPoolExecutor and their children, and shuts it down."""
+    # The executor has no public way to stop a running call
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    for process in processes:
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+        else:
+            try:
+                # Workers of `process_pool` lead a process group with their children
+                os.killpg(process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        process.kill()
+    for process in processes:
+        process.join()
+    executor.shutdown(wait=False)
+
+
+def _map_completed(executor, fn, items, window, timeout=None, restart=None):
+    """
+    Yields (item, fn(*item)) for each tuple of `items` as the calls complete, running them on `executor`.
+    Unlike `executor.map`, the next item is only taken when fewer than `window` calls are in flight, so that
+    items streamed from an archive are not all held in memory, and a long call does not hold back the results
+    (and the submission of more items) behind it.
+
+    With `timeout`, a call that runs for more than `timeout` seconds, counted from when the executor
+    dispatches it, yields a TimeoutError instead of its result: the processes of the executor are killed,
+    `restart()` returns a new executor, and the other calls in flight are submitted to it again.
+    """
+    in_flight = {}
+    started = {}
+    poll = None if timeout is None else min(timeout / 4, 1.0)
+
+    def complete(limit):
+        nonlocal executor
+        while len(in_flight) >= limit:
+            done, _ = wait(in_flight, timeout=poll, return_when=FIRST_COMPLETED)
+            for future in done:
+                started.pop(future, None)
+                yield in_flight.pop(future), future.result()
+            if timeout is None:
+                continue
+            now = time.monotonic()
+            for future in in_flight:
+                if future.running():
+                    started.setdefault(future, now)
+            expired = [future for future, start in started.items() if now - start > timeout]
+            if expired:
+                _terminate_pool(executor)
+                executor = restart()
+                for future in expired:
+                    yield in_flight.pop(future), TimeoutError(f"Neuron did not finish within {timeout:g} s")
+                retried = list(in_flight.values())
+                in_flight.clear()
+                started.clear()
+                for item in retried:
+                    in_flight[executor.submit(fn, *item)] = item
+
+    for item in items:
+        in_flight[executor.submit(fn, *item)] = item
+        yield from complete(window)
+    yield from complete(1)
+
+def _failure(e):
+    """JSON-serializable description of an exception, as recorded in the manifest and failure report."""
+    return {
+        "error": type(e).__name__,
+        "message": str(e),
+        "traceback": "".join(traceback.format_exception(type(e), e, e.__traceback__)),
+    }
+
+def _isolated(process, *args):
+    """Runs `process`, returning the `_failure` of an exception instead of raising it."""
+    try:
+        return process(*args)
+    except Exception as e:
+        return _failure(e)
+
+def _with_spans(process, *args):
+    """Runs `process` in a worker process and returns its result with the spans it recorded."""
+    result = process(*args)
+    return result, process.func.__self__.profiler.drain()
+
+
 class LMeasureWrapper:
-    def __init__(self, lm_exe_path=None):
+    def __init__(self, lm_exe_path=None, fused=True, backend="lm", worker=None, cache_dir=None, cache_max_bytes=1 << 30, lm_output="file",
+                 max_concurrency=None, lm_timeout=None, lm_retries=2, profiler=None, swc_sidecar=None, neuron_timeout=None):
         """
         Initializes the class instance with the path to the Lm.exe executable.
 
         Args:
             lm_exe_path (str, optional): The path to the Lm.exe executable. If not provided,
                 the path is set to the default location relative to the package root.
+            fused (bool, optional): If True (default), features that share the same '-l' filters
+                are computed by a single L-Measure run with several '-f' functions. If False,
+                L-Measure is run once per feature.
+            backend (str, optional): "lm" (default) runs the L-Measure executable; "native" computes
+                the features in-process with NumPy and does not need Lm.exe; "worker" sends every
+                request to a persistent worker process (see `morphomeasure.worker`).
+            worker (LmWorker, optional): Worker used by the "worker" backend. Defaults to a worker
+                running the native backend, started on first use.
+            cache_dir (str, optional): Directory of a persistent feature cache (see `morphomeasure.cache`).
+                Disabled by default.
+            cache_max_bytes (int, optional): Size cap of the cache; least recently used entries are
+                evicted beyond it. Default is 1 GiB.
+            lm_output (str, optional): Where the "lm" backend reads results from. "file" (default) has
+                L-Measure write one output file per run through '-s'; "stdout" reads them from its standard
+                output instead and only falls back to the output file when stdout is empty.
+            max_concurrency (int, optional): Maximum number of L-Measure processes running at once; the runs
+                of one SWC file are launched concurrently (see `morphomeasure.scheduler`). Default: CPU count.
+            lm_timeout (float, optional): Seconds after which an L-Measure process is killed. Default: none.
+            lm_retries (int, optional): Extra attempts for an L-Measure run that timed out, could not be
+                started or failed without output. Default is 2.
+            profiler (Profiler, optional): Records per-stage timings (see `morphomeasure.profiling`).
+                Default: no profiling.
+            swc_sidecar (bool or str, optional): Native backend: keep a binary .npz sidecar of each parsed
+                SWC file and its topology, next to the file (True) or in a directory, so that re-opening it
+                skips parsing (see `morphomeasure.swc.load_swc`). Default: no sidecar.
+            neuron_timeout (float, optional): Seconds after which the extraction of one neuron in `run_batch`
+                is stopped and recorded as failed, for any backend; it also bounds each request to the
+                default worker. Default: none.
 
         Attributes:
-            lm_exe_path (str): The resolved path to the Lm.exe executable.
+            lm_exe_path (str): The resolved path to the Lm.exe executable (None for the native backend
+                when no path is given).
+            fused (bool): Default extraction mode used by `extract_features`.
+            backend (str): The selected backend.
+            worker (LmWorker): The persistent worker of the "worker" backend, None otherwise.
+            cache (FeatureCache): The feature cache, or None when caching is disabled.
+            scheduler (LmScheduler): Runs the L-Measure processes of the "lm" backend.
+            profiler (Profiler or NullProfiler): Profiler of the wrapper's stages.
+            last_plan_stats (dict): Extraction counts of the last `run_batch` call (SWC files, naive,
+                planned and avoided invocations, L-Measure invocations, failed files) and its estimated
+                wall time, or None before the first call.
+            last_failures (list): Failed neurons of the last `run_batch` call, as in its failure report.
         """
+        if backend not in ("lm", "native", "worker"):
+            raise ValueError(f"Unknown backend '{backend}'. Choose 'lm', 'native' or 'worker'.")
+        if lm_output not in ("file", "stdout"):
+            raise ValueError(f"Unknown lm_output '{lm_output}'. Choose 'file' or 'stdout'.")
+        self.lm_output = lm_output
+        self.backend = backend
+        self.fused = fused
+        if backend == "worker" and worker is None:
+            worker = LmWorker(backend="native", timeout=neuron_timeout)
+        self.worker = worker
+
         if lm_exe_path is None:
-            self.lm_exe_path = get_default_lm_exe()
+            self.lm_exe_path = get_default_lm_exe() if backend == "lm" else None
         else:
             self.lm_exe_path = os.path.normpath(lm_exe_path)
 
-        if not os.path.isfile(self.lm_exe_path):
+        if backend == "lm" and not os.path.isfile(self.lm_exe_path):
             raise FileNotFoundError(f"Lm.exe not found at: {self.lm_exe_path}")
 
-    def extract_features(self, swc_file, features_dict, tag):
+        self.cache = FeatureCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.profiler = profiler or NULL_PROFILER
+        self.swc_sidecar = swc_sidecar
+        self.neuron_timeout = neuron_timeout
+        self.scheduler = LmScheduler(max_concurrency, lm_timeout, lm_retries, profiler=self.profiler)
+        self._engine_digest = None
+        self.last_plan_stats = None
+        self.last_failures = []
+
+    async def _run_lm(self, workdir, flags, label, swc_file, out_path=None):
+        """
+        Runs L-Measure on one parameter set and returns the blocks of numeric values it produced.
+
+        `flags` is written to a Lmin*.txt file of its own in `workdir`, so that concurrent runs do not
+        share it. With `out_path`, L-Measure writes its results to that file through '-s'; without it,
+        they are read from its standard output. Returns None when L-Measure wrote no output file, or
+        nothing at all to stdout.
+        """
+        fd, lmin_path = tempfile.mkstemp(prefix="Lmin", suffix=".txt", dir=workdir)
+        output = f"-s{out_path} -R" if out_path else "-R"
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{flags}\n{output}\n{swc_file}\n")
+
+        def succeeded(result):
+            return result.returncode == 0 or (out_path is not None and os.path.exists(out_path))
+
+        try:
+            result = await self.scheduler.run(
+                [self.lm_exe_path, lmin_path], cwd=os.path.dirname(self.lm_exe_path), accept=succeeded, label=label
+            )
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(
+                f"L-Measure timed out after {self.scheduler.timeout}s for feature '{label}' on file '{swc_file}'."
+            ) from None
+
+        if not succeeded(result):
+            raise RuntimeError(
+                f"L-Measure failed for feature '{label}' on file '{swc_file}'.\n"
+                f"Executable: {self.lm_exe_path}\n"
+                f"STDOUT:\n{result.stdout}\n"
+                f"STDERR:\n{result.stderr}"
+            )
+        with self.profiler.span(label, "parse"):
+            if out_path is None:
+                # A file name or function header without values is an empty result, not a missing one
+                return parse_output(result.stdout) if result.stdout.strip() else None
+            if not os.path.exists(out_path):
+                return None
+            return read_output_sections(out_path)
+
+    async def _lm_sections(self, workdir, flags, label, swc_file, out_name):
+        """
+        Runs L-Measure, reading its results from stdout when `lm_output` is "stdout" and from the
+        output file `out_name` in `workdir` otherwise, or when stdout is empty.
+        """
+        if self.lm_output == "stdout":
+            sections = await self._run_lm(workdir, flags, label, swc_file)
+            if sections is not None:
+                return sections
+        return await self._run_lm(workdir, flags, label, swc_file, os.path.join(workdir, out_name))
+
+    async def _extract_single(self, workdir, swc_file, feature_name, feature_flag):
+        """
+        Runs L-Measure for one feature and returns its values as a list.
+        """
+        sections = await self._lm_sections(workdir, feature_flag, feature_name, swc_file, f'{feature_name}.csv')
+        if sections is None:
+            return [None]
+        return np.concatenate(sections).tolist() if sections else []
+
+    async def _extract_group(self, workdir, swc_file, spec, group):
+        """
+        Runs L-Measure once for a group of features sharing the same specificity.
+
+        Parameters
+        ----------
+        workdir : str
+            Scratch directory for Lmin.txt and the output file.
+        swc_file : str
+            Path to the SWC file.
+        spec : str
+            The '-l' filters shared by every feature of the group.
+        group : list of tuple
+            (feature_name, function) pairs, where function is the '-f' part of the flag.
+
+        Returns
+        -------
+        dict
+            Feature name to list of values. Falls back to one run per feature when the
+            output cannot be split into exactly one block per function.
+        """
+        if len(group) == 1:
+            feature_name, func = group[0]
+            return {feature_name: await self._extract_single(workdir, swc_file, feature_name, f"{spec} {func}".strip())}
+
+        label = ", ".join(name for name, _ in group)
+        functions = " ".join(func for _, func in group)
+        sections = await self._lm_sections(
+            workdir, f"{spec} {functions}".strip(), label, swc_file, f'{group[0][0]}_fused.csv'
+        )
+        if sections is not None and not sections:
+            # Output without any value, e.g. for a tag the neuron does not have: every feature is empty
+            return {name: [] for name, _ in group}
+        if sections is not None and len(sections) == len(group):
+            return {name: values.tolist() for (name, _), values in zip(group, sections)}
+
+        # Output layout is ambiguous (e.g. a function returned no values): redo each feature alone
+        values = await gather_all(*(
+            self._extract_single(workdir, swc_file, name, f"{spec} {func}".strip()) for name, func in group
+        ))
+        return {name: v for (name, _), v in zip(group, values)}
+
+    @property
+    def engine_digest(self):
+        """
+        Digest identifying the engine that computes the features, used in cache keys:
+        the Lm.exe bytes for the "lm" backend, the native backend's source otherwise.
+        """
+        if self._engine_digest is None:
+            if self.backend == "lm":
+                self._engine_digest = file_digest(self.lm_exe_path)
+            else:
+                sources = _native_sources()
+                if self.backend == "worker":
+                    sources += " ".join(self.worker.command).encode()
+                self._engine_digest = bytes_digest(sources)
+        return self._engine_digest
+
+    def _flag_digest(self, feature_flag):
+        """
+        Engine digest of one feature: features that only the native backend computes (Sholl analysis)
+        are keyed by its source even when the "lm" backend is selected.
+        """
+        if self.backend == "lm" and native.is_native_only(feature_flag):
+            return bytes_digest(_native_sources())
+        return self.engine_digest
+
+    def lm_invocations(self, flags):
+        """
+        Returns the number of L-Measure processes one SWC file needs for the resolved `flags` when nothing is
+        cached: one per unique '-l' filter set when fused, one per flag otherwise, and none for the native
+        and worker backends or for features that only the native backend computes.
+        """
+        if self.backend != "lm":
+            return 0
+        lm_flags = [flag for flag in flags if not native.is_native_only(flag)]
+        if self.fused:
+            return len({split_feature_flag(flag)[0] for flag in lm_flags})
+        return len(lm_flags)
+
+    def _compute_arrays(self, swc_file, resolved, fused):
+        """
+        Computes features with the selected backend.
+
+        Parameters
+        ----------
+        swc_file : str or SWCBytes
+            Path to the SWC file, or its content (see `morphomeasure.sources`).
+        resolved : dict
+            Feature name to L-Measure flag, with '{TAG}' already substituted.
+        fused : bool
+            Whether the "lm" backend fuses features that share the same filters.
+
+        Returns
+        -------
+        dict
+            Feature name to list of values, in the order of `resolved` and not padded.
+        """
+        if isinstance(swc_file, SWCBytes):
+            if self.backend == "native":
+                # Parsed from memory; the L-Measure executable and the worker read a temporary file
+                with self.profiler.span("parse_swc", "parse"):
+                    tree = swc_file.tree()
+                return native.extract_arrays(tree, resolved, self.profiler)
+            with swc_file.as_file() as swc_path:
+                return self._compute_arrays(swc_path, resolved, fused)
+        if self.backend == "native":
+            return native.extract_arrays(swc_file, resolved, self.profiler, self.swc_sidecar)
+        if self.backend == "worker":
+            return self.worker.extract(swc_file, resolved, "")
+
+        # L-Measure has no Sholl analysis: those features are computed natively
+        native_only = {name: flag for name, flag in resolved.items() if native.is_native_only(flag)}
+        feature_arrays = {}
+        if native_only:
+            feature_arrays = native.extract_arrays(swc_file, native_only, self.profiler, self.swc_sidecar)
+        lm_flags = {name: flag for name, flag in resolved.items() if name not in native_only}
+        if lm_flags:
+            with tempfile.TemporaryDirectory() as workdir:
+                feature_arrays.update(self.scheduler.execute(self._compute_lm(workdir, swc_file, lm_flags, fused)))
+        return {name: feature_arrays[name] for name in resolved}
+
+    async def _compute_lm(self, workdir, swc_file, resolved, fused):
+        """
+        Runs every L-Measure process of one extraction concurrently, under the scheduler's limit.
+        """
+        if fused:
+            groups = {}
+            for feature_name, feature_flag in resolved.items():
+                spec, func = split_feature_flag(feature_flag)
+                groups.setdefault(spec, []).append((feature_name, func))
+            feature_arrays = {}
+            for group_arrays in await gather_all(*(
+                self._extract_group(workdir, swc_file, spec, group) for spec, group in groups.items()
+            )):
+                feature_arrays.update(group_arrays)
+            # Keep the column order of features_dict
+            return {name: feature_arrays[name] for name in resolved}
+        values = await gather_all(*(
+            self._extract_single(workdir, swc_file, name, flag) for name, flag in resolved.items()
+        ))
+        return dict(zip(resolved, values))
+
+    def _extract_arrays(self, swc_file, features_dict, tag, fused=None, tags=None):
+        """
+        Returns the unpadded values of every feature, serving them from the cache when possible. `tags`
+        names the tags of flags that are already resolved (see `ExtractionPlan.jobs`), for the profile.
+        """
+        if fused is None:
+            fused = self.fused
+        if isinstance(swc_file, str) and swc_file.endswith(".gz"):
+            swc_file = SWCBytes.from_path(swc_file)
+        resolved = {name: flag.replace('{TAG}', tag) for name, flag in features_dict.items()}
+        name = swc_file.name if isinstance(swc_file, SWCBytes) else os.path.basename(swc_file)
+        with self.profiler.span(name, "extract", tag=",".join(tags) if tags is not None else tag):
+            if self.cache is None:
+                return self._compute_arrays(swc_file, resolved, fused)
+            return self._cached_arrays(swc_file, resolved, fused)
+
+    def _cached_arrays(self, swc_file, resolved, fused):
+        """
+        Serves the features of `resolved` found in the cache and computes and stores the others.
+        """
+        swc_digest = swc_file.digest if isinstance(swc_file, SWCBytes) else file_digest(swc_file)
+        keys = {name: self.cache.key(swc_digest, flag, self._flag_digest(flag)) for name, flag in resolved.items()}
+        feature_arrays = {}
+        for name, key in keys.items():
+            values = self.cache.get(key)
+            if values is not None:
+                feature_arrays[name] = values
+        missing = {name: flag for name, flag in resolved.items() if name not in feature_arrays}
+        if missing:
+            computed = self._compute_arrays(swc_file, missing, fused)
+            for name, values in computed.items():
+                self.cache.put(keys[name], values)
+            feature_arrays.update(computed)
+        return {name: feature_arrays[name] for name in resolved}
+
+    def extract_features(self, swc_file, features_dict, tag, fused=None):
         """
         Extracts features from a SWC file using external LM executable and returns them as a pandas DataFrame.
 
         For each feature specified in `features_dict`, this method:
         - Generates a temporary parameter file for the LM executable.
-        - Runs the LM executable to compute the feature and saves the output to a CSV file.
-        - Reads the feature values from the output CSV, filtering out non-numeric entries.
+        - Runs the LM executable to compute the feature, with the output written to a file or,
+          with `lm_output="stdout"`, read from its standard output.
+        - Parses the numeric entries of the output into float64 values, skipping non-numeric lines.
         - Pads all feature arrays to the same length with None values.
         - Returns a DataFrame where each column corresponds to a feature.
 
+        When the wrapper has a cache, features already computed for an SWC file with the same
+        content are read from it and only the missing ones are computed.
+
+        In fused mode, features whose flags share the same '-l' filters are computed by one
+        L-Measure run with several '-f' functions, and the output is split back per feature.
+        With the default features this is 4 runs per tag instead of 32. The runs are launched
+        concurrently, up to the wrapper's `max_concurrency`, so the latency of one SWC file is
+        close to that of its slowest run.
+
+        With the native backend, the SWC file is loaded once and every feature is computed
+        in-process by `morphomeasure.native`; the returned columns are the same.
+
         Parameters
         ----------
-        swc_file : str
-            Path to the SWC file containing neuron morphology data.
+        swc_file : str or SWCBytes
+            Path to the SWC file containing neuron morphology data, which may be gzip-compressed
+            ('.swc.gz'), or an SWC file held in memory (see `morphomeasure.sources`).
         features_dict : dict
             Dictionary mapping feature names to LM parameter flags. The flag may contain '{TAG}' to be replaced by `tag`.
         tag : str
             Tag to substitute in feature flags.
+        fused : bool, optional
+            Overrides the wrapper's `fused` setting for this call. Use False to run one
+            L-Measure process per feature, e.g. to compare results against fused mode.
 
         Returns
         -------
         pandas.DataFrame
             DataFrame containing extracted features, with each column representing a feature and rows padded to equal length.
         """
-        feature_arrays = {}
-        max_len = 0
-        with tempfile.TemporaryDirectory() as workdir:
-            for feature_name, feature_flag in features_dict.items():
-                feature_flag = feature_flag.replace('{TAG}', tag)
-                lmin_path = os.path.join(workdir, 'Lmin.txt')
-                out_path = os.path.join(workdir, f'{feature_name}.csv')
-                param = f"{feature_flag}\n-s{out_path} -R\n{swc_file}\n"
-                with open(lmin_path, "w") as f:
-                    f.write(param)
-                result = subprocess.run(
-                    [self.lm_exe_path, lmin_path],
-                    capture_output=True,
-                    text=True,
-                    cwd=os.path.dirname(self.lm_exe_path)
-                )
+        return feature_frame(self._extract_arrays(swc_file, features_dict, tag, fused))
+
+    def _process_swc(self, swc_path, swc_file, output_dir, tags, features_mode_set, summary_logic, plan, output_format="csv", keep_branches=False):
+        """
+        Extracts, writes and summarizes the morphometrics of one SWC file.
+
+        This is the per-neuron unit of work of `run_batch`; it only depends on its arguments
+        so that it can run in a worker process. Every unique resolved flag of `plan` is
+        extracted once, and the branch tables, per-tag summaries and combined summary are all
+        built from that shared result set. `swc_file` is the path of the SWC file relative to
+        the batch's input directory (or archive), used to name the outputs; `swc_path` is its
+        path, or its content as `sources.SWCBytes` for archive members. Branch tables are written here
+        in CSV only; in the columnar formats they are returned (`keep_branches`) for `run_batch` to
+        write into the dataset.
+
+        Returns
+        -------
+        tuple
+            (tag_summaries, combined_summary, branch_tables, seconds): a dict mapping each processed
+            tag to its summary, the summary across all tags (None if no summary was requested), with
+            `keep_branches` the branch table of each tag (None otherwise), e.g. for a `ResultStore`,
+            and the wall time it took, which calibrates the batch cost model (see `morphomeasure.costmodel`).
+        """
+        start = time.perf_counter()
+        with self.profiler.span(swc_file, "neuron"):
+            tag_summaries = {}
+            combined_summary = None
+            branch_tables = {}
+            swc_base = swc_stem(swc_file)
+
+            # Extract every unique resolved flag once, then rebuild each tag's table from the shared results
+            tag_frames = {}
+            if plan.passes:
+                job_arrays = self._extract_arrays(swc_path, plan.jobs, tag="", tags=tags)
+                tag_frames = {tag: feature_frame(plan.tag_arrays(job_arrays, tag)) for tag in tags}
+
+            # Branch-by-branch morphometrics
+            if output_format == "csv" and ('branch' in features_mode_set or 'combined' in features_mode_set):
+                for tag in tags:
+                    morpho_outfile = os.path.join(output_dir, branch_output_path(tag, swc_base, output_format))
+                    df_out = branch_tables[tag] = branch_table(tag_frames[tag])
+                    with self.profiler.span("Branch_Morphometrics", "write", neuron=swc_file, tag=tag):
+                        write_table(df_out, morpho_outfile, output_format)
+            if keep_branches:
+                for tag in tag_frames:
+                    if tag not in branch_tables:
+                        branch_tables[tag] = branch_table(tag_frames[tag])
 
-                if result.returncode != 0 and not os.path.exists(out_path):
-                    raise RuntimeError(
-                        f"L-Measure failed for feature '{feature_name}' on file '{swc_file}'.\n"
-                        f"Executable: {self.lm_exe_path}\n"
-                        f"STDOUT:\n{result.stdout}\n"
-                        f"STDERR:\n{result.stderr}"
+            # Per-tag summaries, and the combined summary across tags for 'all'/'combined', in one grouped reduction
+            if tag_frames:
+                with self.profiler.span(swc_file, "summarize"):
+                    summaries, combined = summarize(
+                        [(swc_file, tag, tag_frames[tag]) for tag in tags],
+                        summary_logic,
+                        combined=bool(features_mode_set & {'all', 'combined'}),
                     )
+                tag_summaries = {tag: summaries[(swc_file, tag)] for tag in tags}
+                if combined is not None:
+                    combined_summary = combined[swc_file]
+
+        seconds = time.perf_counter() - start
+        return tag_summaries, combined_summary, branch_tables if keep_branches else None, seconds
 
-                if os.path.exists(out_path):
-                    try:
-                        df = pd.read_csv(out_path, header=None)
-                        arr = df[pd.to_numeric(df[0], errors="coerce").notna()][0].tolist()
-                    except Exception as e:
-                        raise RuntimeError(
-                            f"Failed reading output CSV for feature '{feature_name}' from '{out_path}': {e}"
-                        )
-                else:
-                    arr = [None]
-                feature_arrays[feature_name] = arr
-                if len(arr) > max_len:
-                    max_len = len(arr)
-        # Pad all arrays to the same length
-        for key in feature_arrays:
-            arr = feature_arrays[key]
-            if len(arr) < max_len:
-                arr = arr + [None] * (max_len - len(arr))
-            feature_arrays[key] = arr
-        return pd.DataFrame(feature_arrays)
-
-    def run_batch(self, swc_dir, output_dir, tags, features_mode=('all',), features_dict=features, summary_logic=summary_logic):
+    def run_batch(self, swc_dir, output_dir, tags, features_mode=('all',), features_dict=features, summary_logic=summary_logic, jobs=1, resume=True, output_format="csv", summary_layout="wide", include=SWC_PATTERNS, exclude=(), recursive=True, shard=None, swc_files=None, digests=None, executor=None, store=None, fail_fast=False, retry_failed=False, dry_run=False):
         """
         Processes a batch of SWC files to extract morphometric features and generate summary statistics.
         Parameters
         ----------
         swc_dir : str
-            Directory containing SWC files to process.
+            Directory containing SWC files to process, or a zip or tar archive of them (see
+            `morphomeasure.sources`). Archive members are streamed rather than extracted.
         output_dir : str
             Directory where output CSV files will be saved.
         tags : list or tuple of str
@@ -160,6 +745,57 @@ class LMeasureWrapper:
             Dictionary specifying summary operations for each feature column.
             Format: {column_name: (operation, output_label)}.
             Default is the global 'summary_logic'.
+        jobs : int, optional
+            Number of worker processes used to process SWC files in parallel. Default is 1 (serial).
+            Values below 1 use one worker per CPU. Results are merged in the same order as a
+            serial run, so the output files are identical.
+        resume : bool, optional
+            Skip SWC files already completed by a previous run into the same `output_dir` with the
+            same content and settings, as recorded in its run manifest. Default is True. Use False
+            to process every file again.
+        output_format : str, optional
+            'csv' (default), 'parquet' or 'feather'. In the columnar formats the branch tables are
+            written as one dataset partitioned by tag under `Branch_Morphometrics/`, with one file per
+            tag (per shard) and the neuron as a column, and the summaries as typed tables (see
+            `morphomeasure.output`). Requires pyarrow.
+        summary_layout : str, optional
+            'wide' (default): one row per feature and one column per neuron. 'long': one row per
+            (neuron, tag, feature) with a 'value' column, for batches too large to pivot.
+        include, exclude : iterable of str, optional
+            Glob patterns, matched against paths relative to `swc_dir`, of the SWC files to process
+            and to leave out. Default: every '*.swc' and '*.swc.gz' file.
+        recursive : bool, optional
+            Also process SWC files in subdirectories of `swc_dir`. Default is True. Their outputs
+            are named after their relative path (see `morphomeasure.output.branch_output_path`).
+        shard : str or tuple, optional
+            "i/N" or (i, N): only process the SWC files assigned to shard i of N (0 <= i < N), for
+            cluster array jobs. Each shard records its summary rows in its own manifest and does not
+            write the All_Morphometrics tables; combine the shards with `morphomeasure merge`.
+        swc_files : list of str, optional
+            Paths, relative to `swc_dir`, of the SWC files to process instead of discovering them with
+            `include`, `exclude` and `recursive`. Not supported for archives.
+        digests : dict, optional
+            Known content digests (`cache.file_digest`) of SWC files by relative path, e.g. tracked by
+            `morphomeasure.watch`; the other files are hashed.
+        executor : concurrent.futures.Executor, optional
+            Process pool to run the SWC files on, kept by the caller across calls (warm workers) and not
+            shut down; `jobs` should be its number of workers. Create it with `process_pool`, so that
+            a `neuron_timeout` also stops the processes a neuron started. Default: a pool created for
+            this call when `jobs` > 1.
+        store : str or ResultStore, optional
+            SQLite database (path, or an open `morphomeasure.store.ResultStore`) that also receives the
+            branch values and summary rows of every neuron, upserted in batched transactions. Neurons
+            whose stored rows are out of date are processed again; neurons of removed SWC files are
+            deleted from it (except in sharded runs).
+        fail_fast : bool, optional
+            Raise the first error instead of isolating it. Default is False: a neuron whose extraction
+            fails is recorded as failed and left out of the summaries, and the run goes on.
+        retry_failed : bool, optional
+            Process neurons again that failed in an earlier run with the same content and settings.
+            Default is False: they are quarantined until their SWC file or the settings change.
+        dry_run : bool, optional
+            Only plan the run: list the SWC files, estimate their cost and fill `self.last_plan_stats`,
+            without processing them or writing anything. Default is False.
         Returns
         -------
         None
@@ -171,7 +807,24 @@ class LMeasureWrapper:
         - Combined summary CSV if both basal and apical tags are present.
         Notes
         -----
-        - Uses helper functions `abel` and `bapl` for specific morphometric calculations.
+        - Each unique (SWC file, resolved flag) pair is extracted once and shared by the branch tables,
+          per-tag summaries and combined summary (see `morphomeasure.planner`). The counts of the
+          last run are stored in `self.last_plan_stats`, with the L-Measure processes it needs when
+          nothing is cached ('lm_invocations') and its estimated wall time ('estimated_seconds').
+        - The time of each neuron is estimated from its node count and file size, calibrated on the
+          timings recorded in the manifest by earlier runs (see `morphomeasure.costmodel`). Parallel
+          runs dispatch the SWC files of a directory longest first; archive members are streamed in
+          archive order.
+        - Every completed neuron is appended to a manifest in `output_dir` (see `morphomeasure.manifest`)
+          together with its summary rows, so an interrupted run can be resumed, and the summary CSVs are
+          rebuilt from the stored rows of all current SWC files.
+        - Failed and quarantined neurons are listed in morphomeasure_failures.json in `output_dir`
+          (one per shard for sharded runs), with their error and traceback, and in `self.last_failures`.
+          L-Measure runs are bounded by the wrapper's `lm_timeout` and retried `lm_retries` times, and
+          whole neurons by its `neuron_timeout`: a neuron that runs longer fails with a TimeoutError. Its
+          process is stopped by killing the pool, which is replaced, so a caller's `executor` can no
+          longer be used after a timeout ('timed_out_files' in `self.last_plan_stats`).
+        - Summaries, including ABEL and BAPL, are computed by `morphomeasure.summary.summarize`.
         - Handles flexible feature selection and output organization based on tags and modes.
         - Output file naming follows conventions based on tags and neuron names.
         """
@@ -180,207 +833,233 @@ class LMeasureWrapper:
             features_mode_set = {features_mode}
         else:
             features_mode_set = set(features_mode)
+        check_output_format(output_format)
+        if summary_layout not in SUMMARY_LAYOUTS:
+            raise ValueError(f"Unknown summary layout '{summary_layout}', expected one of {', '.join(SUMMARY_LAYOUTS)}")
 
-        os.makedirs(output_dir, exist_ok=True)
+        if not dry_run:
+            os.makedirs(output_dir, exist_ok=True)
         all_summaries_combined = {}
         all_summaries = {t: {} for t in tags}
 
-        for swc_file in os.listdir(swc_dir):
-            if not swc_file.endswith('.swc'):
+        archive = is_archive(swc_dir)
+        sizes = {}
+        if archive:
+            if swc_files is not None:
+                raise ValueError("swc_files cannot be given for an archive")
+            # One streaming pass lists and hashes the members; a second one reads the pending ones
+            digests = scan_archive(swc_dir, include, exclude, recursive, sizes)
+            swc_files = list(digests)
+        elif swc_files is None:
+            swc_files = discover_swc(swc_dir, include, exclude, recursive)
+        if shard is not None:
+            shard = parse_shard(shard)
+            swc_files = select_shard(swc_files, *shard)
+        plan = ExtractionPlan(features_dict, tags, features_mode_set)
+        manifest = RunManifest(
+            output_dir,
+            {
+                "tags": list(tags),
+                "features_mode": sorted(features_mode_set),
+                "features": features_dict,
+                "summary_logic": summary_logic,
+                "engine": self.engine_digest,
+                "output_format": output_format,
+            },
+            reset=not resume,
+            name=manifest_name(shard),
+            read_only=dry_run,
+        )
+
+        own_store = isinstance(store, str)
+        if own_store:
+            # A dry run does not create the database; a missing one holds no current neuron
+            store = ResultStore(":memory:" if dry_run and not os.path.exists(store) else store)
+
+        # Branch tables in the columnar formats go to one dataset file per tag, written by this process
+        dataset_branches = output_format != "csv" and bool(features_mode_set & {'branch', 'combined'})
+        # Neurons recorded by a run that stopped before its dataset files were replaced have no rows in them
+        dataset_neurons = branch_dataset_neurons(output_dir, tags, output_format, shard) if dataset_branches else set()
+
+        # Reuse the stored rows of neurons completed with the same content and settings
+        results = {}
+        failures = []
+        digests = dict(digests or {})
+        pending_files = []
+        for swc_file in swc_files:
+            if swc_file not in digests:
+                digests[swc_file] = file_digest(os.path.join(swc_dir, *swc_file.split("/")))
+            record = manifest.completed(swc_file, digests[swc_file])
+            if record is not None and store is not None and not store.current(swc_file, digests[swc_file], manifest.config_digest):
+                record = None
+            if record is not None and dataset_branches and swc_stem(swc_file) not in dataset_neurons:
+                record = None
+            if record is not None:
+                results[swc_file] = (record["tag_summaries"], record["combined_summary"])
                 continue
-            swc_path = os.path.join(swc_dir, swc_file)
-            swc_base = os.path.splitext(swc_file)[0]
-            per_tag_dfs = {}
+            failed = None if retry_failed else manifest.failed(swc_file, digests[swc_file])
+            if failed is not None:
+                failures.append({"swc_file": swc_file, "digest": failed["digest"], **failed["error"], "quarantined": True})
+            else:
+                pending_files.append(swc_file)
 
-            # Branch-by-branch morphometrics
-            if 'branch' in features_mode_set or 'combined' in features_mode_set:
-                for tag in tags:
-                    tag_dir = os.path.join(output_dir, TAG_LABELS.get(tag, f"tag_{tag}"))
-                    os.makedirs(tag_dir, exist_ok=True)
-                    df_tag = self.extract_features(swc_file=swc_path, features_dict=features_dict, tag=tag)
-
-                    if "Branch_pathlength" in df_tag.columns and "Contraction" in df_tag.columns:
-                        df_tag["ABEL"] = pd.to_numeric(df_tag["Branch_pathlength"], errors="coerce") * pd.to_numeric(df_tag["Contraction"], errors="coerce")
-                    if "Branch_pathlength_terminal" in df_tag.columns and "Contraction_terminal" in df_tag.columns:
-                        df_tag["ABEL_Terminal"] = pd.to_numeric(df_tag["Branch_pathlength_terminal"], errors="coerce") * pd.to_numeric(df_tag["Contraction_terminal"], errors="coerce")
-                    if "Branch_pathlength_internal" in df_tag.columns and "Contraction_internal" in df_tag.columns:
-                        df_tag["ABEL_Internal"] = pd.to_numeric(df_tag["Branch_pathlength_internal"], errors="coerce") * pd.to_numeric(df_tag["Contraction_internal"], errors="coerce")
-
-                    if "Branch_pathlength" in df_tag.columns:
-                        df_tag["BAPL"] = pd.to_numeric(df_tag["Branch_pathlength"], errors="coerce")
-                    if "Branch_pathlength_terminal" in df_tag.columns:
-                        df_tag["BAPL_Terminal"] = pd.to_numeric(df_tag["Branch_pathlength_terminal"], errors="coerce")
-                    if "Branch_pathlength_internal" in df_tag.columns:
-                        df_tag["BAPL_Internal"] = pd.to_numeric(df_tag["Branch_pathlength_internal"], errors="coerce")
-
-                    # Drop raw intermediate columns before saving
-                    # cols_to_drop = [
-                    #     "Branch_pathlength_terminal", "Contraction_terminal",
-                    #     "Branch_pathlength_internal", "Contraction_internal"
-                    # ]
-                    # df_tag = df_tag.drop(columns=[col for col in cols_to_drop if col in df_tag.columns])
-
-                    morpho_outfile = os.path.join(tag_dir, f"Branch_Morphometrics_{swc_base}.csv")
-                    # Create a copy for CSV output and drop unwanted columns
-                    cols_to_drop = [
-                        "Branch_pathlength_terminal", "Contraction_terminal",
-                        "Branch_pathlength_internal", "Contraction_internal"
-                    ]
-                    df_out = df_tag.drop(columns=[col for col in cols_to_drop if col in df_tag.columns])
-                    df_out.to_csv(morpho_outfile, index=False)
-                    per_tag_dfs[tag] = df_tag  # keep full set (with all columns) for summary
-
-                    # Also do summary for each tag
-                    summary = {}
-                    for col, (op, out_label) in summary_logic.items():
-                        if col in df_tag.columns:
-                            col_numeric = pd.to_numeric(df_tag[col], errors="coerce")
-                            if op == "sum":
-                                summary[out_label] = col_numeric.sum()
-                            elif op == "mean":
-                                summary[out_label] = col_numeric.mean()
-                            elif op == "max":
-                                summary[out_label] = col_numeric.max()
-                            elif op == "first":
-                                summary[out_label] = col_numeric.iloc[0] if not col_numeric.empty else None
-                    if "EucDistance" in df_tag.columns:
-                        summary["Sum_EucDistance"] = pd.to_numeric(df_tag["EucDistance"], errors="coerce").sum()
-                    if "PathDistance" in df_tag.columns:
-                        summary["Sum_PathDistance"] = pd.to_numeric(df_tag["PathDistance"], errors="coerce").sum()
-                    summary["ABEL"] = abel(df_tag, "Branch_pathlength", "Contraction")
-                    summary["ABEL_Terminal"] = abel(df_tag, "Branch_pathlength_terminal", "Contraction_terminal")
-                    summary["ABEL_Internal"] = abel(df_tag, "Branch_pathlength_internal", "Contraction_internal")
-                    summary["BAPL"] = bapl(df_tag, "Branch_pathlength")
-                    summary["BAPL_Terminal"] = bapl(df_tag, "Branch_pathlength_terminal")
-                    summary["BAPL_Internal"] = bapl(df_tag, "Branch_pathlength_internal")
-                    all_summaries[tag][swc_file] = summary
-
-            # For All_Morphometrics summary (if 'all' or 'combined')
-            if 'all' in features_mode_set or 'combined' in features_mode_set:
-                if 'all' in features_mode_set:
-                    for tag in tags:
-                        df_tag = self.extract_features(swc_file=swc_path, features_dict=features_dict, tag=tag)
-                        per_tag_dfs[tag] = df_tag
-                        summary = {}
-                        for col, (op, out_label) in summary_logic.items():
-                            if col in df_tag.columns:
-                                col_numeric = pd.to_numeric(df_tag[col], errors="coerce")
-                                if op == "sum":
-                                    summary[out_label] = col_numeric.sum()
-                                elif op == "mean":
-                                    summary[out_label] = col_numeric.mean()
-                                elif op == "max":
-                                    summary[out_label] = col_numeric.max()
-                                elif op == "first":
-                                    summary[out_label] = col_numeric.iloc[0] if not col_numeric.empty else None
-                        if "EucDistance" in df_tag.columns:
-                            summary["Sum_EucDistance"] = pd.to_numeric(df_tag["EucDistance"], errors="coerce").sum()
-                        if "PathDistance" in df_tag.columns:
-                            summary["Sum_PathDistance"] = pd.to_numeric(df_tag["PathDistance"], errors="coerce").sum()
-                        summary["ABEL"] = abel(df_tag, "Branch_pathlength", "Contraction")
-                        summary["ABEL_Terminal"] = abel(df_tag, "Branch_pathlength_terminal", "Contraction_terminal")
-                        summary["ABEL_Internal"] = abel(df_tag, "Branch_pathlength_internal", "Contraction_internal")
-                        summary["BAPL"] = bapl(df_tag, "Branch_pathlength")
-                        summary["BAPL_Terminal"] = bapl(df_tag, "Branch_pathlength_terminal")
-                        summary["BAPL_Internal"] = bapl(df_tag, "Branch_pathlength_internal")
-                        all_summaries[tag][swc_file] = summary
-                if per_tag_dfs:
-                    df_combined = pd.concat(list(per_tag_dfs.values()), axis=0, ignore_index=True)
-                    summary = {}
-                    for col, (op, out_label) in summary_logic.items():
-                        if col in df_combined.columns:
-                            col_numeric = pd.to_numeric(df_combined[col], errors="coerce")
-                            if op == "sum":
-                                summary[out_label] = col_numeric.sum()
-                            elif op == "mean":
-                                summary[out_label] = col_numeric.mean()
-                            elif op == "max":
-                                summary[out_label] = col_numeric.max()
-                            elif op == "first":
-                                summary[out_label] = col_numeric.iloc[0] if not col_numeric.empty else None
-                    if "EucDistance" in df_combined.columns:
-                        summary["Sum_EucDistance"] = pd.to_numeric(df_combined["EucDistance"], errors="coerce").sum()
-                    if "PathDistance" in df_combined.columns:
-                        summary["Sum_PathDistance"] = pd.to_numeric(df_combined["PathDistance"], errors="coerce").sum()
-                    summary["ABEL"] = abel(df_combined, "Branch_pathlength", "Contraction")
-                    summary["ABEL_Terminal"] = abel(df_combined, "Branch_pathlength_terminal", "Contraction_terminal")
-                    summary["ABEL_Internal"] = abel(df_combined, "Branch_pathlength_internal", "Contraction_internal")
-                    summary["BAPL"] = bapl(df_combined, "Branch_pathlength")
-                    summary["BAPL_Terminal"] = bapl(df_combined, "Branch_pathlength_terminal")
-                    summary["BAPL_Internal"] = bapl(df_combined, "Branch_pathlength_internal")
-                    all_summaries_combined[swc_file] = summary
+        if jobs is None or jobs < 1:
+            jobs = os.cpu_count() or 1
+        parallel = len(pending_files) > 0 if executor is not None else jobs > 1 and len(pending_files) > 1
+        if self.neuron_timeout is not None and pending_files:
+            # A neuron can only be stopped in a process that can be killed
+            parallel = True
 
-        # End per-file loop
+        # Estimate every pending neuron, calibrated on the timings of earlier runs, and start the longest first
+        lm_invocations = self.lm_invocations(plan.jobs.values()) if plan.passes else 0
+        prior = CostModel.default(self.backend if lm_invocations else "native", lm_invocations or plan.planned_invocations)
+        model = CostModel.fit(manifest.costs, prior)
+        for swc_file in pending_files:
+            if swc_file not in sizes:
+                sizes[swc_file] = swc_size(os.path.join(swc_dir, *swc_file.split("/")))
+        costs = {swc_file: model.estimate(sizes[swc_file]) for swc_file in pending_files}
+        if parallel and not archive:
+            pending_files = longest_first(costs)
 
-        # After all files processed, write All_Morphometrics summaries 
-        if ('all' in features_mode_set or 'combined' in features_mode_set) and all_summaries_combined:
-            neuron_names = sorted(all_summaries_combined.keys())
-            all_features = output_order
-
-            def build_df_out(result_frames, column_name_func):
-                df_out = pd.DataFrame({"Features": all_features})
-                for df, neuron in result_frames:
-                    colname = column_name_func(df, neuron)
-                    df1 = df.set_index("Features")[df.columns[1]]
-                    df_out[colname] = df1.reindex(all_features).values
-                return df_out
-
-            only_glia = (len(tags) == 1 and tags[0] == "7.0")
-            contains_glia = "7.0" in tags
-
-            if set(tags) == {"3.0", "4.0"} and not contains_glia:
-                # Combined CSV
-                result_frames_combined = []
-                for neuron in neuron_names:
-                    comb = all_summaries_combined[neuron]
-                    df = pd.DataFrame({"combined": comb})
-                    df.insert(0, "Features", df.index)
-                    df.reset_index(drop=True, inplace=True)
-                    result_frames_combined.append((df, neuron))
-                df_out_combined = build_df_out(result_frames_combined, lambda df, n: f"{n.replace('.swc','')}_combined")
-                df_out_combined.to_csv(os.path.join(output_dir, "All_Morphometrics.csv"), index=False)
-
-                # Basal
-                result_frames_basal = []
-                for neuron in neuron_names:
-                    tag_label = TAG_LABELS["3.0"]
-                    val = all_summaries["3.0"].get(neuron, {})
-                    df = pd.DataFrame({tag_label: val})
-                    df.insert(0, "Features", df.index)
-                    df.reset_index(drop=True, inplace=True)
-                    result_frames_basal.append((df, neuron))
-                df_out_basal = build_df_out(result_frames_basal, lambda df, n: f"{n.replace('.swc','')}_basal_dendrites")
-                df_out_basal.to_csv(os.path.join(output_dir, "All_Morphometrics_basal.csv"), index=False)
-
-                # Apical
-                result_frames_apical = []
-                for neuron in neuron_names:
-                    tag_label = TAG_LABELS["4.0"]
-                    val = all_summaries["4.0"].get(neuron, {})
-                    df = pd.DataFrame({tag_label: val})
-                    df.insert(0, "Features", df.index)
-                    df.reset_index(drop=True, inplace=True)
-                    result_frames_apical.append((df, neuron))
-                df_out_apical = build_df_out(result_frames_apical, lambda df, n: f"{n.replace('.swc','')}_apical_dendrites")
-                df_out_apical.to_csv(os.path.join(output_dir, "All_Morphometrics_apical.csv"), index=False)
+        self.last_plan_stats = {
+            "swc_files": len(swc_files),
+            "skipped_files": len(swc_files) - len(pending_files),
+            "naive_invocations": plan.naive_invocations * len(pending_files),
+            "planned_invocations": plan.planned_invocations * len(pending_files),
+            "avoided_invocations": plan.avoided_invocations * len(pending_files),
+            "lm_invocations": lm_invocations * len(pending_files),
+            "jobs": min(jobs, len(pending_files)) if parallel else 1,
+            "estimated_seconds": makespan(costs, jobs if parallel else 1),
+            "calibration_samples": model.samples,
+            "timed_out_files": 0,
+        }
+        if dry_run:
+            if own_store:
+                store.close()
+            return
+        # (source, relative path) of every pending file; archive members come in archive order
+        if archive:
+            pending = ((member, member.name) for member in iter_archive(swc_dir, pending_files))
+        else:
+            pending = ((os.path.join(swc_dir, *f.split("/")), f) for f in pending_files)
+        runner = self
+        if parallel:
+            # Worker processes share the L-Measure concurrency limit of the machine
+            runner = copy.copy(self)
+            runner.scheduler = self.scheduler.divided(min(jobs, len(pending_files)))
+        process = functools.partial(
+            runner._process_swc,
+            output_dir=output_dir,
+            tags=tags,
+            features_mode_set=features_mode_set,
+            summary_logic=summary_logic,
+            plan=plan,
+            output_format=output_format,
+            keep_branches=store is not None or dataset_branches,
+        )
+        # Skipped neurons keep their rows; the previous rows of the others are replaced or dropped
+        dataset = BranchDatasetWriter(
+            output_dir, tags, output_format, shard, keep=map(swc_stem, results),
+        ) if dataset_branches else None
 
-            else:
-                for tag in tags:
-                    tag_label = TAG_LABELS.get(tag, f"tag_{tag}")
-                    result_frames = []
-                    for neuron in neuron_names:
-                        val = all_summaries[tag].get(neuron, {})
-                        df = pd.DataFrame({tag_label: val})
-                        df.insert(0, "Features", df.index)
-                        df.reset_index(drop=True, inplace=True)
-                        result_frames.append((df, neuron))
-                    if tag == "3.0":
-                        outname = "All_Morphometrics_basal.csv"
-                    elif tag == "4.0":
-                        outname = "All_Morphometrics_apical.csv"
-                    elif tag == "7.0":
-                        outname = "All_Morphometrics_glia.csv"
-                    else:
-                        outname = f"All_Morphometrics_{tag_label}.csv"
-                    df_out = build_df_out(result_frames, lambda df, n: f"{n.replace('.swc','')}_{tag_label}")
-                    df_out.to_csv(os.path.join(output_dir, outname), index=False)
+        def branch_outputs(swc_file):
+            if not features_mode_set & {'branch', 'combined'}:
+                return []
+            swc_base = swc_stem(swc_file)
+            return [branch_output_path(tag, swc_base, output_format, shard) for tag in tags]
+
+        if parallel and self.profiler.enabled:
+            # Worker processes send their spans back with each result
+            process = functools.partial(_with_spans, process)
+        if not fail_fast:
+            # An error fails its own neuron only
+            process = functools.partial(_isolated, process)
+        pool = None
+        def restart():
+            # The stuck pool (possibly the caller's) was killed; the rest of the run uses a new one
+            nonlocal pool
+            pool = process_pool(min(jobs, len(pending_files)))
+            return pool
+
+        if not parallel:
+            processed = ((item, process(*item)) for item in pending)
+        else:
+            if executor is None:
+                executor = pool = process_pool(min(jobs, len(pending_files)))
+            processed = _map_completed(executor, process, pending, 2 * jobs, self.neuron_timeout, restart)
+        try:
+            # Record every neuron as soon as it is done, so that a crash only loses the ones in flight
+            for (_, swc_file), result in processed:
+                if isinstance(result, TimeoutError):
+                    self.last_plan_stats["timed_out_files"] += 1
+                    if fail_fast:
+                        raise result
+                    result = _failure(result)
+                if isinstance(result, dict):
+                    manifest.record_failure(swc_file, digests[swc_file], tags, result)
+                    failures.append({"swc_file": swc_file, "digest": digests[swc_file], **result, "quarantined": False})
+                    continue
+                if parallel and self.profiler.enabled:
+                    result, spans = result
+                    self.profiler.extend(spans)
+                tag_summaries, combined_summary, branch_tables, seconds = result
+                if dataset is not None:
+                    with self.profiler.span("Branch_Morphometrics", "write", neuron=swc_file):
+                        dataset.add(swc_stem(swc_file), branch_tables)
+                size, nodes = sizes[swc_file]
+                manifest.record(
+                    swc_file, digests[swc_file], tags, branch_outputs(swc_file), tag_summaries, combined_summary,
+                    cost={"bytes": size, "nodes": nodes, "seconds": seconds},
+                )
+                if store is not None:
+                    store.add(
+                        swc_file, digests[swc_file], manifest.config_digest, branch_tables, tag_summaries,
+                        combined_summary,
+                    )
+                results[swc_file] = (tag_summaries, combined_summary)
+            if dataset is not None:
+                with self.profiler.span("Branch_Morphometrics", "write"):
+                    dataset.close()
+            if store is not None and shard is None:
+                # Failed neurons leave the store, as they leave the summary tables
+                store.prune(results)
+        except BaseException:
+            # Stop the neurons in flight (e.g. on Ctrl+C) rather than waiting for them
+            if pool is not None:
+                _terminate_pool(pool)
+                pool = None
+            if dataset is not None:
+                dataset.abort()
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if own_store:
+                store.close()
+            elif store is not None:
+                store.flush()
+        manifest.compact(swc_files)
+        failures.sort(key=lambda failure: failure["swc_file"])
+        write_failure_report(os.path.join(output_dir, failure_report_name(shard)), len(swc_files), failures)
+        self.last_failures = failures
+        self.last_plan_stats["failed_files"] = len(failures)
+
+        # Merge in listing order so the outputs match a serial run; failed neurons are left out
+        for swc_file in swc_files:
+            if swc_file not in results:
+                continue
+            tag_summaries, combined_summary = results[swc_file]
+            for tag, summary in tag_summaries.items():
+                all_summaries[tag][swc_file] = summary
+            if combined_summary is not None:
+                all_summaries_combined[swc_file] = combined_summary
+
+        # End per-file loop
+
+        # After all files processed, write All_Morphometrics summaries (shards are merged separately)
+        if shard is None and ('all' in features_mode_set or 'combined' in features_mode_set) and all_summaries_combined:
+            with self.profiler.span("All_Morphometrics", "write"):
+                write_summary_tables(
+                    output_dir, tags, all_summaries, all_summaries_combined,
+                    output_format=output_format, layout=summary_layout,
+                )
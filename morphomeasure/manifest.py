@@ -0,0 +1,273 @@
+# morphomeasure/manifest.py
+"""
+This module records the progress of a batch run so that an interrupted or repeated run only processes new or
+modified SWC files.
+Classes:
+    RunManifest: Append-only log of per-neuron results stored in the output directory.
+Functions:
+    manifest_name(shard): File name of the manifest of a run or of one shard of it.
+    failure_report_name(shard): File name of the failure report of a run or of one shard of it.
+    write_failure_report(path, swc_files, failures): Writes the JSON failure report of a run.
+    load_summaries(output_dirs): Collects the summary rows recorded by the manifests of one or more runs.
+Notes:
+    - The manifest is a JSON-lines file; each line records one SWC file with its content hash, the tags, a
+      digest of the run configuration (feature set, summary logic, output modes and engine), its completion
+      state, the output files it wrote and its summary rows. The last line of a file wins.
+    - Appending one line per finished neuron keeps the cost of recording constant, and a line torn by a crash
+      is ignored on the next load, so at most the neuron being written is processed again.
+    - `compact()` rewrites the log atomically with one line per current SWC file.
+    - Neurons whose extraction failed are recorded with state 'failed' and the error. They are quarantined:
+      later runs skip them until their content or the configuration changes (see `RunManifest.failed`).
+    - Completed records also keep the size, node count and seconds of their neuron, which calibrate the cost
+      model of later runs with the same configuration (see `morphomeasure.costmodel` and `RunManifest.costs`).
+    - Each shard of a sharded run keeps its own manifest, morphomeasure_manifest.<i>-of-<N>.jsonl, so array
+      tasks sharing an output directory never write the same file; `load_summaries` merges them.
+"""
+
+import json
+import os
+import tempfile
+
+from .cache import bytes_digest
+
+MANIFEST_NAME = "morphomeasure_manifest.jsonl"
+FAILURE_REPORT_NAME = "morphomeasure_failures.json"
+
+
+def manifest_name(shard=None):
+    """
+    Returns the manifest file name of a run, or of shard (index, count) of a sharded run.
+    """
+    if shard is None:
+        return MANIFEST_NAME
+    index, count = shard
+    return f"morphomeasure_manifest.{index}-of-{count}.jsonl"
+
+
+def failure_report_name(shard=None):
+    """
+    Returns the failure report file name of a run, or of shard (index, count) of a sharded run.
+    """
+    if shard is None:
+        return FAILURE_REPORT_NAME
+    index, count = shard
+    return f"morphomeasure_failures.{index}-of-{count}.json"
+
+
+def write_failure_report(path, swc_files, failures):
+    """
+    Writes the failure report of a run atomically.
+
+    Parameters:
+        path (str): Path of the report (see `failure_report_name`).
+        swc_files (int): Number of SWC files in the run.
+        failures (list of dict): One entry per failed neuron: 'swc_file', 'digest', 'error' (exception type),
+            'message', 'traceback', and 'quarantined' (True when it was skipped because it failed in an
+            earlier run with the same content and configuration).
+    """
+    report = {
+        "swc_files": swc_files,
+        "completed": swc_files - len(failures),
+        "failed": len(failures),
+        "failures": failures,
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_records(path):
+    """Returns the latest record of every SWC file in a manifest, skipping torn lines."""
+    records = {}
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return records
+    for line in lines:
+        try:
+            record = json.loads(line)
+            records[record["swc_file"]] = record
+        except (ValueError, KeyError, TypeError):
+            # Torn line from an interrupted run
+            continue
+    return records
+
+
+def load_summaries(output_dirs):
+    """
+    Collects the completed summary rows recorded by the manifests (sharded or not) of one or more runs.
+
+    Parameters:
+        output_dirs (list of str): Output directories of the runs to merge.
+
+    Returns:
+        tuple: (tags, all_summaries, all_summaries_combined) in the form used by
+        `morphomeasure.output.write_summary_tables`.
+
+    Raises:
+        ValueError: If no completed neuron is found, or if the runs used different tags or settings.
+        FileNotFoundError: If a directory holds no manifest.
+    """
+    records = {}
+    configs = set()
+    tags = None
+    for output_dir in output_dirs:
+        names = sorted(n for n in os.listdir(output_dir) if n.startswith("morphomeasure_manifest.") and n.endswith(".jsonl"))
+        if not names:
+            raise FileNotFoundError(f"No morphomeasure manifest found in '{output_dir}'")
+        for name in names:
+            for swc_file, record in _read_records(os.path.join(output_dir, name)).items():
+                if record.get("state") != "done":
+                    continue
+                configs.add(record.get("config"))
+                if tags is None:
+                    tags = record["tags"]
+                elif record["tags"] != tags:
+                    raise ValueError(f"Cannot merge runs with different tags: {tags} and {record['tags']}")
+                records[swc_file] = record
+    if not records:
+        raise ValueError("No completed neurons to merge")
+    if len(configs) > 1:
+        raise ValueError("Cannot merge runs made with different features, summary logic, modes or engines")
+
+    all_summaries = {t: {} for t in tags}
+    all_summaries_combined = {}
+    for swc_file, record in records.items():
+        for tag, summary in record["tag_summaries"].items():
+            all_summaries[tag][swc_file] = summary
+        if record.get("combined_summary") is not None:
+            all_summaries_combined[swc_file] = record["combined_summary"]
+    return tags, all_summaries, all_summaries_combined
+
+
+class RunManifest:
+    def __init__(self, output_dir, config, reset=False, name=MANIFEST_NAME, read_only=False):
+        """
+        Opens the manifest of an output directory.
+
+        Args:
+            output_dir (str): Output directory of the batch; the manifest is stored in it.
+            config (dict): JSON-serializable description of everything that affects the results besides
+                the SWC content (feature set, summary logic, tags, modes, engine digest).
+            reset (bool, optional): Ignore and overwrite previous records. Default is False.
+            name (str, optional): File name of the manifest (see `manifest_name`).
+            read_only (bool, optional): Neither create nor reset the manifest, e.g. to plan a run.
+                Default is False.
+
+        Attributes:
+            path (str): Path of the manifest file.
+            config_digest (str): Digest of `config`; records made with another configuration are not reused.
+            entries (dict): SWC file name to its latest record.
+            costs (list of dict): 'bytes', 'nodes' and 'seconds' of the neurons completed with the same
+                configuration, read before a reset.
+        """
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, name)
+        self.config_digest = bytes_digest(json.dumps(config, sort_keys=True).encode())
+        self.entries = _read_records(self.path)
+        self.costs = [
+            record["cost"] for record in self.entries.values()
+            if record.get("config") == self.config_digest and record.get("cost")
+        ]
+        if reset:
+            self.entries = {}
+        if not read_only:
+            os.makedirs(output_dir, exist_ok=True)
+            if reset:
+                open(self.path, "w").close()
+
+    def completed(self, swc_file, digest):
+        """
+        Returns the record of a neuron that was completed with the same content and configuration, and whose
+        output files still exist, or None if it has to be processed again.
+        """
+        record = self.entries.get(swc_file)
+        if (
+            record is None
+            or record.get("state") != "done"
+            or record.get("digest") != digest
+            or record.get("config") != self.config_digest
+        ):
+            return None
+        if not all(os.path.exists(os.path.join(self.output_dir, p)) for p in record.get("outputs", [])):
+            return None
+        return record
+
+    def failed(self, swc_file, digest):
+        """
+        Returns the record of a neuron whose extraction failed with the same content and configuration, or
+        None.
+        """
+        record = self.entries.get(swc_file)
+        if (
+            record is None
+            or record.get("state") != "failed"
+            or record.get("digest") != digest
+            or record.get("config") != self.config_digest
+        ):
+            return None
+        return record
+
+    def _append(self, record):
+        line = json.dumps(record, default=float)
+        with open(self.path, "a") as f:
+            f.write(line + "\n")
+        self.entries[record["swc_file"]] = json.loads(line)
+
+    def record(self, swc_file, digest, tags, outputs, tag_summaries, combined_summary, cost=None):
+        """
+        Appends the completed record of one neuron.
+
+        Parameters:
+            swc_file (str): SWC file name.
+            digest (str): Digest of the SWC content.
+            tags (list of str): Tags processed.
+            outputs (list of str): Output files written for the neuron, relative to the output directory.
+            tag_summaries (dict): Tag to summary row.
+            combined_summary (dict or None): Summary row across all tags.
+            cost (dict, optional): 'bytes', 'nodes' and 'seconds' of the neuron (see `costs`).
+        """
+        record = {
+            "swc_file": swc_file,
+            "digest": digest,
+            "tags": list(tags),
+            "config": self.config_digest,
+            "state": "done",
+            "outputs": list(outputs),
+            "tag_summaries": tag_summaries,
+            "combined_summary": combined_summary,
+        }
+        if cost is not None:
+            record["cost"] = cost
+        self._append(record)
+
+    def record_failure(self, swc_file, digest, tags, error):
+        """
+        Appends the failed record of one neuron.
+
+        Parameters:
+            swc_file (str): SWC file name.
+            digest (str): Digest of the SWC content.
+            tags (list of str): Tags processed.
+            error (dict): Description of the failure: 'error' (exception type), 'message' and 'traceback'.
+        """
+        self._append({
+            "swc_file": swc_file,
+            "digest": digest,
+            "tags": list(tags),
+            "config": self.config_digest,
+            "state": "failed",
+            "error": error,
+        })
+
+    def compact(self, swc_files):
+        """
+        Rewrites the manifest with only the latest record of each file in `swc_files`.
+        """
+        lines = [json.dumps(self.entries[f], default=float) for f in swc_files if f in self.entries]
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(tmp_path, self.path)
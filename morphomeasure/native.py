@@ -0,0 +1,552 @@
+# morphomeasure/native.py
+"""
+This module implements an in-process NumPy backend for the L-Measure functions listed in features.py.
+Functions:
+    parse_feature_flag(feature_flag): Parses an L-Measure flag into its filters and function id.
+    compute_function(tree, function_id, filters, step): Returns the raw values of one L-Measure function.
+    function_values(tree, function_id, filters): Values of a non-neuron-level function and the node of each.
+    neuron_function(tree, function_id, mask, owner, n_neurons): Once-per-neuron functions for several neurons.
+    grouped_quantiles(values, groups, n_groups, qs): Per-group quantiles matching numpy.quantile.
+    sholl_step(feature_flag): Radius step of a Sholl feature flag.
+    is_native_only(feature_flag): Whether a flag can only be computed by this backend.
+    sholl_function(tree, function_id, mask, step, owner, n_neurons): Sholl analysis of several neurons.
+    grouped_function(tree, function_id, filters, owner, n_neurons, step): Any function, for several neurons at once.
+    extract_arrays(swc, resolved, profiler, sidecar): Computes several resolved feature flags, returning unpadded value lists.
+    extract_features(swc, features_dict, tag): Drop-in equivalent of LMeasureWrapper.extract_features.
+Attributes:
+    FUNCTION_NAMES (dict): Maps the supported L-Measure function ids to their names.
+Notes:
+    - Feature flags use the same syntax as the Lm backend, e.g. "-l1,2,8,{TAG} -l1,2,19,1.0 -f23,0,0,10.0".
+      Each '-l<n>,<op>,<function>,<value>' filter keeps the compartments, branches or bifurcations whose
+      filter function compares to value with op (1: <, 2: ==, 3: >).
+    - Like L-Measure's raw (-R) output, values are returned per compartment, per branch, per bifurcation
+      or once per neuron depending on the function.
+    - Width, Height and Depth are the x, y and z extents of the central 95% of the compartments.
+    - Sholl analysis uses function ids 100-103, which L-Measure does not have. The last '-f' parameter is the
+      radius step, e.g. "-l1,2,8,{TAG} -f100,0,0,10.0" counts crossings every 10 um around the soma. All radii
+      are counted in one pass: a compartment crosses the spheres whose radius lies between its closest point
+      to the center and each of its ends. The "lm" backend computes these features with this module.
+"""
+
+import re
+
+import numpy as np
+
+from .profiling import NULL_PROFILER
+from .swc import SWCTree, open_swc
+
+FUNCTION_NAMES = {
+    0: "Soma_Surface", 1: "N_stems", 2: "N_bifs", 3: "N_branch", 4: "N_tips",
+    5: "Width", 6: "Height", 7: "Depth", 8: "Type", 9: "Diameter", 11: "Length",
+    12: "Surface", 14: "Volume", 15: "EucDistance", 16: "PathDistance", 18: "Branch_Order",
+    19: "Terminal_degree", 23: "Branch_pathlength", 24: "Contraction", 25: "Fragmentation",
+    28: "Partition_asymmetry", 31: "Pk_classic", 33: "Bif_ampl_local", 34: "Bif_ampl_remote",
+    35: "Bif_tilt_local", 36: "Bif_tilt_remote", 37: "Bif_torque_local", 38: "Bif_torque_remote",
+    43: "Helix", 44: "Fractal_Dim",
+    100: "Sholl_Intersections", 101: "Sholl_Critical_Radius", 102: "Sholl_Max_Intersections",
+    103: "Sholl_Regression",
+}
+
+_FILTER_OPS = {1: np.less, 2: np.equal, 3: np.greater}
+
+_LIMIT_RE = re.compile(r"-l(\d+),(\d+),(\d+),([-+.\deE]+)")
+_FUNCTION_RE = re.compile(r"-f(\d+),")
+_FUNCTION_PARAMS_RE = re.compile(r"-f\d+((?:,[-+.\deE]+)*)")
+
+# Functions reported once per branch, once per bifurcation or once per neuron; all others are per compartment
+_BRANCH_FUNCTIONS = {3, 23, 24, 25, 44}
+_BIFURCATION_FUNCTIONS = {2, 28, 31, 33, 34, 35, 36, 37, 38}
+_NEURON_FUNCTIONS = {0, 5, 6, 7}
+# Sholl analysis: not L-Measure functions, the ids extend its numbering (see the module notes)
+SHOLL_FUNCTIONS = frozenset({100, 101, 102, 103})
+# Per-node functions that can be used in '-l' filters
+_FILTER_FUNCTIONS = {8, 9, 11, 15, 16, 18, 19}
+
+
+def parse_feature_flag(feature_flag):
+    """
+    Parses a resolved L-Measure feature flag.
+
+    Parameters:
+        feature_flag (str): Flag with '{TAG}' already substituted, e.g. "-l1,2,8,3.0 -f11,0,0,10.0".
+
+    Returns:
+        tuple: (filters, function_id) where filters is a list of (op, function_id, value) tuples.
+
+    Raises:
+        ValueError: If the flag does not contain exactly one supported '-f' function or uses an unsupported filter.
+    """
+    functions = [int(f) for f in _FUNCTION_RE.findall(feature_flag)]
+    if len(functions) != 1:
+        raise ValueError(f"Expected exactly one '-f' function in feature flag '{feature_flag}'")
+    function_id = functions[0]
+    if function_id not in FUNCTION_NAMES:
+        raise ValueError(f"L-Measure function {function_id} is not supported by the native backend")
+    filters = []
+    for _, op, func, value in _LIMIT_RE.findall(feature_flag):
+        op, func = int(op), int(func)
+        if op not in _FILTER_OPS or func not in _FILTER_FUNCTIONS:
+            raise ValueError(f"Filter '-l?,{op},{func},{value}' is not supported by the native backend")
+        filters.append((op, func, float(value)))
+    return filters, function_id
+
+
+def sholl_step(feature_flag):
+    """
+    Returns the radius step of a Sholl feature flag: the last parameter of its '-f' function, e.g. 10.0 for
+    "-l1,2,8,3.0 -f100,0,0,10.0". Defaults to 10.0 when the function has no parameters.
+    """
+    match = _FUNCTION_PARAMS_RE.search(feature_flag)
+    params = match.group(1).split(",") if match and match.group(1) else []
+    return float(params[-1]) if params else 10.0
+
+
+def is_native_only(feature_flag):
+    """Returns True when the flag's function is only computed by the native backend (Sholl analysis)."""
+    return any(int(f) in SHOLL_FUNCTIONS for f in _FUNCTION_RE.findall(feature_flag))
+
+
+def _node_values(tree, function_id):
+    """Per-node value of a function usable in '-l' filters."""
+    if function_id == 8:
+        return tree.types
+    if function_id == 9:
+        return 2 * tree.radius
+    if function_id == 11:
+        return tree.length
+    if function_id == 15:
+        return tree.euclidean_distance
+    if function_id == 16:
+        return tree.path_distance
+    if function_id == 18:
+        return tree.branch_order
+    if function_id == 19:
+        return tree.terminal_degree
+    raise ValueError(f"L-Measure function {function_id} cannot be used as a filter")
+
+
+def _filter_mask(tree, filters):
+    """Boolean mask over nodes that pass every filter."""
+    mask = np.ones(len(tree), dtype=bool)
+    for op, function_id, value in filters:
+        mask &= _FILTER_OPS[op](_node_values(tree, function_id), value)
+    return mask
+
+
+def _angle(a, b):
+    """Angle in degrees between the row vectors of a and b (NaN for zero-length vectors)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+
+
+def _plane_angle(n, m):
+    """Angle in degrees (0-90) between planes with normals n and m."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos = np.abs((n * m).sum(axis=1)) / (np.linalg.norm(n, axis=1) * np.linalg.norm(m, axis=1))
+    return np.degrees(np.arccos(np.clip(cos, 0.0, 1.0)))
+
+
+def _compartment_function(tree, function_id):
+    """Values per node and the nodes where the function is defined."""
+    compartments = tree.is_compartment
+    if function_id == 1:
+        return np.ones(len(tree)), tree.is_stem
+    if function_id == 4:
+        return np.ones(len(tree)), tree.is_tip
+    if function_id == 12:
+        return 2 * np.pi * tree.radius * tree.length, compartments
+    if function_id == 14:
+        return np.pi * tree.radius ** 2 * tree.length, compartments
+    if function_id == 43:
+        p = tree.parent
+        pp = np.where(p >= 0, p[np.maximum(p, 0)], -1)
+        ppp = np.where(pp >= 0, p[np.maximum(pp, 0)], -1)
+        defined = ppp >= 0
+        a = tree.xyz[np.maximum(pp, 0)] - tree.xyz[np.maximum(ppp, 0)]
+        b = tree.xyz[np.maximum(p, 0)] - tree.xyz[np.maximum(pp, 0)]
+        c = tree.xyz - tree.xyz[np.maximum(p, 0)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            helix = (np.cross(a, b) * c).sum(axis=1) / (
+                np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) * np.linalg.norm(c, axis=1)
+            )
+        return helix, defined
+    return _node_values(tree, function_id), compartments
+
+
+def _branch_function(tree, function_id):
+    """Values per branch (ordered by branch end node)."""
+    ends = tree.branch_end_nodes
+    origin = tree.branch_origin
+    if function_id == 3:
+        return np.ones(len(ends))
+    pathlength = tree.path_distance[ends] - tree.path_distance[origin]
+    if function_id == 23:
+        return pathlength
+    if function_id == 24:
+        euclidean = np.linalg.norm(tree.xyz[ends] - tree.xyz[origin], axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return euclidean / pathlength
+    nodes = np.flatnonzero(tree.is_compartment)
+    branch = tree.branch_index[nodes]
+    if function_id == 25:
+        return np.bincount(branch, minlength=len(ends)).astype(float)
+    # Fractal_Dim: slope of log(path length) against log(euclidean distance) from the branch origin
+    o = origin[branch]
+    path = tree.path_distance[nodes] - tree.path_distance[o]
+    euclidean = np.linalg.norm(tree.xyz[nodes] - tree.xyz[o], axis=1)
+    valid = (path > 0) & (euclidean > 0)
+    branch, x, y = branch[valid], np.log(euclidean[valid]), np.log(path[valid])
+    n = np.bincount(branch, minlength=len(ends))
+    sx = np.bincount(branch, x, minlength=len(ends))
+    sy = np.bincount(branch, y, minlength=len(ends))
+    sxx = np.bincount(branch, x * x, minlength=len(ends))
+    sxy = np.bincount(branch, x * y, minlength=len(ends))
+    den = n * sxx - sx * sx
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (n * sxy - sx * sy) / den
+    return np.where((n >= 2) & (np.abs(den) > 1e-12), slope, 1.0)
+
+
+def _bifurcation_function(tree, function_id):
+    """Values per node (NaN where the node is not a bifurcation or the value is undefined)."""
+    first, second = tree.children
+    bif = tree.is_bifurcation & (second >= 0)
+    values = np.full(len(tree), np.nan)
+    nodes = np.flatnonzero(bif)
+    c1, c2 = first[nodes], second[nodes]
+    if function_id == 2:
+        values[nodes] = 1.0
+        return values
+    if function_id == 28:
+        n1, n2 = tree.terminal_degree[c1], tree.terminal_degree[c2]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values[nodes] = np.where(n1 + n2 > 2, np.abs(n1 - n2) / (n1 + n2 - 2), 0.0)
+        return values
+    if function_id == 31:
+        d1, d2, d = 2 * tree.radius[c1], 2 * tree.radius[c2], 2 * tree.radius[nodes]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values[nodes] = (d1 ** 1.5 + d2 ** 1.5) / d ** 1.5
+        return values
+
+    remote = function_id in (34, 36, 38)
+    ends = tree.branch_end_nodes
+
+    def daughters(k, k1, k2):
+        if remote:
+            k1, k2 = ends[tree.branch_index[k1]], ends[tree.branch_index[k2]]
+        return tree.xyz[k1] - tree.xyz[k], tree.xyz[k2] - tree.xyz[k]
+
+    v1, v2 = daughters(nodes, c1, c2)
+    if function_id in (33, 34):
+        values[nodes] = _angle(v1, v2)
+        return values
+
+    # The father vector points from the previous node (or the branch origin) to the bifurcation
+    has_parent = tree.parent[nodes] >= 0
+    nodes, c1, c2, v1, v2 = nodes[has_parent], c1[has_parent], c2[has_parent], v1[has_parent], v2[has_parent]
+    previous = tree.parent[tree.branch_start[nodes]] if remote else tree.parent[nodes]
+    if function_id in (35, 36):
+        father = tree.xyz[nodes] - tree.xyz[previous]
+        values[nodes] = np.fmin(_angle(father, v1), _angle(father, v2))
+        return values
+
+    # Torque: angle between this bifurcation plane and the plane of the parent bifurcation
+    parent_bif = tree.parent[tree.branch_start[nodes]]
+    has_parent_bif = bif[parent_bif] & (tree.types[parent_bif] != 1)
+    nodes, v1, v2, parent_bif = nodes[has_parent_bif], v1[has_parent_bif], v2[has_parent_bif], parent_bif[has_parent_bif]
+    u1, u2 = daughters(parent_bif, first[parent_bif], second[parent_bif])
+    values[nodes] = _plane_angle(np.cross(v1, v2), np.cross(u1, u2))
+    return values
+
+
+def _lerp(a, b, t):
+    """Linear interpolation computed like numpy.quantile, so that results match it bit for bit."""
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def grouped_quantiles(values, groups, n_groups, qs):
+    """
+    Computes quantiles of `values` within each group, with NumPy's default (linear) method.
+
+    Parameters:
+        values (numpy.ndarray): Values.
+        groups (numpy.ndarray): Group index (0 to n_groups - 1) of each value.
+        n_groups (int): Number of groups.
+        qs (sequence of float): Quantiles in [0, 1].
+
+    Returns:
+        tuple: (result, counts) where result is a (len(qs), n_groups) array (NaN for empty groups) and counts
+        the number of values of each group.
+    """
+    order = np.lexsort((values, groups))
+    values = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    result = np.full((len(qs), n_groups), np.nan)
+    present = counts > 0
+    for k, q in enumerate(qs):
+        virtual = q * (counts[present] - 1)
+        below = np.floor(virtual)
+        above = np.minimum(below + 1, counts[present] - 1)
+        lo = values[starts[present] + below.astype(np.int64)]
+        hi = values[starts[present] + above.astype(np.int64)]
+        result[k, present] = _lerp(lo, hi, virtual - below)
+    return result, counts
+
+
+def neuron_function(tree, function_id, mask, owner=None, n_neurons=1):
+    """
+    Computes a once-per-neuron function for every neuron of a tree.
+
+    Parameters:
+        tree (SWCTree): The reconstruction(s).
+        function_id (int): One of the per-neuron functions (Soma_Surface, Width, Height, Depth).
+        mask (numpy.ndarray): Nodes that pass the filters.
+        owner (numpy.ndarray, optional): Neuron index of every node, when the tree holds several neurons
+            (see `morphomeasure.batch`). Default: one neuron.
+        n_neurons (int): Number of neurons.
+
+    Returns:
+        tuple: (values, neurons), the value of every neuron that has nodes passing the filters and its index.
+    """
+    if owner is None:
+        owner = np.zeros(len(tree), dtype=np.int64)
+    if function_id == 0:
+        soma = mask
+        parent = np.where(tree.is_root, 0, tree.parent)
+        compartments = soma & tree.is_compartment & soma[parent]
+        has_soma = np.bincount(owner[soma], minlength=n_neurons) > 0
+        has_compartments = np.bincount(owner[compartments], minlength=n_neurons) > 0
+        surface = np.bincount(
+            owner[compartments], (2 * np.pi * tree.radius * tree.length)[compartments], minlength=n_neurons
+        )
+        # Without soma compartments, the first soma node is a sphere
+        soma_nodes = np.flatnonzero(soma)
+        first_neurons, first = np.unique(owner[soma_nodes], return_index=True)
+        sphere = np.zeros(n_neurons)
+        sphere[first_neurons] = 4 * np.pi * tree.radius[soma_nodes[first]] ** 2
+        values = np.where(has_compartments, surface, sphere)
+        neurons = np.flatnonzero(has_soma)
+        return values[neurons], neurons
+    nodes = mask & tree.is_compartment
+    (low, high), counts = grouped_quantiles(tree.xyz[nodes, function_id - 5], owner[nodes], n_neurons, (0.025, 0.975))
+    neurons = np.flatnonzero(counts > 0)
+    return (high - low)[neurons], neurons
+
+
+def _sholl_counts(tree, mask, step, owner, n_neurons):
+    """
+    Sholl intersection counts of every neuron at all radii step, 2 * step, ... at once.
+
+    Returns:
+        tuple: (counts, n_radii) where counts[i, k] is the number of times the compartments of neuron i that
+        pass the mask cross the sphere of radius (k + 1) * step around its center, for k < n_radii[i].
+    """
+    if step <= 0:
+        raise ValueError(f"The Sholl radius step must be positive, got {step}")
+    # Center: the first soma node of each neuron, or its first root when it has no soma
+    centers = np.zeros(n_neurons, dtype=np.int64)
+    for candidates in (np.flatnonzero(tree.is_root), np.flatnonzero(tree.types == 1)):
+        neurons, first = np.unique(owner[candidates], return_index=True)
+        centers[neurons] = candidates[first]
+    nodes = np.flatnonzero(mask & tree.is_compartment)
+    own = owner[nodes]
+    center = tree.xyz[centers[own]]
+    a = tree.xyz[tree.parent[nodes]] - center
+    b = tree.xyz[nodes] - center
+    ab = b - a
+    ab2 = (ab * ab).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(ab2 > 0, np.clip(-(a * ab).sum(axis=1) / ab2, 0.0, 1.0), 0.0)
+    nearest = np.linalg.norm(a + t[:, None] * ab, axis=1)
+    # The sphere of radius r is crossed once per segment end farther than r, if the segment comes closer
+    # than r: radius indices floor(nearest / step) + 1 to floor(end / step)
+    first = np.floor(nearest / step).astype(np.int64) + 1
+    last = [np.floor(d / step).astype(np.int64) for d in (np.linalg.norm(a, axis=1), np.linalg.norm(b, axis=1))]
+    n_radii = np.zeros(n_neurons, dtype=np.int64)
+    np.maximum.at(n_radii, own, np.maximum(*last))
+    # Every crossed range adds 1 to a difference array; a cumulative sum gives the counts of all radii
+    width = int(n_radii.max(initial=0)) + 2
+    diff = np.zeros(n_neurons * width)
+    for end in last:
+        crossed = end >= first
+        diff += np.bincount(own[crossed] * width + first[crossed], minlength=len(diff))
+        diff -= np.bincount(own[crossed] * width + end[crossed] + 1, minlength=len(diff))
+    counts = np.cumsum(diff.reshape(n_neurons, width), axis=1)[:, 1:-1]
+    return counts, n_radii
+
+
+def sholl_function(tree, function_id, mask, step=10.0, owner=None, n_neurons=1):
+    """
+    Computes a Sholl analysis feature for every neuron of a tree.
+
+    Parameters:
+        tree (SWCTree): The reconstruction(s).
+        function_id (int): 100 (intersections per radius), 101 (critical radius), 102 (maximum number of
+            intersections) or 103 (Sholl regression coefficient).
+        mask (numpy.ndarray): Nodes whose compartments (to their parent) are counted.
+        step (float): Radius step in the units of the reconstruction.
+        owner (numpy.ndarray, optional): Neuron index of every node. Default: one neuron.
+        n_neurons (int): Number of neurons.
+
+    Returns:
+        tuple: (values, neurons). Intersections are reported for the radii step, 2 * step, ... up to the
+        farthest counted compartment; the other features once per neuron with counted compartments.
+    """
+    if owner is None:
+        owner = np.zeros(len(tree), dtype=np.int64)
+    counts, n_radii = _sholl_counts(tree, mask, step, owner, n_neurons)
+    if function_id == 100:
+        keep = np.arange(counts.shape[1]) < n_radii[:, None]
+        return counts[keep], np.nonzero(keep)[0]
+    neurons = np.flatnonzero(n_radii > 0)
+    if not len(neurons):
+        return np.zeros(0), neurons
+    counts = counts[neurons]
+    if function_id in (101, 102):
+        peak = np.argmax(counts, axis=1)
+        if function_id == 101:
+            return (peak + 1) * step, neurons
+        return counts[np.arange(len(neurons)), peak], neurons
+    # Semi-log regression: log10(N / (pi r^2)) = -k r + m over the radii with intersections
+    group, index = np.nonzero(counts > 0)
+    x = (index + 1) * step
+    y = np.log10(counts[group, index] / (np.pi * x ** 2))
+    n = np.bincount(group, minlength=len(neurons))
+    sx = np.bincount(group, x, minlength=len(neurons))
+    sy = np.bincount(group, y, minlength=len(neurons))
+    sxx = np.bincount(group, x * x, minlength=len(neurons))
+    sxy = np.bincount(group, x * y, minlength=len(neurons))
+    den = n * sxx - sx * sx
+    fitted = (n >= 2) & (den > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (n * sxy - sx * sy) / den
+    return -slope[fitted], neurons[fitted]
+
+
+def function_values(tree, function_id, filters=()):
+    """
+    Computes the raw values of a per-compartment, per-branch or per-bifurcation L-Measure function, with the
+    node each value belongs to (the compartment, the branch end node or the bifurcation).
+
+    Returns:
+        tuple: (values, nodes), in file order of the nodes.
+    """
+    mask = _filter_mask(tree, filters)
+    if function_id in _BRANCH_FUNCTIONS:
+        values = _branch_function(tree, function_id)
+        nodes = tree.branch_end_nodes
+        keep = mask[nodes]
+    elif function_id in _BIFURCATION_FUNCTIONS:
+        values = _bifurcation_function(tree, function_id)
+        nodes = np.arange(len(tree))
+        keep = mask
+    else:
+        values, defined = _compartment_function(tree, function_id)
+        nodes = np.arange(len(tree))
+        keep = mask & defined
+    values, nodes = values[keep], nodes[keep]
+    finite = np.isfinite(values)
+    return values[finite], nodes[finite]
+
+
+def grouped_function(tree, function_id, filters=(), owner=None, n_neurons=1, step=10.0):
+    """
+    Computes one L-Measure function for every neuron of a tree that holds several (see `morphomeasure.batch`).
+
+    Parameters:
+        tree (SWCTree): The reconstructions.
+        function_id (int): L-Measure function id.
+        filters (list of tuple): Filters from `parse_feature_flag`.
+        owner (numpy.ndarray, optional): Neuron index of every node. Default: one neuron.
+        n_neurons (int): Number of neurons.
+        step (float): Radius step of the Sholl functions (see `sholl_step`).
+
+    Returns:
+        tuple: (values, neurons) with the neuron index of each value; the values of each neuron are in the
+        order `compute_function` returns them for that neuron alone.
+    """
+    if owner is None:
+        owner = np.zeros(len(tree), dtype=np.int64)
+    if function_id in SHOLL_FUNCTIONS:
+        return sholl_function(tree, function_id, _filter_mask(tree, filters), step, owner, n_neurons)
+    if function_id in _NEURON_FUNCTIONS:
+        return neuron_function(tree, function_id, _filter_mask(tree, filters), owner, n_neurons)
+    values, nodes = function_values(tree, function_id, filters)
+    return values, owner[nodes]
+
+
+def compute_function(tree, function_id, filters=(), step=10.0):
+    """
+    Computes the raw values of one L-Measure function.
+
+    Parameters:
+        tree (SWCTree): The reconstruction.
+        function_id (int): L-Measure function id (see FUNCTION_NAMES).
+        filters (list of tuple): (op, function_id, value) filters from `parse_feature_flag`.
+        step (float): Radius step of the Sholl functions (see `sholl_step`).
+
+    Returns:
+        numpy.ndarray: The values, in file order of the compartment, branch end or bifurcation they belong to;
+        Sholl intersections by increasing radius.
+    """
+    if function_id in SHOLL_FUNCTIONS:
+        return sholl_function(tree, function_id, _filter_mask(tree, filters), step)[0]
+    if function_id in _NEURON_FUNCTIONS:
+        return neuron_function(tree, function_id, _filter_mask(tree, filters))[0]
+    return function_values(tree, function_id, filters)[0]
+
+
+def extract_arrays(swc, resolved, profiler=NULL_PROFILER, sidecar=None):
+    """
+    Computes several features of one reconstruction.
+
+    Parameters:
+        swc (str or SWCTree): Path to the SWC file, or an already loaded reconstruction.
+        resolved (dict): Feature name to L-Measure flag, with '{TAG}' already substituted.
+        profiler (Profiler, optional): Records loading ('parse') and each feature ('compute').
+        sidecar (bool or str, optional): Binary sidecar location for the parsed tree (see `swc.load_swc`).
+
+    Returns:
+        dict: Feature name to list of values (not padded).
+
+    A path is opened with `swc.open_swc`, so every call on an unchanged file (e.g. one per tag) shares the
+    parsed tree and its topology.
+    """
+    if isinstance(swc, SWCTree):
+        tree = swc
+    else:
+        with profiler.span("load_swc", "parse"):
+            tree = open_swc(swc, sidecar)
+    feature_arrays = {}
+    for feature_name, feature_flag in resolved.items():
+        with profiler.span(feature_name, "compute"):
+            filters, function_id = parse_feature_flag(feature_flag)
+            values = compute_function(tree, function_id, filters, sholl_step(feature_flag))
+            feature_arrays[feature_name] = values.tolist()
+    return feature_arrays
+
+
+def extract_features(swc, features_dict, tag):
+    """
+    Computes features in-process, returning the same table as LMeasureWrapper.extract_features.
+
+    Parameters
+    ----------
+    swc : str or SWCTree
+        Path to the SWC file, or an already loaded reconstruction.
+    features_dict : dict
+        Dictionary mapping feature names to LM parameter flags. The flag may contain '{TAG}' to be replaced by `tag`.
+    tag : str
+        Tag to substitute in feature flags.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One column per feature, padded with None to equal length.
+    """
+    from .lmwrapper import feature_frame  # lmwrapper imports this module
+
+    return feature_frame(extract_arrays(swc, {name: flag.replace('{TAG}', tag) for name, flag in features_dict.items()}))
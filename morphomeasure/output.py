@@ -0,0 +1,385 @@
+# morphomeasure/output.py
+"""
+This module writes the result tables of a batch in CSV or in a typed columnar format (Parquet, Feather).
+Functions:
+    check_output_format(output_format): Validates a format and checks that its optional dependency is installed.
+    branch_output_path(tag, swc_base, output_format, shard): Relative path of the branch table of one neuron and tag.
+    write_table(df, path, output_format): Writes a table in the given format.
+    branch_dataset_neurons(output_dir, tags, output_format, shard): Lists the neurons in a branch dataset part.
+Classes:
+    BranchDatasetWriter: Writes the branch tables of a batch or shard as one file per tag.
+    summary_tables(tags, all_summaries, all_summaries_combined): Lists the All_Morphometrics tables of a batch.
+    wide_table(rows, features, suffix): Builds a wide (feature x neuron) summary table in one allocation.
+    write_summary_tables(output_dir, tags, ...): Writes the All_Morphometrics tables in wide or long layout.
+Notes:
+    - CSV output is unchanged: one Branch_Morphometrics_<neuron>.csv per neuron and tag.
+    - In Parquet/Feather mode the branch tables form one dataset partitioned by tag, with the neuron as a column:
+      Branch_Morphometrics/tag=<tag_label>/part-0.<ext> (part-<i>-of-<N>.<ext> for shard i of N), written by the
+      parent process in row groups of many neurons. It can be loaded at once with
+      `pandas.read_parquet(output_dir + "/Branch_Morphometrics")` or `pyarrow.dataset.dataset(..., partitioning="hive")`.
+    - Columnar tables are stored with float64 feature columns instead of text.
+    - Wide summary tables are filled into one preallocated float64 matrix instead of growing a DataFrame column
+      by column. In CSV they are not materialized at all: each feature row is formatted straight from the summary
+      rows, one chunk of neuron columns at a time, and streamed to disk.
+    - The long layout (neuron, tag, feature, value) avoids the pivot altogether for very large batches.
+    - Parquet and Feather need `pyarrow` (`pip install morphomeasure[parquet]`), which is imported only when used.
+"""
+
+import csv
+import io
+import os
+import posixpath
+
+import numpy as np
+import pandas as pd
+
+from .features import TAG_LABELS, output_order, sholl_output_order
+
+OUTPUT_FORMATS = ("csv", "parquet", "feather")
+SUMMARY_LAYOUTS = ("wide", "long")
+BRANCH_DATASET = "Branch_Morphometrics"
+
+
+def check_output_format(output_format):
+    """
+    Validates an output format.
+
+    Raises:
+        ValueError: If the format is not one of OUTPUT_FORMATS.
+        ImportError: If the format needs pyarrow and it is not installed.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {', '.join(OUTPUT_FORMATS)}")
+    if output_format != "csv":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError(
+                f"The '{output_format}' output format requires pyarrow; install it with "
+                "`pip install pyarrow` or `pip install morphomeasure[parquet]`"
+            ) from None
+
+
+def branch_output_path(tag, swc_base, output_format="csv", shard=None):
+    """
+    Returns the path, relative to the output directory, of the branch table of one neuron and tag.
+
+    Parameters:
+        tag (str): Tag of the table.
+        swc_base (str): SWC file name without extension, relative to the input directory ('/' separated).
+        output_format (str): One of OUTPUT_FORMATS.
+        shard (tuple, optional): (i, N) of a sharded run, which writes its own part of the dataset.
+
+    Returns:
+        str: Relative path of the table. CSV tables of SWC files in subdirectories are written to the same
+        subdirectories of the tag directory; in the columnar formats every neuron of the run (or shard) shares
+        the part file of the tag, where it is stored in the 'neuron' column.
+    """
+    tag_label = TAG_LABELS.get(tag, f"tag_{tag}")
+    if output_format == "csv":
+        subdir, name = posixpath.split(swc_base)
+        return os.path.join(tag_label, *subdir.split("/") if subdir else (), f"Branch_Morphometrics_{name}.csv")
+    part = "part-0" if shard is None else f"part-{shard[0]}-of-{shard[1]}"
+    return os.path.join(BRANCH_DATASET, f"tag={tag_label}", f"{part}.{output_format}")
+
+
+def typed(df, keep=()):
+    """
+    Returns a copy of `df` with every column except those in `keep` converted to float64.
+    """
+    out = df.copy()
+    for col in out.columns:
+        if col not in keep:
+            out[col] = pd.to_numeric(out[col], errors="coerce").astype("float64")
+    return out
+
+
+def write_table(df, path, output_format="csv", keep=()):
+    """
+    Writes a table.
+
+    Parameters:
+        df (pd.DataFrame): Table to write.
+        path (str): Destination path, including the extension.
+        output_format (str): One of OUTPUT_FORMATS.
+        keep (iterable of str): Columns that are not numeric (e.g. the 'Features' label column); the other
+            columns are stored as float64 in columnar formats.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if output_format == "csv":
+        df.to_csv(path, index=False)
+    elif output_format == "parquet":
+        typed(df, keep).to_parquet(path, index=False)
+    elif output_format == "feather":
+        typed(df, keep).reset_index(drop=True).to_feather(path)
+    else:
+        check_output_format(output_format)
+
+
+def _read_batches(path, output_format, columns=None):
+    """Yields the record batches of a dataset part file."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if output_format == "parquet":
+        yield from pq.ParquetFile(path).iter_batches(columns=columns)
+        return
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            yield batch if columns is None else batch.select(columns)
+
+
+def branch_dataset_neurons(output_dir, tags, output_format, shard=None):
+    """
+    Lists the neurons that have rows in the branch dataset part of a run or shard, for any of its tags.
+
+    Returns:
+        set of str: Values of the 'neuron' column (SWC file names without extension), empty if no part exists.
+    """
+    neurons = set()
+    for tag in tags:
+        path = os.path.join(output_dir, branch_output_path(tag, "", output_format, shard))
+        if os.path.exists(path):
+            for batch in _read_batches(path, output_format, ["neuron"]):
+                neurons.update(batch.column(0).to_pylist())
+    return neurons
+
+
+class BranchDatasetWriter:
+    """
+    Writes the branch tables of a batch (or shard) in a columnar format, as one file per tag with a 'neuron' column.
+
+    The tables of the neurons are buffered and written in row groups of about `rows_per_group` rows into a
+    temporary file, which replaces the part file of the tag when the writer is closed. The rows of the neurons
+    in `keep` (skipped because they were completed by an earlier run) are copied over from the previous part
+    file first; the rows of any other neuron in it are dropped.
+
+    Parameters:
+        output_dir (str): Output directory.
+        tags (list of str): Tags of the batch.
+        output_format (str): 'parquet' or 'feather'.
+        shard (tuple, optional): (i, N) of a sharded run.
+        keep (iterable of str): Neurons (SWC file names without extension) whose previous rows are kept.
+        rows_per_group (int): Number of buffered rows that are written at once.
+    """
+
+    def __init__(self, output_dir, tags, output_format, shard=None, keep=(), rows_per_group=1 << 16):
+        self.output_format = output_format
+        self.paths = {tag: os.path.join(output_dir, branch_output_path(tag, "", output_format, shard)) for tag in tags}
+        self.keep = set(keep)
+        self.rows_per_group = rows_per_group
+        self._writers = {}
+        self._schemas = {}
+        self._buffers = {tag: [] for tag in tags}
+        self._rows = dict.fromkeys(tags, 0)
+
+    def add(self, swc_base, branch_tables):
+        """Adds the branch table of each tag of one neuron."""
+        for tag, df in branch_tables.items():
+            if tag not in self.paths:
+                continue
+            df = typed(df)
+            df.insert(0, "neuron", swc_base)
+            self._buffers[tag].append(df)
+            self._rows[tag] += len(df)
+            if self._rows[tag] >= self.rows_per_group:
+                self._flush(tag)
+
+    def _open(self, tag, schema):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        path = self.paths[tag]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        previous = os.path.exists(path)
+        if previous and (self.keep or schema is None):
+            # The kept rows, or an empty table when there are no rows left, keep the columns of the file
+            if self.output_format == "parquet":
+                schema = pq.read_schema(path)
+            else:
+                with pa.memory_map(path) as source:
+                    schema = pa.ipc.open_file(source).schema
+        if schema is None:
+            return None
+        if self.output_format == "parquet":
+            writer = pq.ParquetWriter(path + ".tmp", schema)
+        else:
+            writer = pa.ipc.new_file(path + ".tmp", schema)
+        self._writers[tag] = writer
+        self._schemas[tag] = schema
+        if previous and self.keep:
+            keep = pa.array(sorted(self.keep), type=pa.string())
+            for batch in _read_batches(path, self.output_format):
+                batch = batch.filter(pc.is_in(batch.column("neuron"), value_set=keep))
+                if batch.num_rows:
+                    writer.write_table(pa.Table.from_batches([batch], schema))
+        return writer
+
+    def _flush(self, tag):
+        import pyarrow as pa
+
+        buffer = self._buffers[tag]
+        if not buffer and tag in self._writers:
+            return
+        df = pd.concat(buffer, ignore_index=True) if buffer else None
+        writer = self._writers.get(tag)
+        if writer is None:
+            writer = self._open(tag, None if df is None else pa.Schema.from_pandas(df, preserve_index=False))
+        if writer is not None and df is not None:
+            # Neurons share the columns of the first table of the file; missing values are NaN
+            schema = self._schemas[tag]
+            writer.write_table(pa.Table.from_pandas(df.reindex(columns=schema.names), schema, preserve_index=False))
+        self._buffers[tag] = []
+        self._rows[tag] = 0
+
+    def close(self):
+        """Writes the buffered rows and replaces the part file of every tag."""
+        for tag in self.paths:
+            self._flush(tag)
+        for tag, writer in self._writers.items():
+            writer.close()
+            os.replace(self.paths[tag] + ".tmp", self.paths[tag])
+        self._writers = {}
+
+    def abort(self):
+        """Discards the rows written so far and leaves the previous part files unchanged."""
+        for tag, writer in self._writers.items():
+            writer.close()
+            os.remove(self.paths[tag] + ".tmp")
+        self._writers = {}
+
+
+def summary_tables(tags, all_summaries, all_summaries_combined):
+    """
+    Lists the All_Morphometrics tables of a batch, for neurons with a combined summary, in name order.
+
+    Parameters:
+        tags (list of str): Tags of the batch.
+        all_summaries (dict): Tag to {swc_file: summary row}.
+        all_summaries_combined (dict): swc_file to combined summary row.
+
+    Returns:
+        list of tuple: (file_stem, label, rows) where rows maps swc_file to its summary row and label is
+        the suffix of the table's neuron columns ('combined' or the tag label).
+    """
+    neuron_names = sorted(all_summaries_combined)
+    if set(tags) == {"3.0", "4.0"}:
+        return [
+            ("All_Morphometrics", "combined", {n: all_summaries_combined[n] for n in neuron_names}),
+            ("All_Morphometrics_basal", TAG_LABELS["3.0"], {n: all_summaries["3.0"].get(n, {}) for n in neuron_names}),
+            ("All_Morphometrics_apical", TAG_LABELS["4.0"], {n: all_summaries["4.0"].get(n, {}) for n in neuron_names}),
+        ]
+    stems = {"3.0": "All_Morphometrics_basal", "4.0": "All_Morphometrics_apical", "7.0": "All_Morphometrics_glia"}
+    tables = []
+    for tag in tags:
+        tag_label = TAG_LABELS.get(tag, f"tag_{tag}")
+        rows = {n: all_summaries[tag].get(n, {}) for n in neuron_names}
+        tables.append((stems.get(tag, f"All_Morphometrics_{tag_label}"), tag_label, rows))
+    return tables
+
+
+def _neuron_name(swc_file):
+    if swc_file.endswith(".swc.gz"):
+        swc_file = swc_file[:-3]
+    return swc_file.replace('.swc', '')
+
+
+def _matrix(rows, features):
+    """Fills a (feature x neuron) float64 matrix from summary rows; missing values are NaN."""
+    values = np.full((len(features), len(rows)), np.nan)
+    for j, row in enumerate(rows.values()):
+        values[:, j] = [np.nan if row.get(f) is None else row[f] for f in features]
+    return values
+
+
+def wide_table(rows, features=output_order, suffix=""):
+    """
+    Builds a wide summary table with one row per feature and one column per neuron.
+
+    Parameters:
+        rows (dict): swc_file to summary row ({feature: value}).
+        features (list of str): Row order. Default is `output_order`.
+        suffix (str): Appended to the neuron name of each column, e.g. 'basal_dendrites'.
+
+    Returns:
+        pd.DataFrame: 'Features' column followed by one float64 column per neuron.
+    """
+    names = [f"{_neuron_name(n)}_{suffix}" for n in rows]
+    df = pd.DataFrame(_matrix(rows, features), columns=names)
+    df.insert(0, "Features", list(features))
+    return df
+
+
+def _format_value(value):
+    return "" if value is None or value != value else repr(float(value))
+
+
+def _csv_field(text):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="").writerow([text])
+    return buf.getvalue()
+
+
+def _write_wide_csv(path, rows, features, suffix, chunk_columns):
+    names = [f"{_neuron_name(n)}_{suffix}" for n in rows]
+    columns = list(rows.values())
+    with open(path, "w", newline="") as f:
+        csv.writer(f, lineterminator=os.linesep).writerow(["Features"] + names)
+        for feature in features:
+            f.write(_csv_field(feature))
+            for start in range(0, len(columns), chunk_columns):
+                f.write("," + ",".join(_format_value(row.get(feature)) for row in columns[start:start + chunk_columns]))
+            f.write(os.linesep)
+
+
+def _long_table(rows, features, tag_label):
+    neurons = [_neuron_name(n) for n in rows]
+    values = _matrix(rows, features)
+    return pd.DataFrame({
+        "neuron": np.repeat(neurons, len(features)),
+        "tag": tag_label,
+        "feature": np.tile(list(features), len(neurons)),
+        "value": values.T.reshape(-1),
+    })
+
+
+def write_summary_tables(output_dir, tags, all_summaries, all_summaries_combined, output_format="csv",
+                         layout="wide", features=None, chunk_columns=4096):
+    """
+    Writes the All_Morphometrics tables of a batch.
+
+    Parameters:
+        output_dir (str): Output directory.
+        tags (list of str): Tags of the batch.
+        all_summaries (dict): Tag to {swc_file: summary row}.
+        all_summaries_combined (dict): swc_file to combined summary row.
+        output_format (str): One of OUTPUT_FORMATS.
+        layout (str): 'wide' (one column per neuron, the default) or 'long' (one row per neuron, tag and
+            feature, with columns neuron, tag, feature, value).
+        features (list of str, optional): Features to write, in order. Default is `output_order`, followed by
+            the `sholl_output_order` features when the batch extracted them.
+        chunk_columns (int): Number of neuron columns formatted at once when streaming wide CSV files.
+
+    Returns:
+        list of str: Paths of the files written.
+    """
+    if layout not in SUMMARY_LAYOUTS:
+        raise ValueError(f"Unknown summary layout '{layout}', expected one of {', '.join(SUMMARY_LAYOUTS)}")
+    if features is None:
+        # Sholl features are opt-in: only batches that extracted them get their rows
+        extracted = {f for row in all_summaries_combined.values() for f in row}
+        features = output_order + [f for f in sholl_output_order if f in extracted]
+    paths = []
+    for stem, label, rows in summary_tables(tags, all_summaries, all_summaries_combined):
+        path = os.path.join(output_dir, f"{stem}.{output_format}")
+        if layout == "long":
+            write_table(_long_table(rows, features, label), path, output_format, keep=("neuron", "tag", "feature"))
+        elif output_format == "csv":
+            _write_wide_csv(path, rows, features, label, chunk_columns)
+        else:
+            write_table(wide_table(rows, features, label), path, output_format, keep=("Features",))
+        paths.append(path)
+    return paths
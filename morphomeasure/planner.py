@@ -0,0 +1,68 @@
+# morphomeasure/planner.py
+"""
+This module plans the feature extractions of a batch so that each unique (SWC file, resolved flag) pair is computed once.
+Classes:
+    ExtractionPlan: The unique extraction jobs for one SWC file and how they map back to (tag, feature) columns.
+Notes:
+    - A flag without '{TAG}' (e.g. Soma_Surface, "-l1,2,8,1.0 -f0,0,0,10.0") resolves to the same job for
+      every tag.
+    - Without planning, 'branch'/'combined' and 'all' modes each extract every tag again, so the per-SWC
+      number of extractions is (number of passes) x (number of tags) x (number of features).
+    - Jobs are named after the feature they compute, with the tag for tag-dependent flags ('Length@3.0',
+      'Soma_Surface'); the names appear in error messages, failure reports and profiles.
+    - Counts are reported per feature extraction. With the fused "lm" backend, each job group that shares the
+      same '-l' filters still runs as a single L-Measure process.
+"""
+
+
+class ExtractionPlan:
+    def __init__(self, features_dict, tags, features_mode_set):
+        """
+        Builds the plan for one SWC file.
+
+        Args:
+            features_dict (dict): Feature names to L-Measure flags, possibly containing '{TAG}'.
+            tags (list of str): Tags to extract.
+            features_mode_set (set): Output modes ('all', 'branch', 'combined').
+
+        Attributes:
+            jobs (dict): Job name to resolved flag, one entry per unique flag. A job is named after the first
+                feature that needs it, as 'Feature@tag' when its flag depends on the tag.
+            columns (dict): Tag to {feature name: job name}.
+            passes (int): Number of output passes that need the extracted features (0, 1 or 2).
+            naive_invocations (int): Extractions per SWC file without planning.
+            planned_invocations (int): Extractions per SWC file with the plan.
+        """
+        self.jobs = {}
+        self.columns = {}
+        job_of_flag = {}
+        for tag in tags:
+            self.columns[tag] = {}
+            for feature_name, feature_flag in features_dict.items():
+                flag = feature_flag.replace('{TAG}', tag)
+                if flag not in job_of_flag:
+                    job_of_flag[flag] = feature_name if flag == feature_flag else f"{feature_name}@{tag}"
+                    self.jobs[job_of_flag[flag]] = flag
+                self.columns[tag][feature_name] = job_of_flag[flag]
+
+        self.passes = int(bool(features_mode_set & {'branch', 'combined'})) + int('all' in features_mode_set)
+        self.naive_invocations = self.passes * len(tags) * len(features_dict)
+        self.planned_invocations = len(self.jobs) if self.passes else 0
+
+    @property
+    def avoided_invocations(self):
+        """Extractions per SWC file saved by the plan."""
+        return self.naive_invocations - self.planned_invocations
+
+    def tag_arrays(self, job_arrays, tag):
+        """
+        Maps the results of the jobs back to the feature columns of one tag.
+
+        Parameters:
+            job_arrays (dict): Job name to list of values.
+            tag (str): The tag.
+
+        Returns:
+            dict: Feature name to list of values, in features_dict order.
+        """
+        return {feature_name: list(job_arrays[job]) for feature_name, job in self.columns[tag].items()}
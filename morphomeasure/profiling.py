@@ -0,0 +1,170 @@
+# morphomeasure/profiling.py
+"""
+This module times the stages of an extraction and exports them for inspection.
+Classes:
+    Profiler: Records timed spans and exports them as Chrome trace events and as a text report.
+    NullProfiler: Profiler that records nothing; the default.
+Attributes:
+    NULL_PROFILER: Shared NullProfiler instance.
+Notes:
+    - Spans are recorded by category: 'neuron' (one SWC file in run_batch), 'extract' (all features of a
+      neuron), 'spawn' (starting an L-Measure process), 'lm' (waiting for it), 'parse' (reading its output),
+      'compute' (one feature of the native backend), 'summarize' and 'write' (one output table).
+    - The trace written by `write_chrome_trace` opens in chrome://tracing or https://ui.perfetto.dev. Each process
+      of a parallel batch is its own track; overlapping spans, such as concurrent L-Measure runs, are spread over
+      as many rows as needed.
+    - When profiling is disabled, `span` returns one shared no-op context manager, so an instrumented stage
+      costs a method call.
+"""
+
+import contextlib
+import json
+import os
+import time
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    __slots__ = ("events", "event")
+
+    def __init__(self, events, event):
+        self.events = events
+        self.event = event
+
+    def __enter__(self):
+        self.event["start"] = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.event["dur"] = time.perf_counter_ns() - self.event["start"]
+        self.events.append(self.event)
+
+
+class NullProfiler:
+    enabled = False
+
+    def span(self, name, cat, **args):
+        return _NULL_SPAN
+
+    def extend(self, events):
+        pass
+
+    def drain(self):
+        return []
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    enabled = True
+
+    def __init__(self):
+        """
+        Creates an empty profiler.
+
+        Attributes:
+            events (list of dict): Recorded spans with name, cat, start and dur (perf_counter nanoseconds),
+                pid and args.
+        """
+        self.events = []
+
+    def span(self, name, cat, **args):
+        """
+        Returns a context manager timing one span.
+
+        Parameters:
+            name (str): Span name, e.g. the feature or file it covers.
+            cat (str): Stage category (see the module notes).
+            **args: Extra JSON-serializable details, e.g. neuron=..., tag=....
+        """
+        return _Span(self.events, {"name": name, "cat": cat, "pid": os.getpid(), "args": args})
+
+    def extend(self, events):
+        """Adds spans recorded elsewhere, e.g. by a worker process."""
+        self.events.extend(events)
+
+    def drain(self):
+        """Returns the recorded spans and forgets them."""
+        events, self.events = self.events, []
+        return events
+
+    def __getstate__(self):
+        # Copies sent to worker processes start empty; their spans are sent back with `drain`
+        return {"events": []}
+
+    def chrome_trace(self):
+        """
+        Returns the recorded spans as a Chrome trace-event document.
+        """
+        origin = min((e["start"] for e in self.events), default=0)
+        trace = []
+        # Complete ('X') events on one row must nest, so overlapping spans of a process get rows of their own
+        rows = {}
+        for event in sorted(self.events, key=lambda e: (e["pid"], e["start"], -e["dur"])):
+            end = event["start"] + event["dur"]
+            stacks = rows.setdefault(event["pid"], [])
+            for tid, stack in enumerate(stacks):
+                while stack and stack[-1] <= event["start"]:
+                    stack.pop()
+                if not stack or end <= stack[-1]:
+                    stack.append(end)
+                    break
+            else:
+                stacks.append([end])
+                tid = len(stacks) - 1
+            trace.append({
+                "name": event["name"],
+                "cat": event["cat"],
+                "ph": "X",
+                "ts": (event["start"] - origin) / 1000,
+                "dur": event["dur"] / 1000,
+                "pid": event["pid"],
+                "tid": tid,
+                "args": event["args"],
+            })
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path):
+        """
+        Writes the recorded spans to `path` as Chrome trace-event JSON.
+        """
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+
+    def totals(self, cat, key=lambda event: event["name"]):
+        """
+        Returns {key: (total seconds, count)} over the spans of a category, sorted by decreasing total.
+        """
+        totals = {}
+        for event in self.events:
+            if event["cat"] == cat:
+                total, count = totals.get(key(event), (0, 0))
+                totals[key(event)] = (total + event["dur"], count + 1)
+        return {k: (total / 1e9, count) for k, (total, count) in sorted(totals.items(), key=lambda kv: -kv[1][0])}
+
+    def report(self, top=10):
+        """
+        Returns a text report: time per stage, and the `top` slowest features and neurons.
+
+        Feature times add up every L-Measure run ('lm') or native computation ('compute') of a feature, or of a
+        fused group of features, over all neurons.
+        """
+        lines = ["Stage        Total (s)    Spans"]
+        for cat in ("neuron", "extract", "spawn", "lm", "parse", "compute", "summarize", "write"):
+            for _, (total, count) in self.totals(cat, key=lambda event: cat).items():
+                lines.append(f"{cat:<12} {total:>9.3f} {count:>8}")
+        features = self.totals("lm")
+        for name, (total, count) in self.totals("compute").items():
+            # A feature computed natively in some runs and by L-Measure in others adds up both
+            lm_total, lm_count = features.get(name, (0, 0))
+            features[name] = (lm_total + total, lm_count + count)
+        sections = [
+            ("Slowest features", sorted(features.items(), key=lambda kv: -kv[1][0])),
+            ("Slowest neurons", list(self.totals("neuron").items())),
+        ]
+        for title, rows in sections:
+            lines += ["", f"{title:<40} {'Total (s)':>9} {'Runs':>6}"]
+            lines += [f"{name[:40]:<40} {total:>9.3f} {count:>6}" for name, (total, count) in rows[:top]]
+        return "\n".join(lines)
@@ -0,0 +1,194 @@
+# morphomeasure/scheduler.py
+"""
+This module runs the L-Measure processes of one extraction concurrently with asyncio.
+Classes:
+    LmScheduler: Launches subprocesses under a concurrency limit, with per-call timeouts and retries.
+Functions:
+    gather_all(*aws): asyncio.gather that cancels and awaits the other awaitables when one fails.
+Notes:
+    - The L-Measure runs of one SWC file (one per feature, or one per group of fused features) are independent,
+      so running them concurrently brings the latency of a neuron down to roughly that of its slowest run.
+    - At most `max_concurrency` processes of a scheduler run at once, across every extraction it serves.
+      `run_batch(jobs=N)` gives each of its N worker processes an N-th of the limit.
+    - A call that exceeds `timeout` is killed. Timeouts, spawn errors such as EAGAIN and results rejected by
+      the caller are retried with exponential backoff; a missing or non-executable program is not.
+    - Processes still running when an extraction fails or is cancelled are killed. Each process is started
+      in a process group (session) of its own and the whole group is killed, so helpers it spawned do not
+      outlive it.
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from .profiling import NULL_PROFILER
+
+
+if os.name == "nt":
+    _GROUP = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    _GROUP = {"start_new_session": True}
+
+
+def _kill_tree(proc):
+    """Kills a process started with `_GROUP` and every process of its group."""
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+    else:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def gather_all(*aws):
+    """
+    Runs awaitables concurrently like `asyncio.gather`. When one fails, the others are cancelled and awaited
+    before the error is raised, so that their processes are killed and reaped inside the event loop instead
+    of being left to `asyncio.run`'s shutdown.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class LmScheduler:
+    def __init__(self, max_concurrency=None, timeout=None, retries=2, retry_delay=0.5, profiler=None):
+        """
+        Configures the scheduler.
+
+        Args:
+            max_concurrency (int, optional): Maximum number of processes running at once. Default: CPU count.
+            timeout (float, optional): Seconds after which a process and its children are killed. Default: no timeout.
+            retries (int, optional): Extra attempts for a call that timed out, failed to start or was rejected.
+            retry_delay (float, optional): Delay before the first retry in seconds; doubled for each next one.
+            profiler (Profiler, optional): Records the 'spawn' and 'lm' spans of every process.
+
+        Attributes:
+            retried (int): Total number of retries made.
+        """
+        self.max_concurrency = max(1, max_concurrency or os.cpu_count() or 1)
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.retried = 0
+        self.profiler = profiler or NULL_PROFILER
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def divided(self, parts):
+        """
+        Returns a scheduler with the same settings and an equal share of the concurrency limit (at least 1),
+        for one of `parts` processes sharing the machine.
+        """
+        return LmScheduler(
+            max(1, self.max_concurrency // parts), self.timeout, self.retries, self.retry_delay, self.profiler
+        )
+
+    def _semaphore(self):
+        # asyncio primitives belong to one event loop; every loop running extractions gets its own
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def _attempt(self, args, cwd, label):
+        async with self._semaphore():
+            with self.profiler.span(label, "spawn"):
+                spawn = asyncio.ensure_future(asyncio.create_subprocess_exec(
+                    *args, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, **_GROUP
+                ))
+                try:
+                    proc = await asyncio.shield(spawn)
+                except asyncio.CancelledError:
+                    # Cancelling asyncio's process creation itself can wait forever for the child; let it
+                    # finish and kill the process instead
+                    try:
+                        proc = await spawn
+                    except Exception:
+                        raise asyncio.CancelledError from None
+                    _kill_tree(proc)
+                    await proc.wait()
+                    raise
+            try:
+                with self.profiler.span(label, "lm"):
+                    stdout, stderr = await asyncio.wait_for(proc.communicate(), self.timeout)
+            except BaseException as e:
+                # Timed out, or the extraction was cancelled: do not leave the process running
+                if proc.returncode is None:
+                    _kill_tree(proc)
+                    await proc.wait()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise subprocess.TimeoutExpired(args, self.timeout) from None
+                raise
+        return subprocess.CompletedProcess(
+            args, proc.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+        )
+
+    async def run(self, args, cwd=None, accept=None, label=""):
+        """
+        Runs one process, retrying transient failures.
+
+        Parameters:
+            args (list of str): Program and arguments.
+            cwd (str, optional): Working directory of the process.
+            accept (callable, optional): Called with the CompletedProcess; a false result is treated as a
+                transient failure and retried. The result of the last attempt is returned either way.
+            label (str, optional): Name of the profiled spans, e.g. the features computed by the process.
+
+        Returns:
+            subprocess.CompletedProcess: With text stdout and stderr.
+
+        Raises:
+            subprocess.TimeoutExpired: If the last attempt timed out.
+            OSError: If the program cannot be started.
+        """
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                result = await self._attempt(args, cwd, label)
+            except (FileNotFoundError, PermissionError):
+                raise
+            except (subprocess.TimeoutExpired, OSError):
+                if last:
+                    raise
+            else:
+                if last or accept is None or accept(result):
+                    return result
+            self.retried += 1
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    def execute(self, coro):
+        """
+        Runs a coroutine to completion from synchronous code and returns its result. When called from a
+        thread that already runs an event loop (e.g. a notebook), the coroutine runs in a helper thread.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+
+    def __getstate__(self):
+        # Event-loop state cannot be pickled; copies in worker processes create their own
+        state = self.__dict__.copy()
+        state["_semaphores"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._semaphores = weakref.WeakKeyDictionary()
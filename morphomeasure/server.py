@@ -0,0 +1,536 @@
+# morphomeasure/server.py
+"""
+This module serves feature extraction over local HTTP, so that tools extracting single neurons share warm workers
+instead of each paying the start-up cost of pandas, NumPy and the extraction engine.
+Classes:
+    ExtractionService: Bounded request queue that coalesces concurrent requests into batched extraction jobs.
+    ServiceBusy: Raised when the queue is full.
+Functions:
+    extract_batch(lm, items, features_dict, summary_logic): Branch tables and summary rows of several neurons.
+    make_server(service, host, port, swc_root, ...): Builds the HTTP server of a service.
+Notes:
+    - Endpoints:
+        POST /extract  JSON {"path": ...} or {"swc": "<SWC text>"}, with optional "tags", "name" and "format"
+                       ("json" or "arrow"); any other content type is an SWC upload, with tag, name and
+                       format as query parameters (e.g. /extract?tag=3.0&tag=4.0).
+        GET  /health   Queue depth and counters.
+    - Requests that arrive within `batch_window` seconds of each other are extracted together, up to `max_batch`
+      neurons. With the native backend a batch is one vectorized pass over all its neurons (see
+      `morphomeasure.batch`); the other backends extract its neurons one after the other.
+    - Backpressure: at most `jobs` batches run at once, so requests wait in a queue of `max_queue` entries,
+      where they coalesce into larger batches. When the queue is full, requests are rejected right away with
+      503 and a Retry-After header instead of waiting without bound, which keeps tail latency predictable.
+    - Timeouts: a request that gets no result within `request_timeout` seconds is answered with 504 (and
+      dropped from the queue if it has not started). With a service `timeout`, a batch that runs longer is
+      abandoned: its requests fail, and its worker processes are killed and replaced so that a neuron that
+      never finishes does not hold a worker and the batches queued behind it.
+    - 'path' requests read files on the server, so they are refused unless `swc_root` is given, and then
+      only resolve inside it.
+    - The JSON response holds the branch table (column lists) and summary row of every tag, and the combined
+      summary across the tags. The Arrow response (format=arrow or Accept: application/vnd.apache.arrow.stream,
+      requires pyarrow) is an IPC stream of the branch rows of every tag with a 'tag' column; the summaries
+      are JSON in its schema metadata under 'morphomeasure.summary'.
+"""
+
+import functools
+import io
+import json
+import math
+import os
+import queue
+import signal
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from .batch import batch_arrays, concat_trees
+from .discovery import swc_stem
+from .features import features, summary_logic
+from .lmwrapper import _terminate_pool, branch_table, feature_frame, process_pool
+from .planner import ExtractionPlan
+from .sources import open_tree
+from .summary import summarize
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+_MAX_BODY = 64 << 20
+
+
+class ServiceBusy(Exception):
+    """The request queue is full; the request should be retried later."""
+
+
+def _native_job_arrays(lm, paths, jobs):
+    """Values of every job for every neuron, computed in one vectorized pass (native backend)."""
+    trees = [open_tree(path, lm.swc_sidecar) for path in paths]
+    tree, offsets = concat_trees(trees)
+    owner = np.repeat(np.arange(len(trees)), np.diff(offsets))
+    per_neuron = [{} for _ in paths]
+    for job, (values, neurons) in batch_arrays(tree, owner, len(trees), jobs).items():
+        order = np.argsort(neurons, kind="stable")
+        bounds = np.cumsum(np.bincount(neurons, minlength=len(trees)))[:-1]
+        for arrays, chunk in zip(per_neuron, np.split(values[order], bounds)):
+            arrays[job] = chunk.tolist()
+    return per_neuron
+
+
+def extract_batch(lm, items, features_dict=features, summary_logic=summary_logic):
+    """
+    Extracts the branch tables and summary rows of several neurons.
+
+    Parameters:
+        lm (LMeasureWrapper): Wrapper whose backend computes the features.
+        items (list of tuple): (name, swc_path, tags) per neuron.
+        features_dict (dict): Feature names to L-Measure flags.
+        summary_logic (dict): {column_name: (operation, output_label)}.
+
+    Returns:
+        list: Per item, a dict with 'neuron', 'branch' ({tag: DataFrame}), 'summary' ({tag: row}) and
+        'combined' (row across the tags), or the exception raised by that item. When a vectorized batch fails,
+        its items are extracted one by one so that one bad file does not fail the others.
+    """
+    tags = list(dict.fromkeys(tag for _, _, item_tags in items for tag in item_tags))
+    plan = ExtractionPlan(features_dict, tags, {"all", "branch"})
+    job_arrays = None
+    if lm.backend == "native" and len(items) > 1:
+        try:
+            job_arrays = _native_job_arrays(lm, [path for _, path, _ in items], plan.jobs)
+        except Exception:
+            job_arrays = None
+    results = []
+    frames = []
+    for i, (name, path, item_tags) in enumerate(items):
+        try:
+            arrays = job_arrays[i] if job_arrays is not None else lm._extract_arrays(path, plan.jobs, tag="")
+        except Exception as e:
+            results.append(e)
+            continue
+        tag_frames = {tag: feature_frame(plan.tag_arrays(arrays, tag)) for tag in item_tags}
+        frames += [(i, tag, tag_frames[tag]) for tag in item_tags]
+        results.append({"neuron": name, "branch": {tag: branch_table(df) for tag, df in tag_frames.items()}})
+    # One grouped reduction summarizes every neuron of the batch
+    tag_summaries, combined = summarize(frames, summary_logic)
+    for i, (_, _, item_tags) in enumerate(items):
+        if isinstance(results[i], dict):
+            results[i]["summary"] = {tag: tag_summaries[(i, tag)] for tag in item_tags}
+            results[i]["combined"] = combined[i]
+    return results
+
+
+# Worker process state: the wrapper and settings stay loaded between batches
+_worker_state = None
+
+
+def _init_worker(lm, features_dict, summary_logic):
+    global _worker_state
+    # Ctrl+C stops the server from the main process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_state = (lm, features_dict, summary_logic)
+
+
+def _worker_batch(items):
+    lm, features_dict, summary_logic = _worker_state
+    return extract_batch(lm, items, features_dict, summary_logic)
+
+
+class ExtractionService:
+    def __init__(self, lm, features_dict=features, summary_logic=summary_logic, jobs=1, max_batch=32,
+                 batch_window=0.005, max_queue=256, timeout=None, start=True):
+        """
+        Configures the service and, with `start`, starts its dispatcher (and worker processes).
+
+        Args:
+            lm (LMeasureWrapper): Wrapper used for the extractions.
+            features_dict (dict, optional): Feature names to L-Measure flags. Default is `features`.
+            summary_logic (dict, optional): {column_name: (operation, output_label)}.
+            jobs (int, optional): Worker processes, each running one batch at a time. Default is 1, which runs
+                batches in a thread of this process. Values below 1 use one worker per CPU.
+            max_batch (int, optional): Maximum number of neurons per batch. Default is 32.
+            batch_window (float, optional): Seconds a batch waits for more requests after its first one.
+                Default is 0.005.
+            max_queue (int, optional): Requests waiting for a batch beyond which `submit` raises ServiceBusy.
+                Default is 256.
+            timeout (float, optional): Seconds after which a running batch is abandoned: its requests fail
+                with TimeoutError and the worker processes are killed and replaced, the other batches they
+                were running being submitted again. Batches then always run in worker processes, even with
+                `jobs` 1. Default is no timeout.
+            start (bool, optional): Start processing right away. Default is True.
+
+        Attributes:
+            stats (dict): Counters: requests, rejected, batches, neurons, errors.
+        """
+        if jobs is None or jobs < 1:
+            jobs = os.cpu_count() or 1
+        self.lm = lm
+        self.features_dict = features_dict
+        self.summary_logic = summary_logic
+        self.jobs = jobs
+        self.max_batch = max(1, max_batch)
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.stats = {"requests": 0, "rejected": 0, "batches": 0, "neurons": 0, "errors": 0}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._slots = threading.Semaphore(jobs)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._dispatcher = None
+        self._watchdog = None
+        self._closing = threading.Event()
+        # Batches running in the worker processes: executor future to (request futures, items, start time)
+        self._running = {}
+        self._pool_lock = threading.Lock()
+        if start:
+            self.start()
+
+    def start(self):
+        """Starts the dispatcher thread and the worker processes."""
+        if self._dispatcher is not None:
+            return
+        if self.jobs > 1 or self.timeout is not None:
+            self._executor = self._new_pool()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="morphomeasure-dispatch", daemon=True)
+        self._dispatcher.start()
+        if self.timeout is not None:
+            self._watchdog = threading.Thread(target=self._watch, name="morphomeasure-watchdog", daemon=True)
+            self._watchdog.start()
+
+    def _new_pool(self):
+        return process_pool(
+            self.jobs, functools.partial(_init_worker, self.lm, self.features_dict, self.summary_logic)
+        )
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def submit(self, swc_path, tags, name=None):
+        """
+        Queues the extraction of one neuron.
+
+        Parameters:
+            swc_path (str): Path to the SWC file; it must exist until the returned future is done.
+            tags (list of str): Tags to extract.
+            name (str, optional): Neuron name in the result. Default: the file name without extension.
+
+        Returns:
+            concurrent.futures.Future: Resolves to a result of `extract_batch`, or raises its exception.
+
+        Raises:
+            ServiceBusy: If the queue is full.
+        """
+        if name is None:
+            name = swc_stem(os.path.basename(swc_path))
+        future = Future()
+        try:
+            self._queue.put_nowait(((name, swc_path, tuple(tags)), future))
+        except queue.Full:
+            self._count("rejected")
+            raise ServiceBusy(f"{self._queue.maxsize} requests are already waiting") from None
+        self._count("requests")
+        return future
+
+    def _next_batch(self):
+        """Waits for a request, then collects the ones that arrive within the batch window."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while batch[-1] is not None and len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        stop = False
+        while not stop:
+            # Wait for a free worker first, so that requests keep coalescing in the queue meanwhile
+            self._slots.acquire()
+            batch = self._next_batch()
+            if batch[-1] is None:
+                stop = True
+                batch.pop()
+            # Requests whose client gave up before their batch started are dropped
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                self._slots.release()
+                continue
+            self._count("batches")
+            self._count("neurons", len(batch))
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            if self._executor is None:
+                try:
+                    self._deliver(futures, extract_batch(self.lm, items, self.features_dict, self.summary_logic))
+                except Exception as e:
+                    self._deliver(futures, [e] * len(futures))
+                finally:
+                    self._slots.release()
+            else:
+                self._submit(futures, items)
+
+    def _submit(self, futures, items):
+        with self._pool_lock:
+            done = self._executor.submit(_worker_batch, items)
+            self._running[done] = (futures, items, time.monotonic())
+        done.add_done_callback(lambda done, futures=futures: self._finish(futures, done))
+
+    def _watch(self):
+        """Abandons the batches that run for more than `timeout` seconds (see `__init__`)."""
+        while not self._closing.wait(min(self.timeout / 4, 1.0)):
+            now = time.monotonic()
+            with self._pool_lock:
+                if all(now - start <= self.timeout for _, _, start in self._running.values()):
+                    continue
+                running, self._running = self._running, {}
+                pool, self._executor = self._executor, self._new_pool()
+            # The pool has no way to stop one call: kill all its workers
+            _terminate_pool(pool)
+            for futures, items, start in running.values():
+                if now - start > self.timeout:
+                    error = TimeoutError(f"Extraction did not finish within {self.timeout:g} s")
+                    self._deliver(futures, [error] * len(futures))
+                    self._slots.release()
+                else:
+                    self._submit(futures, items)
+
+    def _finish(self, futures, done):
+        with self._pool_lock:
+            if self._running.pop(done, None) is None:
+                # Abandoned by the watchdog, which already answered or resubmitted its requests
+                return
+        try:
+            results = done.result()
+        except Exception as e:
+            results = [e] * len(futures)
+        self._deliver(futures, results)
+        self._slots.release()
+
+    def _deliver(self, futures, results):
+        for future, result in zip(futures, results):
+            if isinstance(result, BaseException):
+                self._count("errors")
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def health(self):
+        """Returns the queue depth and counters."""
+        with self._lock:
+            return {"queued": self._queue.qsize(), "max_queue": self._queue.maxsize, **self.stats}
+
+    def close(self):
+        """Finishes the queued requests and stops the dispatcher and workers."""
+        if self._dispatcher is not None:
+            self._queue.put(None)
+            self._dispatcher.join()
+            self._dispatcher = None
+        if self._watchdog is not None:
+            # Wait for the running batches, which the watchdog still stops when they take too long
+            for _ in range(self.jobs):
+                self._slots.acquire()
+            for _ in range(self.jobs):
+                self._slots.release()
+            self._closing.set()
+            self._watchdog.join()
+            self._watchdog = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def _json_value(value):
+    """Summary or table value as JSON: NaN and missing values become null."""
+    if value is None:
+        return None
+    value = value.item() if isinstance(value, np.generic) else value
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def result_json(result):
+    """JSON document of an `extract_batch` result."""
+    return {
+        "neuron": result["neuron"],
+        "tags": {
+            tag: {
+                "branch": {col: [_json_value(v) for v in values] for col, values in df.to_dict(orient="list").items()},
+                "summary": {k: _json_value(v) for k, v in result["summary"][tag].items()},
+            }
+            for tag, df in result["branch"].items()
+        },
+        "combined": {k: _json_value(v) for k, v in result["combined"].items()},
+    }
+
+
+def result_arrow(result):
+    """Arrow IPC stream of an `extract_batch` result (see the module notes)."""
+    import pyarrow as pa
+
+    tables = [
+        df.apply(pd.to_numeric, errors="coerce").astype("float64").assign(tag=tag)
+        for tag, df in result["branch"].items()
+    ]
+    branch = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame({"tag": []})
+    branch = branch[["tag"] + [c for c in branch.columns if c != "tag"]]
+    document = result_json(result)
+    summary = {"neuron": document["neuron"], "combined": document["combined"],
+               "tags": {tag: entry["summary"] for tag, entry in document["tags"].items()}}
+    table = pa.Table.from_pandas(branch, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"morphomeasure.summary"] = json.dumps(summary).encode()
+    table = table.replace_schema_metadata(metadata)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+class _BadRequest(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Keep the console quiet; errors are returned to the client
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=()):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path == "/health":
+            self._send(200, self.server.service.health())
+        else:
+            self._send(404, {"error": "Not found"})
+
+    def _resolve_path(self, path):
+        root = self.server.swc_root
+        if root is None:
+            raise _BadRequest(403, "Path requests are disabled: the server has no SWC root directory")
+        if not isinstance(path, str):
+            raise _BadRequest(400, "Expected 'path' to be a string")
+        resolved = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([resolved, root]) != root:
+            raise _BadRequest(403, "Path is outside of the served SWC directory")
+        if not os.path.isfile(resolved):
+            raise _BadRequest(404, f"SWC file not found: {path}")
+        return resolved
+
+    def _parse_request(self, body):
+        """Returns (path or None, SWC text or None, tags, name, format) of an /extract request."""
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+        if content_type == "application/json":
+            try:
+                request = json.loads(body)
+            except ValueError:
+                raise _BadRequest(400, "Request body is not valid JSON") from None
+            if not isinstance(request, dict) or ("path" in request) == ("swc" in request):
+                raise _BadRequest(400, "Expected a JSON object with either 'path' or 'swc'")
+            path, text = request.get("path"), request.get("swc")
+            tags, name, fmt = request.get("tags"), request.get("name"), request.get("format")
+        else:
+            path, text = None, body.decode(errors="replace")
+            tags, name, fmt = query.get("tag"), query.get("name", [None])[0], None
+        fmt = fmt or query.get("format", [None])[0]
+        if fmt is None:
+            fmt = "arrow" if ARROW_MEDIA_TYPE in self.headers.get("Accept", "") else "json"
+        if fmt not in ("json", "arrow"):
+            raise _BadRequest(400, f"Unknown format '{fmt}', expected json or arrow")
+        tags = [str(t) for t in (tags or self.server.default_tags)]
+        return path, text, tags, name, fmt
+
+    def do_POST(self):
+        if urllib.parse.urlsplit(self.path).path != "/extract":
+            self._send(404, {"error": "Not found"})
+            return
+        upload = None
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > _MAX_BODY:
+                raise _BadRequest(413, f"Request body is larger than {_MAX_BODY} bytes")
+            path, text, tags, name, fmt = self._parse_request(self.rfile.read(length))
+            if fmt == "arrow":
+                try:
+                    import pyarrow  # noqa: F401
+                except ImportError:
+                    raise _BadRequest(406, "The arrow format requires pyarrow") from None
+            if text is not None:
+                fd, upload = tempfile.mkstemp(suffix=".swc")
+                with os.fdopen(fd, "w") as f:
+                    f.write(text)
+                path, name = upload, name or "upload"
+            else:
+                path = self._resolve_path(path)
+            future = self.server.service.submit(path, tags, name)
+            try:
+                result = future.result(timeout=self.server.request_timeout)
+            except FutureTimeout:
+                if future.done():
+                    # The extraction itself timed out (FutureTimeout is TimeoutError on Python 3.11+)
+                    raise
+                # Not extracted if it is still queued
+                future.cancel()
+                raise TimeoutError(f"No result within {self.server.request_timeout:g} s") from None
+            if fmt == "arrow":
+                self._send(200, result_arrow(result), ARROW_MEDIA_TYPE)
+            else:
+                self._send(200, result_json(result))
+        except _BadRequest as e:
+            self._send(e.status, {"error": str(e)})
+        except ServiceBusy as e:
+            self._send(503, {"error": f"Server busy: {e}"}, headers=[("Retry-After", "1")])
+        except TimeoutError as e:
+            self._send(504, {"error": f"Timed out: {e}"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            if upload is not None:
+                os.remove(upload)
+
+
+def make_server(service, host="127.0.0.1", port=8765, swc_root=None, default_tags=("3.0", "4.0"),
+                request_timeout=None):
+    """
+    Builds the HTTP server of a service; call `serve_forever()` on it, or `shutdown()` from another thread.
+
+    Parameters:
+        service (ExtractionService): The service answering /extract.
+        host (str): Address to bind. Default: localhost only.
+        port (int): Port to bind; 0 picks a free one (see `server.server_address`).
+        swc_root (str, optional): Directory that 'path' requests are resolved against and must stay in.
+            Default: none, 'path' requests are refused with 403 and only SWC content is accepted.
+        default_tags (tuple of str): Tags of requests that do not give any. Default: basal and apical.
+        request_timeout (float, optional): Seconds a request waits for its result before it is answered with
+            504. Default: no timeout.
+
+    Returns:
+        ThreadingHTTPServer: One thread per connection; extractions go through the service's queue.
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    server.swc_root = os.path.realpath(swc_root) if swc_root is not None else None
+    server.default_tags = tuple(default_tags)
+    server.request_timeout = request_timeout
+    return server
@@ -0,0 +1,192 @@
+# morphomeasure/sources.py
+"""
+This module reads SWC files from zip and tar archives and gzip-compressed .swc.gz files without extracting them.
+Classes:
+    SWCBytes: An SWC file held in memory, e.g. an archive member.
+Functions:
+    is_archive(path): Whether a path is a zip or tar archive (optionally gz, bz2 or xz compressed).
+    scan_archive(archive, include, exclude, recursive): Lists the SWC members of an archive with their digests.
+    iter_archive(archive, members): Streams members of an archive as SWCBytes.
+    open_tree(path, sidecar): Parses an SWC or .swc.gz file.
+Notes:
+    - Members are read one at a time. Tar archives are opened in stream mode ('r|*'), so a .tar.gz is
+      decompressed sequentially without seeking; zip members are decompressed individually.
+    - Member names are relative paths with '/' separators, matched against the same glob patterns as the files
+      of a directory (see `morphomeasure.discovery`). Members with absolute paths or '..' components are
+      skipped, since their names become output paths.
+    - The native backend parses SWCBytes in memory; backends that need a path (the L-Measure executable and
+      the worker process) get a temporary file that is deleted after use.
+    - Digests are taken over the decompressed SWC bytes, so a member and the same file on disk share feature
+      cache entries.
+"""
+
+import contextlib
+import fnmatch
+import gzip
+import os
+import posixpath
+import tarfile
+import tempfile
+import zipfile
+import zlib
+
+from .cache import bytes_digest
+from .costmodel import swc_size
+from .discovery import SWC_PATTERNS
+from .swc import open_swc, parse_swc
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+class SWCBytes:
+    __slots__ = ("name", "raw", "_data", "_digest")
+
+    def __init__(self, name, data):
+        """
+        Wraps the content of an SWC file.
+
+        Args:
+            name (str): Relative path of the file, e.g. its archive member name.
+            data (bytes): Its content; gzip-compressed content is decompressed when `name` ends with '.gz'.
+        """
+        self.name = name
+        self.raw = data
+        self._data = None
+        self._digest = None
+
+    @property
+    def data(self):
+        """
+        The SWC content, decompressed on first use.
+
+        Raises:
+            OSError, EOFError, zlib.error: If a '.gz' file is not valid gzip data.
+        """
+        if self._data is None:
+            self._data = gzip.decompress(self.raw) if self.name.endswith(".gz") else self.raw
+        return self._data
+
+    @classmethod
+    def from_path(cls, path, name=None):
+        """Reads an SWC file (or a .swc.gz file) from disk."""
+        with open(path, "rb") as f:
+            return cls(name or os.path.basename(path), f.read())
+
+    @property
+    def digest(self):
+        """
+        SHA-256 of the (decompressed) content, as `cache.file_digest` of the same file on disk. Corrupt gzip
+        data is hashed as is, so that the file is listed and fails when it is processed.
+        """
+        if self._digest is None:
+            try:
+                self._digest = bytes_digest(self.data)
+            except (OSError, EOFError, zlib.error):
+                self._digest = bytes_digest(self.raw)
+        return self._digest
+
+    def tree(self):
+        """Parses the content (see `swc.parse_swc`)."""
+        return parse_swc(self.data.decode(errors="replace"))
+
+    @contextlib.contextmanager
+    def as_file(self):
+        """Context manager giving the path of a temporary copy, for backends that need a file."""
+        fd, path = tempfile.mkstemp(suffix=".swc")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.data)
+            yield path
+        finally:
+            os.remove(path)
+
+
+def is_archive(path):
+    """Returns True for an existing zip or tar archive, recognized by its extension."""
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _member_name(name):
+    """Normalized relative member path, or None when it would leave the output directory."""
+    name = posixpath.normpath(name.replace("\\", "/"))
+    if name.startswith("/") or name == ".." or name.startswith("../") or name == ".":
+        return None
+    return name
+
+
+def _members(archive):
+    """Yields (name, read) for every regular member, in archive order; read() returns its bytes."""
+    if archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as z:
+            for info in z.infolist():
+                if not info.is_dir():
+                    yield info.filename, lambda info=info: z.read(info)
+    else:
+        with tarfile.open(archive, "r|*") as t:
+            for member in t:
+                if member.isfile():
+                    yield member.name, lambda member=member: t.extractfile(member).read()
+
+
+def _selected(name, include, exclude, recursive):
+    if not recursive and "/" in name:
+        return False
+    return any(fnmatch.fnmatchcase(name, p) for p in include) and not any(
+        fnmatch.fnmatchcase(name, p) for p in exclude
+    )
+
+
+def scan_archive(archive, include=SWC_PATTERNS, exclude=(), recursive=True, sizes=None):
+    """
+    Lists the SWC members of an archive, reading it once.
+
+    Parameters:
+        archive (str): Path to the archive.
+        include, exclude (iterable of str): Glob patterns of the member paths to keep and to leave out.
+        recursive (bool): Also keep members in subdirectories of the archive. Default is True.
+        sizes (dict, optional): Filled with member name to (bytes, nodes) (see `costmodel.swc_size`), so the
+            members need not be read again to plan the run.
+
+    Returns:
+        dict: Member name to digest of its decompressed content, sorted by name.
+    """
+    include, exclude = tuple(include), tuple(exclude)
+    digests = {}
+    for raw_name, read in _members(archive):
+        name = _member_name(raw_name)
+        # A name stored twice keeps its first member, as in iter_archive
+        if name is not None and name not in digests and _selected(name, include, exclude, recursive):
+            member = SWCBytes(name, read())
+            digests[name] = member.digest
+            if sizes is not None:
+                sizes[name] = swc_size(member)
+    return dict(sorted(digests.items()))
+
+
+def iter_archive(archive, members):
+    """
+    Streams members of an archive.
+
+    Parameters:
+        archive (str): Path to the archive.
+        members (iterable of str): Names, as returned by `scan_archive`, of the members to read.
+
+    Yields:
+        SWCBytes: One per requested member, in archive order.
+    """
+    wanted = set(members)
+    for raw_name, read in _members(archive):
+        name = _member_name(raw_name)
+        if name in wanted:
+            wanted.discard(name)
+            yield SWCBytes(name, read())
+
+
+def open_tree(path, sidecar=None):
+    """
+    Returns the SWCTree of an SWC file: .swc.gz files are decompressed in memory, other files are opened with
+    `swc.open_swc` (shared parsed tree, optional sidecar).
+    """
+    if path.endswith(".gz"):
+        return SWCBytes.from_path(path).tree()
+    return open_swc(path, sidecar)
@@ -0,0 +1,255 @@
+# morphomeasure/store.py
+"""
+This module keeps the results of batch runs in a SQLite database, so they can be queried without reading the
+per-neuron tables back.
+Classes:
+    ResultStore: SQLite database of branch values and summary rows, updated in place as neurons are processed.
+Notes:
+    - Values are stored in long form: branch_values(neuron_id, tag, feature, branch, value) for the rows of the
+      Branch_Morphometrics tables, and summary_values(neuron_id, tag, feature, value) for the per-tag summary
+      rows and, under the tag 'combined', the summary across tags. Missing (NaN) values are not stored.
+    - The primary keys index both tables by neuron, tag and feature; a second index by (feature, tag) serves
+      queries across neurons, such as every apical Fractal_Dim value. The views branch_rows and summary_rows
+      join in the neuron name and tag label for ad-hoc SQL:
+          SELECT neuron, value FROM summary_rows WHERE label = 'apical_dendrites' AND feature = 'Fractal_Dim'
+    - Neurons are buffered and written in batches, one transaction each. Re-processing a neuron upserts its
+      rows: values that did not change are not rewritten, and rows that no longer exist are deleted.
+    - Each neuron stores the digest of its SWC content and of the run configuration; `run_batch` processes a
+      neuron again when they differ from the current ones, even if its run manifest is up to date.
+    - The database uses write-ahead logging, so it can be read while a run writes to it.
+"""
+
+import math
+import sqlite3
+import time
+
+import pandas as pd
+
+from .discovery import swc_stem
+from .features import TAG_LABELS
+
+COMBINED_TAG = "combined"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS neurons (
+    id INTEGER PRIMARY KEY,
+    swc_file TEXT NOT NULL UNIQUE,
+    neuron TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    config TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS neurons_neuron ON neurons (neuron);
+CREATE TABLE IF NOT EXISTS tag_labels (
+    tag TEXT PRIMARY KEY,
+    label TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS branch_values (
+    neuron_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    branch INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (neuron_id, tag, feature, branch)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS branch_values_feature ON branch_values (feature, tag);
+CREATE TABLE IF NOT EXISTS summary_values (
+    neuron_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (neuron_id, tag, feature)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS summary_values_feature ON summary_values (feature, tag);
+CREATE VIEW IF NOT EXISTS branch_rows AS
+    SELECT n.neuron, n.swc_file, b.tag, l.label, b.feature, b.branch, b.value
+    FROM branch_values b JOIN neurons n ON n.id = b.neuron_id LEFT JOIN tag_labels l ON l.tag = b.tag;
+CREATE VIEW IF NOT EXISTS summary_rows AS
+    SELECT n.neuron, n.swc_file, s.tag, l.label, s.feature, s.value
+    FROM summary_values s JOIN neurons n ON n.id = s.neuron_id LEFT JOIN tag_labels l ON l.tag = s.tag;
+"""
+
+
+def _present(value):
+    return value is not None and not (isinstance(value, float) and math.isnan(value))
+
+
+def _branch_values(branch_tables):
+    """{(tag, feature, branch): value} of the non-missing cells of {tag: branch table}."""
+    values = {}
+    for tag, df in branch_tables.items():
+        for feature in df.columns:
+            column = pd.to_numeric(df[feature], errors="coerce").to_numpy(dtype=float)
+            for branch, value in enumerate(column.tolist()):
+                if not math.isnan(value):
+                    values[(tag, feature, branch)] = value
+    return values
+
+
+def _summary_values(tag_summaries, combined_summary):
+    """{(tag, feature): value} of the summary rows of one neuron."""
+    rows = dict(tag_summaries)
+    if combined_summary is not None:
+        rows[COMBINED_TAG] = combined_summary
+    return {
+        (tag, feature): float(value)
+        for tag, row in rows.items()
+        for feature, value in row.items()
+        if _present(value)
+    }
+
+
+class ResultStore:
+    def __init__(self, path, batch_size=64, timeout=60.0):
+        """
+        Opens (or creates) a results database.
+
+        Args:
+            path (str): Path of the SQLite file.
+            batch_size (int, optional): Neurons buffered before they are written in one transaction.
+                Default is 64.
+            timeout (float, optional): Seconds to wait for another process (e.g. another shard) holding
+                the write lock. Default is 60.
+
+        Attributes:
+            path (str): Path of the database.
+            neurons (dict): SWC file (relative path) to (digest, config digest) of every stored neuron.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.executescript(_SCHEMA)
+            self.conn.executemany(
+                "INSERT INTO tag_labels (tag, label) VALUES (?, ?) ON CONFLICT (tag) DO UPDATE SET label = excluded.label",
+                [*TAG_LABELS.items(), (COMBINED_TAG, COMBINED_TAG)],
+            )
+        self.neurons = {
+            swc_file: (digest, config)
+            for swc_file, digest, config in self.conn.execute("SELECT swc_file, digest, config FROM neurons")
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def current(self, swc_file, digest, config):
+        """Returns True if the stored rows of `swc_file` were computed from the same content and configuration."""
+        return self.neurons.get(swc_file) == (digest, config)
+
+    def add(self, swc_file, digest, config, branch_tables, tag_summaries, combined_summary):
+        """
+        Queues the results of one neuron, written with the next batch.
+
+        Parameters:
+            swc_file (str): SWC file name, relative to the input directory.
+            digest (str): Digest of the SWC content.
+            config (str): Digest of the run configuration (`RunManifest.config_digest`).
+            branch_tables (dict): Tag to Branch_Morphometrics table (see `lmwrapper.branch_table`).
+            tag_summaries (dict): Tag to summary row.
+            combined_summary (dict or None): Summary row across all tags.
+        """
+        self._pending.append((
+            swc_file, digest, config, _branch_values(branch_tables), _summary_values(tag_summaries, combined_summary)
+        ))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the queued neurons in one transaction."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        with self.conn:
+            for swc_file, digest, config, branch_values, summary_values in pending:
+                self._write(swc_file, digest, config, branch_values, summary_values)
+        for swc_file, digest, config, _, _ in pending:
+            self.neurons[swc_file] = (digest, config)
+
+    def _write(self, swc_file, digest, config, branch_values, summary_values):
+        self.conn.execute(
+            "INSERT INTO neurons (swc_file, neuron, digest, config, updated) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (swc_file) DO UPDATE SET digest = excluded.digest, config = excluded.config, "
+            "updated = excluded.updated",
+            (swc_file, swc_stem(swc_file), digest, config, time.time()),
+        )
+        (neuron_id,) = self.conn.execute("SELECT id FROM neurons WHERE swc_file = ?", (swc_file,)).fetchone()
+        self._upsert(neuron_id, "branch_values", ("tag", "feature", "branch"), branch_values)
+        self._upsert(neuron_id, "summary_values", ("tag", "feature"), summary_values)
+
+    def _upsert(self, neuron_id, table, key_columns, values):
+        """Makes the rows of one neuron in `table` equal to `values` ({key tuple: value}), touching only changes."""
+        keys = ", ".join(key_columns)
+        stored = self.conn.execute(f"SELECT {keys} FROM {table} WHERE neuron_id = ?", (neuron_id,)).fetchall()
+        match = " AND ".join(f"{column} = ?" for column in key_columns)
+        self.conn.executemany(
+            f"DELETE FROM {table} WHERE neuron_id = ? AND {match}",
+            [(neuron_id, *key) for key in stored if tuple(key) not in values],
+        )
+        placeholders = ", ".join("?" for _ in key_columns)
+        self.conn.executemany(
+            f"INSERT INTO {table} (neuron_id, {keys}, value) VALUES (?, {placeholders}, ?) "
+            f"ON CONFLICT (neuron_id, {keys}) DO UPDATE SET value = excluded.value WHERE value != excluded.value",
+            [(neuron_id, *key, value) for key, value in values.items()],
+        )
+
+    def prune(self, swc_files):
+        """Deletes the neurons that are not in `swc_files`, e.g. SWC files removed from the input directory."""
+        self.flush()
+        keep = set(swc_files)
+        removed = [(f,) for f in self.neurons if f not in keep]
+        if not removed:
+            return
+        with self.conn:
+            for table in ("branch_values", "summary_values"):
+                self.conn.executemany(
+                    f"DELETE FROM {table} WHERE neuron_id = (SELECT id FROM neurons WHERE swc_file = ?)", removed
+                )
+            self.conn.executemany("DELETE FROM neurons WHERE swc_file = ?", removed)
+        for (swc_file,) in removed:
+            del self.neurons[swc_file]
+
+    def query(self, feature=None, tag=None, neuron=None, level="branch"):
+        """
+        Reads stored values.
+
+        Parameters:
+            feature (str, optional): Feature (column of the branch or summary tables). Default: all.
+            tag (str, optional): Tag ('4.0'), its label ('apical_dendrites') or 'combined'. Default: all.
+            neuron (str, optional): Glob pattern of neuron names (relative paths without extension),
+                e.g. 'labX/*'. Default: all.
+            level (str): 'branch' for the branch values, 'summary' for the summary rows.
+
+        Returns:
+            pd.DataFrame: Columns neuron, tag, feature, (branch,) value.
+        """
+        if level not in ("branch", "summary"):
+            raise ValueError(f"Unknown level '{level}', expected 'branch' or 'summary'")
+        self.flush()
+        columns = "neuron, tag, feature, branch, value" if level == "branch" else "neuron, tag, feature, value"
+        clauses, params = [], []
+        if feature is not None:
+            clauses.append("feature = ?")
+            params.append(feature)
+        if tag is not None:
+            clauses.append("(tag = ? OR label = ?)")
+            params += [tag, tag]
+        if neuron is not None:
+            clauses.append("neuron GLOB ?")
+            params.append(neuron)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = "neuron, tag, feature, branch" if level == "branch" else "neuron, tag, feature"
+        return pd.read_sql_query(
+            f"SELECT {columns} FROM {level}_rows{where} ORDER BY {order}", self.conn, params=params
+        )
+
+    def close(self):
+        """Writes the queued neurons and closes the database."""
+        if self.conn is not None:
+            self.flush()
+            self.conn.close()
+            self.conn = None
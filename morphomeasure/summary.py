@@ -0,0 +1,266 @@
+# morphomeasure/summary.py
+"""
+This module computes the per-neuron summary morphometrics from the per-feature tables with grouped reductions.
+Functions:
+    stack_frames(frames): Stacks per-(neuron, tag) feature tables into one numeric table.
+    summarize(frames, summary_logic, combined): Computes the per-tag and combined summaries of every neuron.
+    summarize_stacked(stacked, tag_keys, summary_logic, combined): Same, from an already stacked table.
+    summary_spec(columns, summary_logic): Lists the (output label, operation, source column) triples to compute.
+Notes:
+    - The feature tables of all neurons and tags are converted to numbers once and stacked; each summary
+      operation is then a single grouped reduction over (neuron, tag), and over neuron alone for the
+      combined summary, instead of a Python loop over neurons, tags and columns.
+    - Supported operations: 'sum', 'mean', 'max', 'min', 'first', 'count', 'median', 'std' (sample standard
+      deviation) and percentiles written 'p<q>', e.g. 'p90' or 'p2.5'. Missing values are skipped.
+    - 'sum', 'mean' and 'first' are computed with `np.add.reduceat` and indexing on the values sorted by group
+      (in their original order within a group); the other operations are pandas grouped reductions. Sums may
+      differ from the per-neuron `pd.Series.sum` in the last bits, as any change of summation order does.
+    - 'first' is the value of the first row of the group (for the combined summary, the first row of the first
+      tag), which is how the tag-independent Soma_Surface is summarized.
+    - Besides `summary_logic`, every summary contains Sum_EucDistance and Sum_PathDistance, ABEL (mean of
+      Branch_pathlength x Contraction, per branch) and BAPL (mean of Branch_pathlength), plus their terminal
+      and internal variants. ABEL/BAPL are None when their source columns are missing.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from .features import summary_logic
+
+_PERCENTILE = re.compile(r"^p(\d+(?:\.\d+)?)$")
+_SIMPLE_OPS = ("sum", "mean", "max", "min", "count", "median", "std")
+
+# (output label, operation, source columns); ABEL columns are products of two features
+_EXTRA_SUMMARIES = (
+    ("Sum_EucDistance", "sum", ("EucDistance",)),
+    ("Sum_PathDistance", "sum", ("PathDistance",)),
+    ("ABEL", "mean", ("Branch_pathlength", "Contraction")),
+    ("ABEL_Terminal", "mean", ("Branch_pathlength_terminal", "Contraction_terminal")),
+    ("ABEL_Internal", "mean", ("Branch_pathlength_internal", "Contraction_internal")),
+    ("BAPL", "mean", ("Branch_pathlength",)),
+    ("BAPL_Terminal", "mean", ("Branch_pathlength_terminal",)),
+    ("BAPL_Internal", "mean", ("Branch_pathlength_internal",)),
+)
+# Summaries that are reported as None, rather than left out, when their source columns are missing
+_ALWAYS_REPORTED = {"ABEL", "ABEL_Terminal", "ABEL_Internal", "BAPL", "BAPL_Terminal", "BAPL_Internal"}
+_EMPTY_RESULTS = {"sum": 0.0, "count": 0, "first": None}
+# Operations computed from the group-sorted values with NumPy rather than by pandas' groupby
+_BLOCK_OPS = ("sum", "mean", "first")
+
+
+def _check_op(op):
+    if op in _SIMPLE_OPS or op == "first" or _PERCENTILE.match(op):
+        return op
+    raise ValueError(f"Unknown summary operation '{op}'")
+
+
+def summary_spec(columns, summary_logic=summary_logic):
+    """
+    Lists the summaries to compute for tables with the given columns.
+
+    Parameters:
+        columns (iterable of str): Feature columns available.
+        summary_logic (dict): {column_name: (operation, output_label)}.
+
+    Returns:
+        list of tuple: (output_label, operation, source_columns) in output order; source_columns is None
+        for summaries whose columns are missing but that are still reported (as None).
+
+    Raises:
+        ValueError: If an operation is not supported.
+    """
+    columns = set(columns)
+    spec = []
+    for col, (op, out_label) in summary_logic.items():
+        if col in columns:
+            spec.append((out_label, _check_op(op), (col,)))
+    for out_label, op, sources in _EXTRA_SUMMARIES:
+        if all(col in columns for col in sources):
+            spec.append((out_label, op, sources))
+        elif out_label in _ALWAYS_REPORTED:
+            spec.append((out_label, op, None))
+    return spec
+
+
+def stack_frames(frames):
+    """
+    Stacks per-feature tables into one numeric table.
+
+    Parameters:
+        frames (list of tuple): (neuron, tag, DataFrame) triples, e.g. the padded tables returned by
+            `LMeasureWrapper.extract_features`.
+
+    Returns:
+        pd.DataFrame: float64 columns indexed by (neuron, tag, row); text and missing values become NaN.
+    """
+    if not frames:
+        return pd.DataFrame(index=pd.MultiIndex.from_tuples([], names=["neuron", "tag", "row"]))
+    stacked = pd.concat(
+        [df for _, _, df in frames],
+        keys=[(neuron, tag) for neuron, tag, _ in frames],
+        names=["neuron", "tag", "row"],
+    )
+    return stacked.apply(pd.to_numeric, errors="coerce").astype("float64")
+
+
+def _reduce(grouped, op):
+    if op in _SIMPLE_OPS:
+        return getattr(grouped, op)()
+    return grouped.quantile(float(_PERCENTILE.match(op).group(1)) / 100)
+
+
+def _group_blocks(values, labels, codes, n_groups):
+    """
+    Sorts the rows of the `labels` columns of `values` by group code, keeping their order within a group
+    (rows with code -1 are left out), and returns (data, starts, sizes): a new float64 array with one row per
+    label, and the first column and number of columns of each of the `n_groups` groups in `data`.
+    """
+    # The stacked table is one float64 block: transposed, each column is a contiguous row
+    data = values.to_numpy(dtype="float64").T[values.columns.get_indexer(labels)]
+    if len(codes) and (codes[0] < 0 or (np.diff(codes) < 0).any()):
+        order = np.argsort(codes, kind="stable")
+        order = order[codes[order] >= 0]
+        codes = codes[order]
+        data = data[:, order]
+    bounds = np.searchsorted(codes, np.arange(n_groups + 1))
+    return data, bounds[:-1], np.diff(bounds)
+
+
+def _block_reductions(data, starts, sizes, spans):
+    """
+    Computes 'sum', 'mean' and 'first' per group with one reduceat or indexing per operation.
+
+    Parameters:
+        data, starts, sizes: As returned by `_group_blocks`; the rows summed have their missing values set to 0.
+        spans (dict): Operation to the slice of the rows of `data` it reduces.
+
+    Returns:
+        dict: Operation to an array with one row per group and one column per row of its span.
+    """
+    nonempty = sizes > 0
+    starts = starts[nonempty]
+    results = {op: np.full((len(sizes), span.stop - span.start), np.nan) for op, span in spans.items()}
+    if "sum" in results:
+        results["sum"][:] = 0.0
+    if not len(starts):
+        return results
+    if "first" in spans:
+        results["first"][nonempty] = data[spans["first"], starts].T
+    if "sum" in spans:
+        summed = data[spans["sum"]]
+        np.putmask(summed, np.isnan(summed), 0.0)
+        results["sum"][nonempty] = np.add.reduceat(summed, starts, axis=1).T
+    if "mean" in spans:
+        averaged = data[spans["mean"]]
+        present = ~np.isnan(averaged)
+        np.putmask(averaged, ~present, 0.0)
+        counts = np.add.reduceat(present, starts, axis=1, dtype=np.int32).T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            results["mean"][nonempty] = np.add.reduceat(averaged, starts, axis=1).T / counts
+    return results
+
+
+def _grouped_summaries(values, levels, keys, spec):
+    """
+    Computes every summary of `spec` for the groups of `values` over `levels`, with one grouped reduction
+    per operation, and returns {key: {output_label: value}} for every key in `keys`.
+    """
+    index = pd.MultiIndex.from_tuples(keys, names=levels) if len(levels) > 1 else pd.Index(keys, name=levels[0])
+    by_op = {}
+    for out_label, op, sources in spec:
+        if sources is not None:
+            by_op.setdefault(op, []).append(out_label)
+
+    results = {}
+    sizes = np.zeros(len(keys), dtype=np.int64)
+    if len(values):
+        grouped = values.groupby(level=levels, sort=False)
+        # Position in `keys` of the group of every row (groups are numbered in order of appearance)
+        codes = index.get_indexer(grouped.size().index)[grouped.ngroup().to_numpy()]
+        # The columns of each NumPy-computed operation are adjacent rows of one array
+        block_labels, spans = [], {}
+        for op in _BLOCK_OPS:
+            if op in by_op:
+                spans[op] = slice(len(block_labels), len(block_labels) + len(by_op[op]))
+                block_labels += by_op[op]
+        data, starts, sizes = _group_blocks(values, block_labels, codes, len(keys))
+        blocks = _block_reductions(data, starts, sizes, spans)
+        for op, labels in by_op.items():
+            if op in _BLOCK_OPS:
+                for j, label in enumerate(labels):
+                    results[label] = blocks[op][:, j]
+                continue
+            reduced = _reduce(grouped[labels], op).reindex(index)
+            for label in labels:
+                results[label] = reduced[label].to_numpy()
+
+    summaries = {}
+    for i, key in enumerate(keys):
+        summary = {}
+        for out_label, op, sources in spec:
+            if sources is None:
+                summary[out_label] = None
+            elif sizes[i] == 0:
+                # Empty table: same results as reducing an empty column
+                summary[out_label] = _EMPTY_RESULTS.get(op, float("nan"))
+            else:
+                summary[out_label] = results[out_label][i]
+        summaries[key] = summary
+    return summaries
+
+
+def summarize(frames, summary_logic=summary_logic, combined=True):
+    """
+    Computes the per-tag and combined summaries of a set of neurons.
+
+    Parameters:
+        frames (list of tuple): (neuron, tag, DataFrame) triples, one per neuron and tag, with one column per
+            feature. For the combined summary, the tables of a neuron are pooled in list order.
+        summary_logic (dict, optional): {column_name: (operation, output_label)}. Default is the global
+            'summary_logic'.
+        combined (bool, optional): Also compute the summary across the tags of each neuron. Default is True.
+
+    Returns:
+        tuple: (tag_summaries, combined_summaries) where tag_summaries maps (neuron, tag) and
+        combined_summaries maps neuron to a dict of {output_label: value}. combined_summaries is None
+        when `combined` is False.
+    """
+    tag_keys = [(neuron, tag) for neuron, tag, _ in frames]
+    return summarize_stacked(stack_frames(frames), tag_keys, summary_logic, combined)
+
+
+def summarize_stacked(stacked, tag_keys, summary_logic=summary_logic, combined=True):
+    """
+    Computes the per-tag and combined summaries from a stacked numeric table.
+
+    Parameters:
+        stacked (pd.DataFrame): float64 feature columns indexed by (neuron, tag, row), as returned by
+            `stack_frames`; rows of one (neuron, tag) are that table's padded rows.
+        tag_keys (list of tuple): (neuron, tag) pairs to summarize, in output order.
+        summary_logic (dict, optional): {column_name: (operation, output_label)}.
+        combined (bool, optional): Also compute the summary across the tags of each neuron. Default is True.
+
+    Returns:
+        tuple: (tag_summaries, combined_summaries), as for `summarize`.
+    """
+    spec = summary_spec(stacked.columns, summary_logic)
+
+    # Derived per-branch columns are computed once for all neurons
+    columns = {}
+    for out_label, op, sources in spec:
+        if sources is None:
+            continue
+        column = stacked[sources[0]]
+        for other in sources[1:]:
+            column = column * stacked[other]
+        columns[out_label] = column
+    values = pd.DataFrame(columns, index=stacked.index)
+
+    tag_summaries = _grouped_summaries(values, ["neuron", "tag"], tag_keys, spec)
+    if not combined:
+        return tag_summaries, None
+    neurons = list(dict.fromkeys(neuron for neuron, _ in tag_keys))
+    combined_summaries = _grouped_summaries(values, ["neuron"], neurons, spec)
+    return tag_summaries, combined_summaries
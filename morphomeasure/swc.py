@@ -0,0 +1,429 @@
+# morphomeasure/swc.py
+"""
+This module loads SWC reconstructions into NumPy arrays and derives the tree topology used by the native backend.
+Classes:
+    SWCTree: Node arrays (type, coordinates, radius, parent index) backed by one structured array, plus lazily
+             computed topology such as a CSR child index, topological order, branch segmentation, path
+             distance, branch order and terminal degree.
+Functions:
+    load_swc(path, sidecar): Parses an SWC file into an SWCTree, optionally through a binary sidecar.
+    open_swc(path, sidecar): Like load_swc, but shares the tree of an unchanged file between callers.
+    parse_swc(text): Parses SWC text into an SWCTree.
+    save_sidecar(tree, path, source): Writes a tree and its topology to a binary .npz sidecar.
+Attributes:
+    NODE_DTYPE (numpy.dtype): Structured dtype of the SWC columns.
+Notes:
+    - All topology is computed with vectorized pointer jumping, so no per-node Python loops are needed.
+    - A file may contain several disconnected trees; every root starts its own tree.
+    - A sidecar stores the node records and every topology array, so re-opening a large reconstruction skips
+      both the text parsing and the topology computation. It records the size and modification time of its
+      SWC file and is rebuilt when they change. Sidecars are uncompressed .npz files; NumPy cannot memory-map
+      the members of an .npz archive, but loading them is a plain read of the raw arrays.
+    - `open_swc` keeps the last few trees in memory, keyed by path, size and modification time, so every
+      feature, tag and request on the same file reuses one parse and one set of cached topology arrays.
+"""
+
+import functools
+import hashlib
+import math
+import os
+import tempfile
+
+import numpy as np
+
+NODE_DTYPE = np.dtype([
+    ("id", "<i8"), ("type", "<i4"), ("x", "<f8"), ("y", "<f8"), ("z", "<f8"), ("radius", "<f8"), ("parent", "<i8"),
+])
+
+# Bumped when the sidecar layout or the topology it stores changes
+_SIDECAR_VERSION = 1
+# Topology stored in sidecars; each name is a cached property of SWCTree
+_SIDECAR_TOPOLOGY = (
+    "child_offsets", "child_nodes", "topological_order", "root", "length", "path_distance", "branch_order",
+    "branch_start", "branch_end_nodes", "branch_index", "terminal_degree",
+)
+
+
+def parse_swc(text):
+    """
+    Parses the content of an SWC file.
+
+    Parameters:
+        text (str): SWC content. Comment lines starting with '#' and blank lines are ignored.
+
+    Returns:
+        SWCTree: The parsed reconstruction.
+
+    Raises:
+        ValueError: If a data line has fewer than 7 columns.
+    """
+    lines = [line for line in text.splitlines() if line.strip() and not line.lstrip().startswith('#')]
+    if not lines:
+        return SWCTree(np.zeros(0, dtype=NODE_DTYPE))
+    try:
+        # NumPy's C parser; extra columns are ignored
+        data = np.loadtxt(lines, dtype=float, usecols=range(7), ndmin=2)
+    except ValueError:
+        raise ValueError("SWC data lines must have 7 columns: id type x y z radius parent") from None
+    return SWCTree(data)
+
+
+def _sidecar_path(path, sidecar):
+    if sidecar is True:
+        return path + ".npz"
+    # One directory for every file: name the sidecar after the full path to keep same-named files apart
+    tag = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(sidecar, f"{os.path.basename(path)}.{tag}.npz")
+
+
+def save_sidecar(tree, path, source=None):
+    """
+    Writes a tree, with every topology array computed, to an .npz sidecar, atomically.
+
+    Parameters:
+        tree (SWCTree): The reconstruction.
+        path (str): Destination .npz path.
+        source (tuple, optional): (size, mtime_ns) of the SWC file the tree was read from.
+    """
+    arrays = {name: getattr(tree, name) for name in _SIDECAR_TOPOLOGY}
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f, nodes=tree.nodes, version=_SIDECAR_VERSION,
+                source=np.array(source if source is not None else (-1, -1), dtype=np.int64), **arrays
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _load_sidecar(path, source):
+    try:
+        with np.load(path, allow_pickle=False) as archive:
+            if int(archive["version"]) != _SIDECAR_VERSION or tuple(archive["source"]) != tuple(source):
+                return None
+            tree = SWCTree(archive["nodes"])
+            # Seed the cached properties so that no topology is recomputed
+            tree.__dict__.update({name: archive[name] for name in _SIDECAR_TOPOLOGY})
+        return tree
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def load_swc(path, sidecar=None):
+    """
+    Loads an SWC file from disk.
+
+    Parameters:
+        path (str): Path to the SWC file.
+        sidecar (bool or str, optional): Where to keep a binary sidecar of the tree and its topology: True for
+            `<path>.npz` next to the file, or a directory. The sidecar is used when it matches the file's size
+            and modification time, and (re)written otherwise. Default: no sidecar.
+
+    Returns:
+        SWCTree: The parsed reconstruction.
+    """
+    if sidecar:
+        stat = os.stat(path)
+        source = (stat.st_size, stat.st_mtime_ns)
+        sidecar_path = _sidecar_path(path, sidecar)
+        tree = _load_sidecar(sidecar_path, source)
+        if tree is not None:
+            return tree
+    with open(path) as f:
+        tree = parse_swc(f.read())
+    if sidecar:
+        try:
+            save_sidecar(tree, sidecar_path, source)
+        except OSError:
+            # A read-only location only costs the speed-up
+            pass
+    return tree
+
+
+@functools.lru_cache(maxsize=8)
+def _open_cached(path, size, mtime_ns, sidecar):
+    return load_swc(path, sidecar)
+
+
+def open_swc(path, sidecar=None):
+    """
+    Returns the SWCTree of a file, shared with every other caller while the file is unchanged.
+
+    Parameters:
+        path (str): Path to the SWC file.
+        sidecar (bool or str, optional): See `load_swc`.
+
+    Returns:
+        SWCTree: The reconstruction. It is shared, so callers must not modify its arrays.
+    """
+    stat = os.stat(path)
+    return _open_cached(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sidecar)
+
+
+def _jump_rounds(n):
+    """Pointer-jumping rounds that reach the end of any acyclic chain of `n` nodes."""
+    return math.ceil(math.log2(max(n, 1))) + 1
+
+
+def _pointer_jump_sum(values, parent):
+    """
+    Sums `values` over each node and all of its ancestors, in O(log depth) vectorized steps.
+
+    Raises:
+        ValueError: If `parent` has a cycle.
+    """
+    acc = np.array(values, dtype=float)
+    anc = parent.copy()
+    for _ in range(_jump_rounds(len(anc)) + 1):
+        has = anc >= 0
+        if not has.any():
+            return acc
+        acc[has] = acc[has] + acc[anc[has]]
+        anc[has] = anc[anc[has]]
+    raise ValueError("Parent pointers form a cycle")
+
+
+def _pointer_jump_target(pointer):
+    """
+    Follows `pointer` (node -> node, fixed points are targets) until every node reaches its target.
+
+    Raises:
+        ValueError: If `pointer` has a cycle longer than one node.
+    """
+    target = pointer.copy()
+    for _ in range(_jump_rounds(len(target)) + 1):
+        nxt = target[target]
+        if np.array_equal(nxt, target):
+            return target
+        target = nxt
+    raise ValueError("Pointers form a cycle")
+
+
+def _id_list(ids, limit=10):
+    """Comma-separated sample ids, truncated after `limit`."""
+    ids = [str(int(i)) for i in ids]
+    return ", ".join(ids[:limit]) + (", ..." if len(ids) > limit else "")
+
+
+class SWCTree:
+    def __init__(self, data):
+        """
+        Builds the node arrays of a reconstruction.
+
+        Args:
+            data (numpy.ndarray): Structured array of NODE_DTYPE records, or (n, 7) array of SWC columns
+                id, type, x, y, z, radius, parent.
+
+        Attributes:
+            nodes (numpy.ndarray): The NODE_DTYPE records, in file order.
+            ids (numpy.ndarray): SWC sample ids.
+            types (numpy.ndarray): SWC structure types (1 soma, 3 basal, 4 apical, 7 glia, ...), as floats.
+            xyz (numpy.ndarray): (n, 3) node coordinates.
+            radius (numpy.ndarray): Node radii.
+            parent (numpy.ndarray): Row index of each node's parent, -1 for roots.
+
+        Raises:
+            ValueError: If a node is its own parent or the parent links form a cycle.
+        """
+        if data.dtype.names is None:
+            nodes = np.empty(len(data), dtype=NODE_DTYPE)
+            for k, name in enumerate(NODE_DTYPE.names):
+                nodes[name] = data[:, k]
+            data = nodes
+        self.nodes = data
+        self.ids = data["id"]
+        self.types = data["type"].astype(float)
+        self.xyz = np.stack([data["x"], data["y"], data["z"]], axis=1)
+        self.radius = data["radius"]
+        parent_ids = data["parent"]
+
+        # Map parent sample ids to row indices; unknown parents make the node a root
+        order = np.argsort(self.ids, kind="stable")
+        pos = np.searchsorted(self.ids, parent_ids, sorter=order)
+        parent = order[np.clip(pos, 0, max(len(order) - 1, 0))] if len(order) else parent_ids
+        found = (parent_ids >= 0) & (self.ids[parent] == parent_ids) if len(order) else parent_ids >= 0
+        self.parent = np.where(found, parent, -1)
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        """Rejects self-parented nodes and parent cycles, which never reach a root."""
+        rows = np.arange(len(self))
+        own = np.flatnonzero(self.parent == rows)
+        if len(own):
+            raise ValueError(f"SWC samples are their own parent: {_id_list(self.ids[own])}")
+        # After enough rounds every node has reached its root, or a node of the cycle above it
+        target = np.where(self.is_root, rows, self.parent)
+        for _ in range(_jump_rounds(len(self))):
+            target = target[target]
+        cyclic = ~self.is_root[target]
+        if cyclic.any():
+            raise ValueError(f"SWC parent links form a cycle through samples {_id_list(self.ids[np.unique(target[cyclic])])}")
+        # Seed the cached root, which is what the check computed
+        self.__dict__["root"] = target
+
+    def __len__(self):
+        return len(self.ids)
+
+    @functools.cached_property
+    def is_root(self):
+        """Nodes without a parent (tree roots, usually the soma center)."""
+        return self.parent < 0
+
+    @functools.cached_property
+    def n_children(self):
+        """Number of children of each node."""
+        return np.bincount(self.parent[~self.is_root], minlength=len(self))
+
+    @functools.cached_property
+    def child_offsets(self):
+        """CSR offsets of the child index: the children of node i are child_nodes[child_offsets[i]:child_offsets[i + 1]]."""
+        return np.concatenate([[0], np.cumsum(self.n_children)]).astype(np.int64)
+
+    @functools.cached_property
+    def child_nodes(self):
+        """CSR child index: row indices of every node's children, grouped by parent and in file order."""
+        nodes = np.flatnonzero(~self.is_root)
+        return nodes[np.argsort(self.parent[nodes], kind="stable")]
+
+    @functools.cached_property
+    def topological_order(self):
+        """Row indices ordered by depth from the root, so that every parent comes before its children."""
+        depth = _pointer_jump_sum(~self.is_root, self.parent)
+        return np.argsort(depth, kind="stable")
+
+    @functools.cached_property
+    def is_compartment(self):
+        """Nodes that close a compartment, i.e. every node that has a parent."""
+        return ~self.is_root
+
+    @functools.cached_property
+    def is_tip(self):
+        """Terminal compartments."""
+        return self.is_compartment & (self.n_children == 0)
+
+    @functools.cached_property
+    def is_bifurcation(self):
+        """Nodes with two or more children."""
+        return self.n_children >= 2
+
+    @functools.cached_property
+    def root(self):
+        """Row index of the root of each node's tree."""
+        pointer = np.where(self.is_root, np.arange(len(self)), self.parent)
+        return _pointer_jump_target(pointer)
+
+    @functools.cached_property
+    def length(self):
+        """Length of the compartment between each node and its parent (0 for roots)."""
+        seg = self.xyz - self.xyz[np.where(self.is_root, np.arange(len(self)), self.parent)]
+        return np.sqrt((seg ** 2).sum(axis=1))
+
+    @functools.cached_property
+    def path_distance(self):
+        """Path distance from the tree root along the compartments."""
+        return _pointer_jump_sum(self.length, self.parent)
+
+    @functools.cached_property
+    def euclidean_distance(self):
+        """Straight-line distance from the tree root."""
+        return np.sqrt(((self.xyz - self.xyz[self.root]) ** 2).sum(axis=1))
+
+    @functools.cached_property
+    def is_stem(self):
+        """Compartments attached to the soma, or to the root when there is no soma."""
+        p = np.where(self.is_root, 0, self.parent)
+        return self.is_compartment & (self.types != 1) & ((self.types[p] == 1) | self.is_root[p])
+
+    @functools.cached_property
+    def branch_order(self):
+        """Number of non-somatic bifurcations between each node and its tree root."""
+        p = np.where(self.is_root, 0, self.parent)
+        bif_above = np.where(self.is_compartment, self.is_bifurcation[p] & (self.types[p] != 1), False)
+        return _pointer_jump_sum(bif_above, self.parent)
+
+    @functools.cached_property
+    def is_branch_start(self):
+        """
+        First compartment of every branch.
+
+        A branch runs from the child of a root, bifurcation or soma node down to the next
+        bifurcation or tip.
+        """
+        p = np.where(self.is_root, 0, self.parent)
+        return self.is_compartment & (
+            self.is_root[p] | (self.n_children[p] != 1) | ((self.types[p] == 1) & (self.types != 1))
+        )
+
+    @functools.cached_property
+    def branch_start(self):
+        """Row index of the first node of the branch each node belongs to (-1 for roots)."""
+        pointer = np.where(self.is_branch_start | self.is_root, np.arange(len(self)), self.parent)
+        return np.where(self.is_root, -1, _pointer_jump_target(pointer))
+
+    @functools.cached_property
+    def branch_end_nodes(self):
+        """Row index of the last node (bifurcation, tip or soma boundary) of every branch, in file order."""
+        starts = self.is_branch_start
+        has_start_child = np.bincount(self.parent[starts], minlength=len(self)) > 0
+        return np.flatnonzero(self.is_compartment & ((self.n_children != 1) | has_start_child))
+
+    @functools.cached_property
+    def branch_index(self):
+        """Index into `branch_end_nodes` of the branch each node belongs to (-1 for roots)."""
+        index = np.full(len(self), -1, dtype=np.int64)
+        by_start = np.full(len(self), -1, dtype=np.int64)
+        ends = self.branch_end_nodes
+        by_start[self.branch_start[ends]] = np.arange(len(ends))
+        compartments = self.is_compartment
+        index[compartments] = by_start[self.branch_start[compartments]]
+        return index
+
+    @functools.cached_property
+    def branch_origin(self):
+        """For every branch, the node it grows from (the parent of its first node)."""
+        return self.parent[self.branch_start[self.branch_end_nodes]]
+
+    @functools.cached_property
+    def branch_parent(self):
+        """For every branch, the index of its parent branch (-1 if it grows from a root)."""
+        return self.branch_index[self.branch_origin]
+
+    @functools.cached_property
+    def branch_depth(self):
+        """Number of branches between each branch and its root."""
+        return _pointer_jump_sum(np.ones(len(self.branch_end_nodes)), self.branch_parent) - 1
+
+    @functools.cached_property
+    def terminal_degree(self):
+        """Number of tips in the subtree of each node (constant along a branch)."""
+        ends = self.branch_end_nodes
+        tips = self.is_tip[ends].astype(float)
+        depth = self.branch_depth
+        bparent = self.branch_parent
+        # Accumulate tip counts from the deepest branches upwards, one branch level at a time
+        for level in range(int(depth.max()) if len(depth) else 0, 0, -1):
+            at_level = np.flatnonzero(depth == level)
+            np.add.at(tips, bparent[at_level], tips[at_level])
+        degree = np.zeros(len(self))
+        compartments = self.is_compartment
+        degree[compartments] = tips[self.branch_index[compartments]]
+        top = np.flatnonzero(bparent < 0)
+        np.add.at(degree, self.branch_origin[top], tips[top])
+        return degree
+
+    @functools.cached_property
+    def children(self):
+        """(first_child, second_child) row indices for every node, -1 where missing."""
+        first = np.full(len(self), -1, dtype=np.int64)
+        second = np.full(len(self), -1, dtype=np.int64)
+        starts = self.child_offsets[:-1]
+        has_one = self.n_children >= 1
+        has_two = self.n_children >= 2
+        first[has_one] = self.child_nodes[starts[has_one]]
+        second[has_two] = self.child_nodes[starts[has_two] + 1]
+        return first, second
@@ -0,0 +1,173 @@
+# morphomeasure/watch.py
+"""
+This module keeps the outputs of a directory up to date while new SWC files are dropped into it.
+Classes:
+    FolderWatcher: Tracks the SWC files of a directory between polls and reports the settled changes.
+Functions:
+    snapshot(swc_dir, include, exclude, recursive): Size and modification time of every SWC file.
+    watch(lm, swc_dir, output_dir, tags, ...): Polls a directory and updates the outputs of new or changed files.
+Notes:
+    - Changes are detected by polling: each poll is one os.scandir walk plus a stat per file, and a file's
+      content is only hashed when its size or modification time changed. Polling works the same on every
+      platform and on network file systems, where inotify events are not delivered.
+    - A new or modified file is processed once it is unchanged between two consecutive polls, so files that
+      are still being written are not read half-way. Until then, the outputs keep its previous version.
+    - Every update is an incremental `run_batch` over the current files: unchanged files are served from the
+      run manifest, only new or changed ones are extracted, their branch tables are (re)written, and the
+      All_Morphometrics tables are rebuilt from the stored summary rows. Removed files leave the summary
+      tables; their branch tables are kept.
+    - With jobs > 1, one process pool is kept for the whole session, so workers stay warm (imported modules,
+      parsed-tree cache) between updates.
+"""
+
+import os
+import signal
+import sys
+import time
+
+from .cache import file_digest
+from .discovery import SWC_PATTERNS, discover_swc
+
+
+def _ignore_interrupt():
+    # Ctrl+C stops the session from the main process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def snapshot(swc_dir, include=SWC_PATTERNS, exclude=(), recursive=True):
+    """
+    Returns {relative path: (size, mtime_ns)} for the SWC files of a directory (see `discovery.discover_swc`).
+    Files removed while the directory is walked are left out.
+    """
+    signatures = {}
+    for swc_file in discover_swc(swc_dir, include, exclude, recursive):
+        try:
+            st = os.stat(os.path.join(swc_dir, *swc_file.split("/")))
+        except FileNotFoundError:
+            continue
+        signatures[swc_file] = (st.st_size, st.st_mtime_ns)
+    return signatures
+
+
+class FolderWatcher:
+    def __init__(self, swc_dir, include=SWC_PATTERNS, exclude=(), recursive=True):
+        """
+        Starts tracking a directory; nothing has been processed yet.
+
+        Attributes:
+            processed (dict): Relative path to ((size, mtime_ns), digest) of the version of each file that is
+                in the outputs.
+        """
+        self.swc_dir = swc_dir
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.recursive = recursive
+        self.processed = {}
+        self._previous = {}
+
+    def poll(self):
+        """
+        Takes a snapshot of the directory.
+
+        Returns:
+            dict or None: When files were added, modified or removed since the last commit, the state to
+            process: relative path to (signature, digest) of every file that belongs in the outputs, in
+            sorted order. Files that are still changing keep their processed version, or are left out
+            when they are new. None when there is nothing to do.
+        """
+        current = snapshot(self.swc_dir, self.include, self.exclude, self.recursive)
+        previous, self._previous = self._previous, current
+        changed = bool(set(self.processed) - set(current))
+        state = {}
+        for swc_file, signature in current.items():
+            known = self.processed.get(swc_file)
+            if known is not None and known[0] == signature:
+                state[swc_file] = known
+            elif previous.get(swc_file) == signature:
+                # Settled since the last poll: read it
+                try:
+                    digest = file_digest(os.path.join(self.swc_dir, *swc_file.split("/")))
+                except FileNotFoundError:
+                    continue
+                state[swc_file] = (signature, digest)
+                changed = changed or known is None or known[1] != digest
+            elif known is not None:
+                # Still being written: keep the version already in the outputs
+                state[swc_file] = known
+        if not changed:
+            # Touched without changing content: remember the new signatures so the file is not hashed again
+            self.processed = state
+            return None
+        return state
+
+    def commit(self, state):
+        """Records `state`, as returned by `poll`, as the version in the outputs."""
+        self.processed = state
+
+
+def _pool(jobs):
+    """Process pool kept across updates, or None for serial runs."""
+    from .lmwrapper import process_pool
+
+    return process_pool(jobs, initializer=_ignore_interrupt) if jobs > 1 else None
+
+
+def watch(lm, swc_dir, output_dir, tags, interval=2.0, jobs=1, max_polls=None, on_update=None, **batch_options):
+    """
+    Polls a directory and keeps the branch tables and All_Morphometrics tables of its SWC files up to date.
+
+    Parameters:
+        lm (LMeasureWrapper): Wrapper used for the extractions.
+        swc_dir (str): Directory to watch.
+        output_dir (str): Output directory, as for `run_batch`. Files completed by an earlier run or watch
+            session into it are not processed again.
+        tags (list of str): Tags to process.
+        interval (float): Seconds between polls. Default is 2.
+        jobs (int): Worker processes of the pool kept for the session. Default is 1 (in-process).
+        max_polls (int, optional): Stop after this many polls. Default: run until interrupted.
+        on_update (callable, optional): Called with `lm.last_plan_stats` after every update.
+        **batch_options: Other `run_batch` arguments (features_mode, features_dict, summary_logic, resume,
+            output_format, summary_layout, include, exclude, recursive, store, fail_fast, retry_failed).
+            resume=False and retry_failed=True only apply to the first update.
+
+    An update that fails is reported on stderr; its files are tried again when they change. Neurons that fail
+    are quarantined by `run_batch` and tried again when their file changes.
+    """
+    resume = batch_options.pop("resume", True)
+    retry_failed = batch_options.pop("retry_failed", False)
+    include = batch_options.pop("include", SWC_PATTERNS)
+    exclude = batch_options.pop("exclude", ())
+    recursive = batch_options.pop("recursive", True)
+    watcher = FolderWatcher(swc_dir, include, exclude, recursive)
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+    executor = _pool(jobs)
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            if polls:
+                time.sleep(interval)
+            polls += 1
+            state = watcher.poll()
+            if state is None:
+                continue
+            try:
+                lm.run_batch(
+                    swc_dir, output_dir, tags, jobs=jobs, resume=resume, retry_failed=retry_failed, swc_files=list(state),
+                    digests={swc_file: digest for swc_file, (_, digest) in state.items()},
+                    executor=executor, **batch_options,
+                )
+            except Exception as e:
+                print(f"morphomeasure watch: update failed: {e}", file=sys.stderr)
+            else:
+                if on_update is not None:
+                    on_update(lm.last_plan_stats)
+            if executor is not None and (lm.last_plan_stats or {}).get("timed_out_files"):
+                # run_batch killed the pool to stop a neuron that timed out
+                executor = _pool(jobs)
+            # Only the first update may start over (resume=False); later ones build on it
+            resume, retry_failed = True, False
+            watcher.commit(state)
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -0,0 +1,240 @@
+# morphomeasure/worker.py
+"""
+This module runs feature extraction in a persistent worker process, so start-up cost is paid once per worker
+instead of once per feature or per neuron.
+Classes:
+    LmWorker: Client that starts one long-lived worker process, streams parameter sets to it and reads results back.
+Functions:
+    serve(backend, lm_exe_path, fused): Worker loop reading requests from stdin and writing results to stdout.
+Protocol:
+    One JSON object per line in each direction.
+    Request:  {"swc_file": str, "features": {name: flag}, "tag": str}
+    Response: {"ok": true, "columns": {name: [values]}} or {"ok": false, "error": str}
+    Columns are not padded; the client pads them like LMeasureWrapper.extract_features does.
+Notes:
+    - The bundled Lm.jar is only the L-Measure GUI, which itself shells out to the native executable, so it
+      cannot serve as a compute engine. The default worker is a Python process running the native backend,
+      which also runs on Linux without Wine or Java. Any program speaking the protocol can be used through
+      the `command` argument of LmWorker.
+    - A worker that dies is restarted and the pending request is retried, up to `max_restarts` times in a row.
+    - With `timeout`, a worker that does not answer a request in time is killed and the request fails with
+      WorkerTimeout; it is not retried, since the same input would hang again. The next request restarts it.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import weakref
+
+
+def serve(backend="native", lm_exe_path=None, fused=True, stdin=None, stdout=None):
+    """
+    Runs the worker loop until stdin is closed.
+
+    Parameters:
+        backend (str): Backend used by the worker's LMeasureWrapper ("native" or "lm").
+        lm_exe_path (str, optional): Path to the L-Measure executable for the "lm" backend.
+        fused (bool): Fused mode of the "lm" backend.
+        stdin, stdout (file, optional): Streams to use instead of sys.stdin / sys.stdout.
+    """
+    from .lmwrapper import LMeasureWrapper
+
+    stdin = stdin or sys.stdin
+    if stdout is None:
+        # Keep the protocol stream clean of anything the backend might print
+        stdout, sys.stdout = sys.stdout, sys.stderr
+    lm = LMeasureWrapper(lm_exe_path, fused=fused, backend=backend)
+    for line in stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            columns = lm._extract_arrays(request["swc_file"], request["features"], request["tag"])
+            response = {"ok": True, "columns": columns}
+        except Exception as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        stdout.write(json.dumps(response) + "\n")
+        stdout.flush()
+
+
+def _stop(proc, timeout):
+    """Closes the worker's stdin and waits for it, killing it if it does not exit in time."""
+    if proc.poll() is not None:
+        return
+    try:
+        proc.stdin.close()
+        proc.wait(timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        proc.kill()
+        proc.wait()
+
+
+class WorkerCrashed(RuntimeError):
+    """Raised when the worker keeps dying after `max_restarts` restarts."""
+
+
+class WorkerTimeout(TimeoutError):
+    """Raised when the worker does not answer a request within `timeout` seconds."""
+
+
+class LmWorker:
+    def __init__(self, backend="native", lm_exe_path=None, fused=True, command=None, max_restarts=3, shutdown_timeout=5.0,
+                 timeout=None):
+        """
+        Configures a persistent worker. The process is started on the first request.
+
+        Args:
+            backend (str, optional): Backend run inside the default Python worker ("native" or "lm").
+            lm_exe_path (str, optional): Path to the L-Measure executable for the "lm" backend.
+            fused (bool, optional): Fused mode of the "lm" backend.
+            command (list of str, optional): Command that starts a worker speaking the JSON-lines protocol.
+                Defaults to `python -m morphomeasure.worker` with the options above.
+            max_restarts (int, optional): Consecutive restarts allowed before a request fails with WorkerCrashed.
+            shutdown_timeout (float, optional): Seconds to wait for a clean exit before killing the worker.
+            timeout (float, optional): Seconds to wait for the answer to a request before killing the worker.
+                Default: no timeout.
+
+        Attributes:
+            restarts (int): Total number of times the worker had to be restarted after dying.
+        """
+        if command is None:
+            command = [sys.executable, "-m", "morphomeasure.worker", "--backend", backend]
+            if lm_exe_path:
+                command += ["--lm_exe_path", lm_exe_path]
+            if not fused:
+                command.append("--per_feature")
+        self.command = list(command)
+        self.max_restarts = max_restarts
+        self.shutdown_timeout = shutdown_timeout
+        self.timeout = timeout
+        self.restarts = 0
+        self._proc = None
+        self._lock = threading.Lock()
+        self._finalizer = None
+
+    def start(self):
+        """Starts the worker process if it is not running."""
+        if self._proc is not None:
+            if self._proc.poll() is None:
+                return
+            self.restarts += 1
+        # Make the package importable by the default worker even when it is not installed
+        env = os.environ.copy()
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (package_parent, env.get("PYTHONPATH")) if p)
+        self._proc = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            env=env,
+        )
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        self._finalizer = weakref.finalize(self, _stop, self._proc, self.shutdown_timeout)
+
+    def close(self):
+        """Shuts the worker down cleanly: closes its stdin, waits, and kills it on timeout."""
+        with self._lock:
+            if self._finalizer is not None:
+                self._finalizer()
+                self._finalizer = None
+            self._proc = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _readline(self):
+        """Reads one response line, or None when the worker does not answer within `timeout`."""
+        if self.timeout is None:
+            return self._proc.stdout.readline()
+        # Pipes cannot be read with a deadline portably; a helper thread reads and the caller waits for it
+        lines = []
+        reader = threading.Thread(target=lambda: lines.append(self._proc.stdout.readline()), daemon=True)
+        reader.start()
+        reader.join(self.timeout)
+        return lines[0] if lines else None
+
+    def _roundtrip(self, payload):
+        self.start()
+        try:
+            self._proc.stdin.write(payload)
+            self._proc.stdin.flush()
+            line = self._readline()
+        except (BrokenPipeError, OSError):
+            line = ""
+        if line is None:
+            # Killing the worker also ends the blocked read
+            self._proc.kill()
+            self._proc.wait()
+            raise WorkerTimeout(f"Worker {self.command} did not answer within {self.timeout:g} s")
+        if not line:
+            # The worker died: reap it so that start() launches a fresh one
+            self._proc.kill()
+            self._proc.wait()
+            return None
+        return json.loads(line)
+
+    def extract(self, swc_file, features_dict, tag):
+        """
+        Extracts features through the worker.
+
+        Parameters:
+            swc_file (str): Path to the SWC file.
+            features_dict (dict): Feature names to flags, as for LMeasureWrapper.extract_features.
+            tag (str): Tag substituted for '{TAG}'.
+
+        Returns:
+            dict: Feature name to list of values (not padded).
+
+        Raises:
+            RuntimeError: If the worker reports an extraction error.
+            WorkerCrashed: If the worker dies more than `max_restarts` times in a row.
+            WorkerTimeout: If the worker does not answer within `timeout` seconds.
+        """
+        payload = json.dumps({"swc_file": swc_file, "features": features_dict, "tag": tag}) + "\n"
+        with self._lock:
+            attempts = 0
+            while True:
+                response = self._roundtrip(payload)
+                if response is not None:
+                    break
+                attempts += 1
+                if attempts > self.max_restarts:
+                    raise WorkerCrashed(
+                        f"Worker {self.command} died {attempts} times while processing '{swc_file}'"
+                    )
+        if not response["ok"]:
+            raise RuntimeError(f"Worker failed on '{swc_file}' (tag {tag}): {response['error']}")
+        return response["columns"]
+
+    def __getstate__(self):
+        # A running process cannot be shared; unpickled copies start their own worker
+        state = self.__dict__.copy()
+        state.update(_proc=None, _lock=None, _finalizer=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MorphoMeasure persistent extraction worker (JSON lines on stdin/stdout)")
+    parser.add_argument('--backend', choices=['lm', 'native'], default='native')
+    parser.add_argument('--lm_exe_path', default=None)
+    parser.add_argument('--per_feature', action='store_true')
+    args = parser.parse_args()
+    serve(backend=args.backend, lm_exe_path=args.lm_exe_path, fused=not args.per_feature)
+
+
+if __name__ == "__main__":
+    main()
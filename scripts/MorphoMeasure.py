@@ -3,43 +3,12 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from morphomeasure import LMeasureWrapper
-from morphomeasure.features import features, TAG_LABELS, output_order, summary_logic
+from morphomeasure.features import features, TAG_LABELS, summary_logic
+from morphomeasure.output import write_summary_tables
+from morphomeasure.summary import summarize
 import pandas as pd
 import argparse
 
-def abel(df, path_col, contract_col):
-    """
-    Calculates the mean of the element-wise product of two columns in a DataFrame.
-
-    Parameters:
-        df (pd.DataFrame): The DataFrame containing the data.
-        path_col (str): The name of the column representing the 'path' values.
-        contract_col (str): The name of the column representing the 'contract' values.
-
-    Returns:
-        float or None: The mean of the element-wise product of the two columns if both exist, otherwise None.
-    """
-    if path_col in df.columns and contract_col in df.columns:
-        p = pd.to_numeric(df[path_col], errors="coerce")
-        c = pd.to_numeric(df[contract_col], errors="coerce")
-        return (p * c).mean()
-    return None
-
-def bapl(df, col):
-    """
-    Calculates the mean of a specified column in a DataFrame after converting its values to numeric.
-
-    Parameters:
-        df (pandas.DataFrame): The DataFrame containing the data.
-        col (str): The name of the column to compute the mean for.
-
-    Returns:
-        float or None: The mean of the numeric values in the specified column, or None if the column does not exist.
-    """
-    if col in df.columns:
-        return pd.to_numeric(df[col], errors="coerce").mean()
-    return None
-
 def main():
     """
     Main entry point for extracting morphometric features from SWC files using L-Measure.
@@ -92,6 +61,7 @@ def main():
 
     all_summaries_combined = {}
     all_summaries = {t: {} for t in tags}
+    frames = []
 
     for swc_filename in os.listdir(args.swc_dir):
         if not swc_filename.endswith(".swc"):
@@ -108,8 +78,7 @@ def main():
                 df_tag = lm.extract_features(
                     swc_file=swc_path,
                     features_dict=features,
-                    tag=tag,
-                    tmp_dir=args.tmp_dir
+                    tag=tag
                 )
                 if "Branch_pathlength" in df_tag.columns and "Contraction" in df_tag.columns:
                     df_tag["ABEL"] = pd.to_numeric(df_tag["Branch_pathlength"], errors="coerce") * pd.to_numeric(df_tag["Contraction"], errors="coerce")
@@ -142,162 +111,28 @@ def main():
                 df_out.to_csv(morpho_outfile, index=False)
                 per_tag_dfs[tag] = df_tag  # keep full set (with all columns) for summary
 
-                # Summary logic
-                summary = {}
-                for col, (op, out_label) in summary_logic.items():
-                    if col in df_tag.columns:
-                        col_numeric = pd.to_numeric(df_tag[col], errors="coerce")
-                        if op == "sum":
-                            summary[out_label] = col_numeric.sum()
-                        elif op == "mean":
-                            summary[out_label] = col_numeric.mean()
-                        elif op == "max":
-                            summary[out_label] = col_numeric.max()
-                        elif op == "first":
-                            summary[out_label] = col_numeric.iloc[0] if not col_numeric.empty else None
-                if "EucDistance" in df_tag.columns:
-                    summary["Sum_EucDistance"] = pd.to_numeric(df_tag["EucDistance"], errors="coerce").sum()
-                if "PathDistance" in df_tag.columns:
-                    summary["Sum_PathDistance"] = pd.to_numeric(df_tag["PathDistance"], errors="coerce").sum()
-                summary["ABEL"] = abel(df_tag, "Branch_pathlength", "Contraction")
-                summary["ABEL_Terminal"] = abel(df_tag, "Branch_pathlength_terminal", "Contraction_terminal")
-                summary["ABEL_Internal"] = abel(df_tag, "Branch_pathlength_internal", "Contraction_internal")
-                summary["BAPL"] = bapl(df_tag, "Branch_pathlength")
-                summary["BAPL_Terminal"] = bapl(df_tag, "Branch_pathlength_terminal")
-                summary["BAPL_Internal"] = bapl(df_tag, "Branch_pathlength_internal")
-                all_summaries[tag][swc_filename] = summary
-
         # For All_Morphometrics summary
-        if features_mode in ['all', 'combined']:
-            if features_mode == 'all':
-                for tag in tags:
-                    df_tag = lm.extract_features(
-                        swc_file=swc_path,
-                        features_dict=features,
-                        tag=tag,
-                        tmp_dir=args.tmp_dir
-                    )
-                    per_tag_dfs[tag] = df_tag
+        if features_mode == 'all':
+            for tag in tags:
+                per_tag_dfs[tag] = lm.extract_features(
+                    swc_file=swc_path,
+                    features_dict=features,
+                    tag=tag
+                )
+        frames.extend((swc_filename, tag, df_tag) for tag, df_tag in per_tag_dfs.items())
 
-                    summary = {}
-                    for col, (op, out_label) in summary_logic.items():
-                        if col in df_tag.columns:
-                            col_numeric = pd.to_numeric(df_tag[col], errors="coerce")
-                            if op == "sum":
-                                summary[out_label] = col_numeric.sum()
-                            elif op == "mean":
-                                summary[out_label] = col_numeric.mean()
-                            elif op == "max":
-                                summary[out_label] = col_numeric.max()
-                            elif op == "first":
-                                summary[out_label] = col_numeric.iloc[0] if not col_numeric.empty else None
-                    if "EucDistance" in df_tag.columns:
-                        summary["Sum_EucDistance"] = pd.to_numeric(df_tag["EucDistance"], errors="coerce").sum()
-                    if "PathDistance" in df_tag.columns:
-                        summary["Sum_PathDistance"] = pd.to_numeric(df_tag["PathDistance"], errors="coerce").sum()
-                    summary["ABEL"] = abel(df_tag, "Branch_pathlength", "Contraction")
-                    summary["ABEL_Terminal"] = abel(df_tag, "Branch_pathlength_terminal", "Contraction_terminal")
-                    summary["ABEL_Internal"] = abel(df_tag, "Branch_pathlength_internal", "Contraction_internal")
-                    summary["BAPL"] = bapl(df_tag, "Branch_pathlength")
-                    summary["BAPL_Terminal"] = bapl(df_tag, "Branch_pathlength_terminal")
-                    summary["BAPL_Internal"] = bapl(df_tag, "Branch_pathlength_internal")
-                    all_summaries[tag][swc_filename] = summary
-            if per_tag_dfs:
-                df_combined = pd.concat(list(per_tag_dfs.values()), axis=0, ignore_index=True)
-                summary = {}
-                for col, (op, out_label) in summary_logic.items():
-                    if col in df_combined.columns:
-                        col_numeric = pd.to_numeric(df_combined[col], errors="coerce")
-                        if op == "sum":
-                            summary[out_label] = col_numeric.sum()
-                        elif op == "mean":
-                            summary[out_label] = col_numeric.mean()
-                        elif op == "max":
-                            summary[out_label] = col_numeric.max()
-                        elif op == "first":
-                            summary[out_label] = col_numeric.iloc[0] if not col_numeric.empty else None
-                if "EucDistance" in df_combined.columns:
-                    summary["Sum_EucDistance"] = pd.to_numeric(df_combined["EucDistance"], errors="coerce").sum()
-                if "PathDistance" in df_combined.columns:
-                    summary["Sum_PathDistance"] = pd.to_numeric(df_combined["PathDistance"], errors="coerce").sum()
-                summary["ABEL"] = abel(df_combined, "Branch_pathlength", "Contraction")
-                summary["ABEL_Terminal"] = abel(df_combined, "Branch_pathlength_terminal", "Contraction_terminal")
-                summary["ABEL_Internal"] = abel(df_combined, "Branch_pathlength_internal", "Contraction_internal")
-                summary["BAPL"] = bapl(df_combined, "Branch_pathlength")
-                summary["BAPL_Terminal"] = bapl(df_combined, "Branch_pathlength_terminal")
-                summary["BAPL_Internal"] = bapl(df_combined, "Branch_pathlength_internal")
-                all_summaries_combined[swc_filename] = summary
+    # Summarize every neuron and tag at once
+    tag_summaries, combined_summaries = summarize(
+        frames, summary_logic, combined=features_mode in ['all', 'combined']
+    )
+    for (swc_filename, tag), summary in tag_summaries.items():
+        all_summaries[tag][swc_filename] = summary
+    if combined_summaries:
+        all_summaries_combined.update(combined_summaries)
 
     # After processing all files: Write All_Morphometrics summaries
-
     if features_mode in ['all', 'combined'] and all_summaries_combined:
-        neuron_names = sorted(all_summaries_combined.keys())
-        all_features = output_order
-
-        def build_df_out(result_frames, column_name_func):
-            df_out = pd.DataFrame({"Features": all_features})
-            for df, neuron in result_frames:
-                colname = column_name_func(df, neuron)
-                df1 = df.set_index("Features")[df.columns[1]]
-                df_out[colname] = df1.reindex(all_features).values
-            return df_out
-
-        only_glia = (len(tags) == 1 and tags[0] == "7.0")
-        contains_glia = "7.0" in tags
-
-        if set(tags) == {"3.0", "4.0"} and not contains_glia:
-            result_frames_combined = []
-            for neuron in neuron_names:
-                comb = all_summaries_combined[neuron]
-                df = pd.DataFrame({"combined": comb})
-                df.insert(0, "Features", df.index)
-                df.reset_index(drop=True, inplace=True)
-                result_frames_combined.append((df, neuron))
-            df_out_combined = build_df_out(result_frames_combined, lambda df, n: f"{n.replace('.swc','')}_combined")
-            df_out_combined.to_csv(os.path.join(args.output_dir, "All_Morphometrics.csv"), index=False)
-
-            result_frames_basal = []
-            for neuron in neuron_names:
-                tag_label = TAG_LABELS["3.0"]
-                val = all_summaries["3.0"].get(neuron, {})
-                df = pd.DataFrame({tag_label: val})
-                df.insert(0, "Features", df.index)
-                df.reset_index(drop=True, inplace=True)
-                result_frames_basal.append((df, neuron))
-            df_out_basal = build_df_out(result_frames_basal, lambda df, n: f"{n.replace('.swc','')}_basal_dendrites")
-            df_out_basal.to_csv(os.path.join(args.output_dir, "All_Morphometrics_basal.csv"), index=False)
-
-            result_frames_apical = []
-            for neuron in neuron_names:
-                tag_label = TAG_LABELS["4.0"]
-                val = all_summaries["4.0"].get(neuron, {})
-                df = pd.DataFrame({tag_label: val})
-                df.insert(0, "Features", df.index)
-                df.reset_index(drop=True, inplace=True)
-                result_frames_apical.append((df, neuron))
-            df_out_apical = build_df_out(result_frames_apical, lambda df, n: f"{n.replace('.swc','')}_apical_dendrites")
-            df_out_apical.to_csv(os.path.join(args.output_dir, "All_Morphometrics_apical.csv"), index=False)
-
-        else:
-            for tag in tags:
-                tag_label = TAG_LABELS.get(tag, f"tag_{tag}")
-                result_frames = []
-                for neuron in neuron_names:
-                    val = all_summaries[tag].get(neuron, {})
-                    df = pd.DataFrame({tag_label: val})
-                    df.insert(0, "Features", df.index)
-                    df.reset_index(drop=True, inplace=True)
-                    result_frames.append((df, neuron))
-                if tag == "3.0":
-                    outname = "All_Morphometrics_basal.csv"
-                elif tag == "4.0":
-                    outname = "All_Morphometrics_apical.csv"
-                elif tag == "7.0":
-                    outname = "All_Morphometrics_glia.csv"
-                else:
-                    outname = f"All_Morphometrics_{tag_label}.csv"
-                df_out = build_df_out(result_frames, lambda df, n: f"{n.replace('.swc','')}_{tag_label}")
-                df_out.to_csv(os.path.join(args.output_dir, outname), index=False)
+        write_summary_tables(args.output_dir, tags, all_summaries, all_summaries_combined)
 
     # Clean up tmp folder
     for fname in os.listdir(args.tmp_dir):
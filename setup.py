@@ -11,6 +11,7 @@ Key parameters:
 - url: URL to the project's repository.
 - packages: Automatically discovered Python packages.
 - install_requires: List of required dependencies.
+- extras_require: Optional dependencies (pyarrow for Parquet/Feather output).
 - include_package_data: Whether to include additional files specified in MANIFEST.in.
 - entry_points: CLI entry point for the package.
 - classifiers: Metadata for PyPI and other tools.
@@ -26,10 +27,14 @@ setup(
     author="Masood Akram",
     author_email="masood.ahmed.akram@gmail.com",
     url="https://github.com/Masood-Akram/MorphoMeasure",
-    packages=find_packages(),
+    packages=find_packages(exclude=("benchmarks", "benchmarks.*", "tests", "tests.*")),
     install_requires=[
         "pandas",
+        "numpy",
     ],
+    extras_require={
+        "parquet": ["pyarrow"],
+    },
     include_package_data=True,
     package_data={
         # No need for this if using MANIFEST.in, but doesn't hurt
@@ -0,0 +1,43 @@
+import numpy as np
+
+from benchmarks.synthetic import synthetic_swc
+from morphomeasure import LMeasureWrapper
+from morphomeasure.batch import concat_trees, summarize_batch
+from morphomeasure.features import features
+from morphomeasure.summary import summarize
+from morphomeasure.swc import parse_swc
+
+
+def same(a, b):
+    return a == b or (a is not None and b is not None and np.isnan(a) and np.isnan(b))
+
+
+def test_batch_summaries_match_per_file_native(tmp_path):
+    paths = []
+    for i, tags in enumerate([(7,), (3, 7), (7,), (3, 4)]):
+        path = tmp_path / f"glia_{i}.swc"
+        path.write_text(synthetic_swc(n_nodes=40 + 30 * i, depth=2, tags=tags, stems_per_tag=1 + i % 2, seed=i))
+        paths.append(str(path))
+    # One file without soma, whose stem is its root
+    (tmp_path / "no_soma.swc").write_text("1 7 0 0 0 1 -1\n2 7 3 0 0 1 1\n3 7 6 1 0 1 2\n4 7 6 -1 0 1 2\n")
+    paths.append(str(tmp_path / "no_soma.swc"))
+
+    lm = LMeasureWrapper(backend="native")
+    frames = [(p.split("/")[-1], "7.0", lm.extract_features(p, features, "7.0")) for p in paths]
+    expected, _ = summarize(frames, combined=False)
+    for chunk_size in (2, 4096):
+        rows = summarize_batch(paths, "7.0", chunk_size=chunk_size)
+        assert list(rows) == [name for name, _, _ in frames]
+        for name, row in rows.items():
+            reference = expected[(name, "7.0")]
+            assert row.keys() == reference.keys()
+            assert all(same(row[k], reference[k]) for k in row), name
+
+
+def test_concat_trees_keeps_neurons_apart():
+    a = parse_swc("1 1 0 0 0 1 -1\n2 7 1 0 0 1 1\n")
+    b = parse_swc("5 1 0 0 0 1 -1\n9 7 0 2 0 1 5\n10 7 0 4 0 1 9\n")
+    tree, offsets = concat_trees([a, b])
+    assert offsets.tolist() == [0, 2, 5]
+    assert tree.parent.tolist() == [-1, 0, -1, 2, 3]
+    assert tree.path_distance.tolist() == [0, 1, 0, 2, 4]
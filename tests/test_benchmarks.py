@@ -0,0 +1,29 @@
+from benchmarks.bench import compare
+from benchmarks.synthetic import generate_dataset, synthetic_swc
+from morphomeasure.swc import load_swc, parse_swc
+
+
+def test_synthetic_neuron_has_requested_size_and_tags():
+    text = synthetic_swc(n_nodes=1000, depth=4, tags=(3, 4, 7), seed=1)
+    tree = parse_swc(text)
+    assert len(tree) == 1000
+    assert set(tree.types.tolist()) == {1.0, 3.0, 4.0, 7.0}
+    # One root, and 2 stems per tag each splitting into a full binary tree of depth 4
+    assert int(tree.is_root.sum()) == 1
+    assert int((tree.is_bifurcation & ~tree.is_root).sum()) == 3 * 2 * (2 ** 4 - 1)
+    assert synthetic_swc(n_nodes=1000, depth=4, tags=(3, 4, 7), seed=1) == text
+
+
+def test_dataset_uses_one_seed_per_neuron(tmp_path):
+    paths = generate_dataset(str(tmp_path), 3, n_nodes=200, depth=2)
+    trees = [load_swc(p) for p in paths]
+    assert [len(t) for t in trees] == [200, 200, 200]
+    assert not (trees[0].xyz == trees[1].xyz).all()
+
+
+def test_compare_flags_slower_and_larger_cases():
+    baseline = {"batch/native/small": {"neurons_per_sec": 10.0, "peak_rss_mb": 100.0}}
+    assert compare({"batch/native/small": {"neurons_per_sec": 8.0, "peak_rss_mb": 120.0}}, baseline) == []
+    regressions = compare({"batch/native/small": {"neurons_per_sec": 6.0, "peak_rss_mb": 140.0}}, baseline)
+    assert len(regressions) == 2
+    assert compare({"batch/native/large": {"neurons_per_sec": 0.1, "peak_rss_mb": None}}, baseline) == []
@@ -0,0 +1,63 @@
+import gzip
+import json
+
+import pytest
+
+from benchmarks.synthetic import synthetic_swc
+from morphomeasure import LMeasureWrapper
+from morphomeasure.costmodel import CostModel, longest_first, makespan, swc_size
+from morphomeasure.sources import SWCBytes
+
+
+def test_longest_first_schedule_and_calibration(tmp_path):
+    costs = {"a": 1.0, "b": 5.0, "c": 3.0, "d": 3.0}
+    assert longest_first(costs) == ["b", "c", "d", "a"]
+    assert makespan(costs, 2) == 6.0
+    assert makespan(costs, 8) == 5.0
+    assert makespan({}, 4) == 0.0
+
+    text = synthetic_swc(300, depth=3)
+    (tmp_path / "n.swc.gz").write_bytes(gzip.compress(text.encode()))
+    assert swc_size(str(tmp_path / "n.swc.gz")) == swc_size(SWCBytes("n.swc", text.encode())) == (len(text), 300)
+
+    # Enough timings fit the model; a few only rescale the prior
+    records = [
+        {"bytes": 40 * n + 1000 * (n % 3), "nodes": n, "seconds": 0.5 + 1e-3 * n} for n in range(100, 1100, 100)
+    ]
+    prior = CostModel.default("lm", 4)
+    fitted = CostModel.fit(records, prior)
+    assert fitted.samples == len(records)
+    assert fitted.estimate((40000, 2000)) == pytest.approx(2.5, rel=1e-3)
+    rescaled = CostModel.fit(records[:2], prior)
+    assert rescaled.samples == 2
+    assert rescaled.estimate((4000, 100)) + rescaled.estimate((8000, 200)) == pytest.approx(0.6 + 0.7, rel=1e-6)
+    assert CostModel.fit([], prior) is prior
+
+
+def test_dry_run_writes_nothing_and_timings_calibrate_the_plan(tmp_path):
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    for i, n in enumerate((100, 800, 300)):
+        (swc_dir / f"n{i}.swc").write_text(synthetic_swc(n, depth=3, seed=i))
+    out = tmp_path / "out"
+    lm = LMeasureWrapper(backend="native")
+    run = dict(features_mode=["all", "branch"], jobs=2)
+
+    lm.run_batch(str(swc_dir), str(out), ["3.0"], dry_run=True, store=str(tmp_path / "r.db"), **run)
+    assert not out.exists() and not (tmp_path / "r.db").exists()
+    stats = lm.last_plan_stats
+    assert stats["skipped_files"] == 0 and stats["lm_invocations"] == 0 and stats["calibration_samples"] == 0
+    assert stats["estimated_seconds"] > 0 and stats["jobs"] == 2
+
+    lm.run_batch(str(swc_dir), str(out), ["3.0"], **run)
+    with open(out / "morphomeasure_manifest.jsonl") as f:
+        costs = {r["swc_file"]: r["cost"] for r in map(json.loads, f)}
+    assert {f: c["nodes"] for f, c in costs.items()} == {"n0.swc": 100, "n1.swc": 800, "n2.swc": 300}
+    assert all(c["seconds"] > 0 for c in costs.values())
+
+    # Planning a full rerun uses the recorded timings and leaves the manifest alone
+    manifest = (out / "morphomeasure_manifest.jsonl").read_bytes()
+    lm.run_batch(str(swc_dir), str(out), ["3.0"], resume=False, dry_run=True, **run)
+    stats = lm.last_plan_stats
+    assert stats["skipped_files"] == 0 and stats["calibration_samples"] == 3
+    assert (out / "morphomeasure_manifest.jsonl").read_bytes() == manifest
@@ -0,0 +1,30 @@
+import pytest
+
+from morphomeasure.discovery import discover_swc, parse_shard, select_shard
+
+
+def test_discovery_is_recursive_filtered_and_sorted(tmp_path):
+    for rel in ("b.swc", "a.swc", "notes.txt", "sub/c.swc", "sub/deep/d.swc", "drafts/e.swc"):
+        path = tmp_path / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("1 1 0 0 0 1 -1\n")
+    assert discover_swc(str(tmp_path)) == ["a.swc", "b.swc", "drafts/e.swc", "sub/c.swc", "sub/deep/d.swc"]
+    assert discover_swc(str(tmp_path), exclude=["drafts/*"]) == ["a.swc", "b.swc", "sub/c.swc", "sub/deep/d.swc"]
+    assert discover_swc(str(tmp_path), include=["sub/*.swc"]) == ["sub/c.swc", "sub/deep/d.swc"]
+    assert discover_swc(str(tmp_path), recursive=False) == ["a.swc", "b.swc"]
+
+
+def test_shards_partition_the_files():
+    files = [f"dir{i % 7}/neuron_{i}.swc" for i in range(500)]
+    shards = [select_shard(files, i, 8) for i in range(8)]
+    assert sorted(f for shard in shards for f in shard) == sorted(files)
+    assert all(shards)
+    # Assignment only depends on the path, not on the other files
+    assert select_shard(files[::-1], 3, 8) == shards[3][::-1]
+
+
+def test_parse_shard():
+    assert parse_shard("2/10") == (2, 10)
+    for bad in ("10/10", "-1/4", "1", "a/b", "0/0"):
+        with pytest.raises(ValueError):
+            parse_shard(bad)
@@ -1,2 +1,30 @@
+import os
+import subprocess
+import sys
+
+# Import time allowed for the package and its CLI module, as a fraction of the import time of pandas
+# measured in the same process, so that the budget follows the speed of the machine
+IMPORT_BUDGET_OF_PANDAS = 0.25
+
+
 def test_import():
     from morphomeasure import LMeasureWrapper
+
+
+def test_cli_import_is_lazy_and_within_budget():
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (package_parent, os.environ.get("PYTHONPATH")) if p))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "import sys, morphomeasure, morphomeasure.cli; print(sorted({'pandas', 'numpy'} & set(sys.modules))); "
+         "import pandas"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    assert result.stdout.strip() == "[]"
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    cumulative = {
+        line.split("|")[2].strip(): int(line.split("|")[1])
+        for line in result.stderr.splitlines() if line.startswith("import time:") and "[us]" not in line
+    }
+    package = cumulative["morphomeasure"] + cumulative["morphomeasure.cli"]
+    assert package < IMPORT_BUDGET_OF_PANDAS * cumulative["pandas"]
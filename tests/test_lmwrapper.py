@@ -0,0 +1,359 @@
+import json
+import os
+import re
+import stat
+import sys
+import textwrap
+
+import pytest
+
+from morphomeasure import LMeasureWrapper, native
+from morphomeasure.features import features, sholl_features
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="fake L-Measure is a POSIX script")
+
+FAKE_LM = textwrap.dedent("""\
+    #!{python}
+    import re, sys
+    open(sys.argv[0] + ".calls", "a").write("x")
+    lines = open(sys.argv[1]).read().splitlines()
+    out = lines[1].split()[0]
+    tag = re.findall(r"-l1,2,8,([0-9.]+)", lines[0])[0]
+    with (open(out[2:], "w") if out.startswith("-s") else sys.stdout) as f:
+        for func in re.findall(r"-f(\\d+),", lines[0]):
+            f.write(lines[2] + "\\n")
+            for i in range(int(func) % 3 + 1):
+                f.write(f"{{int(func) + float(tag) + i}}\\n")
+    """)
+
+
+@pytest.fixture
+def fake_lm(tmp_path):
+    path = tmp_path / "Lm"
+    path.write_text(FAKE_LM.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_fused_matches_per_feature(fake_lm, tmp_path):
+    swc = tmp_path / "neuron.swc"
+    swc.write_text("1 1 0 0 0 1 -1\n")
+    lm = LMeasureWrapper(fake_lm)
+    fused = lm.extract_features(str(swc), features, "3.0")
+    single = lm.extract_features(str(swc), features, "3.0", fused=False)
+    assert list(fused.columns) == list(features)
+    assert fused.equals(single)
+
+
+def test_stdout_output_matches_output_file(fake_lm, tmp_path):
+    swc = tmp_path / "neuron.swc"
+    swc.write_text("1 1 0 0 0 1 -1\n")
+    from_file = LMeasureWrapper(fake_lm).extract_features(str(swc), features, "3.0")
+    from_stdout = LMeasureWrapper(fake_lm, lm_output="stdout").extract_features(str(swc), features, "3.0")
+    assert from_stdout.equals(from_file)
+    assert from_file["Length"].dtype == "float64"
+
+
+def test_missing_tag_runs_lm_once_per_group(fake_lm, tmp_path):
+    # No values for tag 7.0, only the headers, as for a neuron without glia
+    script = open(fake_lm).read().replace("for i in range(int(func)", "for i in range(0 if tag == '7.0' else int(func)")
+    open(fake_lm, "w").write(script)
+    swc = tmp_path / "neuron.swc"
+    swc.write_text("1 1 0 0 0 1 -1\n")
+    tagged = [name for name, flag in features.items() if "{TAG}" in flag and not native.is_native_only(flag)]
+    for lm_output in ("stdout", "file"):
+        lm = LMeasureWrapper(fake_lm, lm_output=lm_output)
+        df = lm.extract_features(str(swc), features, "7.0")
+        assert df[tagged].isna().all().all()
+        assert len(open(fake_lm + ".calls").read()) == lm.lm_invocations(f.replace("{TAG}", "7.0") for f in features.values())
+        os.remove(fake_lm + ".calls")
+
+
+def test_parallel_batch_matches_serial(fake_lm, tmp_path):
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    for name in ("a", "b", "c"):
+        (swc_dir / f"{name}.swc").write_text("1 1 0 0 0 1 -1\n")
+    lm = LMeasureWrapper(fake_lm)
+    outputs = {}
+    for jobs in (1, 2):
+        out_dir = tmp_path / f"out{jobs}"
+        lm.run_batch(str(swc_dir), str(out_dir), ["3.0", "4.0"], features_mode="combined", jobs=jobs)
+        outputs[jobs] = {
+            name: (out_dir / name).read_bytes()
+            for name in sorted(os.listdir(out_dir)) if name.endswith(".csv")
+        }
+    assert set(outputs[1]) == {"All_Morphometrics.csv", "All_Morphometrics_basal.csv", "All_Morphometrics_apical.csv"}
+    assert outputs[1] == outputs[2]
+
+
+def test_cache_serves_identical_content_without_spawning(fake_lm, tmp_path):
+    calls = tmp_path / "Lm.calls"
+    first = tmp_path / "first.swc"
+    first.write_text("1 1 0 0 0 1 -1\n")
+    renamed = tmp_path / "renamed.swc"
+    renamed.write_bytes(first.read_bytes())
+    lm = LMeasureWrapper(fake_lm, cache_dir=str(tmp_path / "cache"))
+    expected = lm.extract_features(str(first), features, "3.0")
+    spawned = len(calls.read_text())
+    assert spawned > 0
+    cached = lm.extract_features(str(renamed), features, "3.0")
+    assert len(calls.read_text()) == spawned
+    assert cached.equals(expected)
+    assert lm.cache.hits == len(features)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    from morphomeasure.cache import FeatureCache
+
+    cache = FeatureCache(str(tmp_path), max_bytes=10_000)
+    for i in range(20):
+        cache.put(f"{i:064x}", [float(i)] * 100)
+    assert cache.size() <= 10_000
+    assert cache.get(f"{19:064x}") is not None
+    assert cache.get(f"{0:064x}") is None
+
+
+def test_cache_overwrite_counts_the_entry_once(tmp_path):
+    from morphomeasure.cache import FeatureCache
+
+    cache = FeatureCache(str(tmp_path), max_bytes=10_000)
+    cache.put(f"{0:064x}", [1.0] * 100)
+    for _ in range(50):
+        cache.put(f"{1:064x}", [2.0] * 100)
+    assert cache._size == cache.size()
+    assert cache.get(f"{0:064x}") is not None
+
+
+def test_plan_extracts_each_unique_flag_once(fake_lm, tmp_path):
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    (swc_dir / "a.swc").write_text("1 1 0 0 0 1 -1\n")
+    lm = LMeasureWrapper(fake_lm, fused=False)
+    with_sholl = {**features, **sholl_features}
+    lm.run_batch(str(swc_dir), str(tmp_path / "out"), ["3.0", "4.0"], features_mode=["all", "branch"],
+                 features_dict=with_sholl)
+    # Soma_Surface does not depend on the tag, every other feature is resolved once per tag
+    unique = 1 + 2 * (len(with_sholl) - 1)
+    # Sholl features are computed natively
+    assert not any(native.is_native_only(flag) for flag in features.values())
+    sholl = sum(native.is_native_only(flag) for flag in with_sholl.values())
+    assert sholl == len(sholl_features)
+    assert len((tmp_path / "Lm.calls").read_text()) == unique - 2 * sholl
+    assert lm.last_plan_stats["planned_invocations"] == unique
+    assert lm.last_plan_stats["avoided_invocations"] == 2 * 2 * len(with_sholl) - unique
+
+
+def test_rerun_skips_unchanged_files(fake_lm, tmp_path):
+    calls = tmp_path / "Lm.calls"
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    for name in ("a", "b", "c"):
+        (swc_dir / f"{name}.swc").write_text("1 1 0 0 0 1 -1\n")
+    out_dir = tmp_path / "out"
+    lm = LMeasureWrapper(fake_lm)
+    lm.run_batch(str(swc_dir), str(out_dir), ["3.0", "4.0"], features_mode="combined")
+    expected = (out_dir / "All_Morphometrics.csv").read_bytes()
+    per_file = len(calls.read_text()) // 3
+
+    lm.run_batch(str(swc_dir), str(out_dir), ["3.0", "4.0"], features_mode="combined")
+    assert len(calls.read_text()) == 3 * per_file
+    assert lm.last_plan_stats["skipped_files"] == 3
+    assert (out_dir / "All_Morphometrics.csv").read_bytes() == expected
+
+    (swc_dir / "b.swc").write_text("1 1 0 0 0 2 -1\n")
+    lm.run_batch(str(swc_dir), str(out_dir), ["3.0", "4.0"], features_mode="combined")
+    assert len(calls.read_text()) == 4 * per_file
+    assert lm.last_plan_stats["skipped_files"] == 2
+
+
+def test_parquet_output_is_partitioned_and_typed(fake_lm, tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    for name in ("a", "b"):
+        (swc_dir / f"{name}.swc").write_text("1 1 0 0 0 1 -1\n")
+    out_dir = tmp_path / "out"
+    LMeasureWrapper(fake_lm).run_batch(
+        str(swc_dir), str(out_dir), ["3.0", "4.0"], features_mode="combined", output_format="parquet"
+    )
+    branches = pd.read_parquet(out_dir / "Branch_Morphometrics")
+    assert set(branches["neuron"].astype(str)) == {"a", "b"}
+    assert set(branches["tag"].astype(str)) == {"basal_dendrites", "apical_dendrites"}
+    assert branches["Length"].dtype == "float64"
+    # One file per tag, with the neurons as rows rather than partitions
+    assert sorted(p.relative_to(out_dir).as_posix() for p in out_dir.glob("Branch_Morphometrics/**/*.parquet")) == [
+        "Branch_Morphometrics/tag=apical_dendrites/part-0.parquet",
+        "Branch_Morphometrics/tag=basal_dendrites/part-0.parquet",
+    ]
+    summary = pd.read_parquet(out_dir / "All_Morphometrics.parquet")
+    assert list(summary.columns) == ["Features", "a_combined", "b_combined"]
+    assert summary["a_combined"].dtype == "float64"
+
+
+def test_columnar_resume_keeps_the_rows_of_skipped_neurons(fake_lm, tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    for name in ("a", "b", "c"):
+        (swc_dir / f"{name}.swc").write_text("1 1 0 0 0 1 -1\n")
+    out_dir = tmp_path / "out"
+    lm = LMeasureWrapper(fake_lm)
+    basal = out_dir / "Branch_Morphometrics" / "tag=basal_dendrites" / "part-0.feather"
+
+    def run():
+        lm.run_batch(str(swc_dir), str(out_dir), ["3.0", "4.0"], features_mode="combined", output_format="feather")
+
+    run()
+    expected = pd.read_feather(basal)
+
+    (swc_dir / "c.swc").unlink()
+    (swc_dir / "d.swc").write_text("1 1 0 0 0 1 -1\n")
+    run()
+    assert lm.last_plan_stats["skipped_files"] == 2
+    branches = pd.read_feather(basal)
+    assert sorted(set(branches["neuron"])) == ["a", "b", "d"]
+    kept = branches[branches["neuron"].isin(["a", "b"])].reset_index(drop=True)
+    pd.testing.assert_frame_equal(kept, expected[expected["neuron"].isin(["a", "b"])].reset_index(drop=True))
+
+    # A neuron recorded as done but missing from the dataset (e.g. after a crash) is extracted again
+    for part in out_dir.glob("Branch_Morphometrics/*/part-0.feather"):
+        table = pd.read_feather(part)
+        table[table["neuron"] != "d"].reset_index(drop=True).to_feather(part)
+    run()
+    assert lm.last_plan_stats["skipped_files"] == 2
+    assert sorted(set(pd.read_feather(basal)["neuron"])) == ["a", "b", "d"]
+
+
+def test_unknown_output_format_is_rejected(fake_lm, tmp_path):
+    with pytest.raises(ValueError):
+        LMeasureWrapper(fake_lm).run_batch(str(tmp_path), str(tmp_path / "out"), ["3.0"], output_format="xlsx")
+
+
+def test_merged_shards_match_unsharded_run(fake_lm, tmp_path):
+    from morphomeasure.cli import main
+
+    swc_dir = tmp_path / "swc"
+    for rel in ("a.swc", "b.swc", "sub/c.swc", "sub/d.swc", "sub/e.swc"):
+        (swc_dir / rel).parent.mkdir(parents=True, exist_ok=True)
+        (swc_dir / rel).write_text("1 1 0 0 0 1 -1\n")
+    lm = LMeasureWrapper(fake_lm)
+    lm.run_batch(str(swc_dir), str(tmp_path / "full"), ["3.0", "4.0"], features_mode="combined")
+    assert (tmp_path / "full" / "basal_dendrites" / "sub" / "Branch_Morphometrics_c.csv").exists()
+
+    shard_dir = tmp_path / "sharded"
+    processed = 0
+    for i in range(3):
+        lm.run_batch(str(swc_dir), str(shard_dir), ["3.0", "4.0"], features_mode="combined", shard=f"{i}/3")
+        processed += lm.last_plan_stats["swc_files"]
+    assert processed == 5
+    assert not (shard_dir / "All_Morphometrics.csv").exists()
+
+    main(["merge", "--output_dir", str(shard_dir)])
+    for name in ("All_Morphometrics.csv", "All_Morphometrics_basal.csv", "All_Morphometrics_apical.csv"):
+        assert (shard_dir / name).read_bytes() == (tmp_path / "full" / name).read_bytes()
+
+
+def test_concurrent_runs_match_sequential_runs(fake_lm, tmp_path):
+    swc = tmp_path / "neuron.swc"
+    swc.write_text("1 1 0 0 0 1 -1\n")
+    sequential = LMeasureWrapper(fake_lm, fused=False, max_concurrency=1).extract_features(str(swc), features, "3.0")
+    concurrent = LMeasureWrapper(fake_lm, fused=False, max_concurrency=8).extract_features(str(swc), features, "3.0")
+    assert concurrent.equals(sequential)
+
+
+def test_profiler_records_every_stage(fake_lm, tmp_path):
+    import json
+
+    from morphomeasure.profiling import Profiler
+
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    for name in ("a", "b", "c"):
+        (swc_dir / f"{name}.swc").write_text("1 1 0 0 0 1 -1\n")
+    profiler = Profiler()
+    lm = LMeasureWrapper(fake_lm, profiler=profiler)
+    # Sholl features add the spans of natively computed features
+    with_sholl = {**features, **sholl_features}
+    lm.run_batch(str(swc_dir), str(tmp_path / "out"), ["3.0", "4.0"], features_mode="all", jobs=2,
+                 features_dict=with_sholl)
+    assert {e["cat"] for e in profiler.events} == {
+        "neuron", "extract", "spawn", "lm", "parse", "compute", "summarize", "write"
+    }
+    assert sorted(e["name"] for e in profiler.events if e["cat"] == "neuron") == ["a.swc", "b.swc", "c.swc"]
+    # Spans of the worker processes are sent back to the parent
+    assert len({e["pid"] for e in profiler.events}) > 1
+
+    profiler.write_chrome_trace(str(tmp_path / "trace.json"))
+    trace = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert len(trace) == len(profiler.events)
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in trace)
+    assert "Slowest neurons" in profiler.report(top=2)
+    # Spans carry the tags and feature names, not the planner's job ids
+    assert {e["args"]["tag"] for e in profiler.events if e["cat"] == "extract"} == {"3.0,4.0"}
+    compute = {e["name"] for e in profiler.events if e["cat"] == "compute"}
+    assert compute and all(name.rsplit("@", 1)[0] in sholl_features for name in compute)
+    assert "job" not in profiler.report(top=100)
+
+
+def test_failing_neurons_are_isolated_and_quarantined(fake_lm, tmp_path):
+    # 'hang' never returns, 'bad' exits with an error and no output
+    script = open(fake_lm).read().replace(
+        "lines = open(sys.argv[1]).read().splitlines()\n",
+        "lines = open(sys.argv[1]).read().splitlines()\n"
+        "if 'hang' in lines[2]: import time; time.sleep(60)\n"
+        "if 'bad' in lines[2]: sys.exit(1)\n",
+    )
+    open(fake_lm, "w").write(script)
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    for name in ("a", "bad", "c", "hang"):
+        (swc_dir / f"{name}.swc").write_text("1 1 0 0 0 1 -1\n")
+    out_dir = tmp_path / "out"
+    lm = LMeasureWrapper(fake_lm, lm_timeout=1, lm_retries=0)
+    lm.run_batch(str(swc_dir), str(out_dir), ["3.0"], jobs=2)
+    report = json.loads((out_dir / "morphomeasure_failures.json").read_text())
+    assert (report["completed"], report["failed"]) == (2, 2)
+    assert [(f["swc_file"], f["quarantined"]) for f in report["failures"]] == [("bad.swc", False), ("hang.swc", False)]
+    assert "timed out" in report["failures"][1]["message"]
+    # Errors name the features, not the planner's internal jobs
+    for failure in report["failures"]:
+        names = re.search(r"for feature '([^']+)'", failure["message"]).group(1).split(", ")
+        assert set(names) <= {*features, *(f"{name}@3.0" for name in features)}
+    header = (out_dir / "All_Morphometrics_basal.csv").read_text().splitlines()[0]
+    assert header == "Features,a_basal_dendrites,c_basal_dendrites"
+
+    # Quarantined until the file changes, or with retry_failed
+    lm.run_batch(str(swc_dir), str(out_dir), ["3.0"])
+    assert lm.last_plan_stats["skipped_files"] == 4
+    assert all(f["quarantined"] for f in lm.last_failures)
+    (swc_dir / "bad.swc").write_text("1 1 0 0 0 2 -1\n")
+    lm.run_batch(str(swc_dir), str(out_dir), ["3.0"])
+    assert lm.last_plan_stats["skipped_files"] == 3
+    assert [f["quarantined"] for f in lm.last_failures] == [False, True]
+
+    with pytest.raises(RuntimeError):
+        lm.run_batch(str(swc_dir), str(out_dir), ["3.0"], retry_failed=True, fail_fast=True)
+
+
+def test_dry_run_reports_lm_invocations(fake_lm, tmp_path, capsys):
+    from morphomeasure.cli import main
+    from morphomeasure.planner import ExtractionPlan
+
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    for name in ("a", "b"):
+        (swc_dir / f"{name}.swc").write_text("1 1 0 0 0 1 -1\n")
+    plan = ExtractionPlan({**features, **sholl_features}, ["3.0", "4.0"], {"all"})
+    per_file = LMeasureWrapper(fake_lm).lm_invocations(plan.jobs.values())
+    assert 0 < per_file < plan.planned_invocations
+    assert LMeasureWrapper(fake_lm, fused=False).lm_invocations(plan.jobs.values()) < plan.planned_invocations
+
+    main(["--tag", "3.0", "4.0", "--swc_dir", str(swc_dir), "--output_dir", str(tmp_path / "out"),
+          "--lm_exe_path", fake_lm, "--jobs", "2", "--sholl", "--dry-run"])
+    printed = capsys.readouterr().out
+    assert f"Planned L-Measure invocations: {2 * per_file} " in printed
+    assert "Estimated wall time: 0:00:" in printed and "with 2 jobs" in printed
+    assert not (tmp_path / "out").exists() and not os.path.exists(fake_lm + ".calls")
@@ -0,0 +1,207 @@
+import math
+
+import numpy as np
+import pytest
+
+from morphomeasure import LMeasureWrapper, native
+from morphomeasure.features import features, sholl_features
+from morphomeasure.swc import NODE_DTYPE, SWCTree, load_swc, open_swc, parse_swc
+
+SWC = """\
+# soma, one basal stem that bifurcates into two tips, one apical tip
+1 1 0 0 0 1 -1
+2 3 5 0 0 0.5 1
+3 3 10 0 0 0.5 2
+4 3 15 5 0 0.25 3
+5 3 20 10 0 0.25 4
+6 3 15 -5 0 0.25 3
+7 4 0 10 0 0.5 1
+"""
+
+
+@pytest.fixture
+def swc_path(tmp_path):
+    path = tmp_path / "neuron.swc"
+    path.write_text(SWC)
+    return str(path)
+
+
+def column(df, name):
+    return [v for v in df[name].tolist() if v is not None and not math.isnan(v)]
+
+
+def test_native_basal_features(swc_path):
+    df = LMeasureWrapper(backend="native").extract_features(swc_path, features, "3.0")
+    assert list(df.columns) == list(features)
+    assert column(df, "Soma_Surface") == pytest.approx([4 * math.pi])
+    assert sum(column(df, "N_stems")) == 1
+    assert sum(column(df, "N_bifs")) == 1
+    assert sum(column(df, "N_branch")) == 3
+    assert sum(column(df, "N_tips")) == 2
+    assert column(df, "Branch_pathlength") == pytest.approx([10, 2 * math.sqrt(50), math.sqrt(50)])
+    assert column(df, "Branch_pathlength_terminal") == pytest.approx([2 * math.sqrt(50), math.sqrt(50)])
+    assert column(df, "Branch_pathlength_internal") == pytest.approx([10])
+    assert column(df, "Bif_ampl_local") == pytest.approx([90])
+    assert column(df, "Partition_asymmetry") == [0]
+    assert column(df, "Branch_Order") == [0, 0, 1, 1, 1]
+
+
+def test_native_tag_filter(swc_path):
+    df = LMeasureWrapper(backend="native").extract_features(swc_path, features, "4.0")
+    assert column(df, "Length") == pytest.approx([10])
+    assert column(df, "N_bifs") == []
+
+
+def test_topology_matches_naive_walk():
+    rng = np.random.default_rng(0)
+    n = 300
+    parents = [-1] + [int(rng.integers(1, i + 1)) for i in range(1, n)]
+    lines = [f"{i + 1} 3 {rng.normal()} {rng.normal()} {rng.normal()} 1 {p}" for i, p in enumerate(parents)]
+    tree = parse_swc("\n".join(lines))
+    assert isinstance(tree, SWCTree)
+    for i in range(n):
+        path, node = 0.0, i
+        while tree.parent[node] >= 0:
+            path += np.linalg.norm(tree.xyz[node] - tree.xyz[tree.parent[node]])
+            node = tree.parent[node]
+        assert tree.path_distance[i] == pytest.approx(path)
+    tips_below = np.zeros(n)
+    for i in np.flatnonzero(tree.is_tip):
+        node = i
+        while node >= 0:
+            tips_below[node] += 1
+            node = tree.parent[node]
+    assert np.array_equal(tree.terminal_degree, tips_below)
+
+    assert tree.nodes.dtype == NODE_DTYPE
+    for i in range(n):
+        children = tree.child_nodes[tree.child_offsets[i]:tree.child_offsets[i + 1]]
+        assert children.tolist() == np.flatnonzero(tree.parent == i).tolist()
+    position = np.empty(n, dtype=np.int64)
+    position[tree.topological_order] = np.arange(n)
+    assert (position[1:] > position[tree.parent[1:]]).all()
+
+
+def test_worker_backend_restarts_after_crash(swc_path):
+    expected = LMeasureWrapper(backend="native").extract_features(swc_path, features, "3.0")
+    lm = LMeasureWrapper(backend="worker")
+    try:
+        assert lm.extract_features(swc_path, features, "3.0").equals(expected)
+        lm.worker._proc.kill()
+        lm.worker._proc.wait()
+        assert lm.extract_features(swc_path, features, "3.0").equals(expected)
+        assert lm.worker.restarts == 1
+    finally:
+        lm.worker.close()
+
+
+HANGING_WORKER = """\
+import json, os, sys, time
+for line in sys.stdin:
+    request = json.loads(line)
+    if os.path.basename(request["swc_file"]) == "hang.swc":
+        time.sleep(60)
+    columns = {name: [1.0] for name in request["features"]}
+    print(json.dumps({"ok": True, "columns": columns}), flush=True)
+"""
+
+
+def test_hanging_neurons_time_out(tmp_path):
+    import sys
+
+    from morphomeasure.worker import LmWorker, WorkerTimeout
+
+    script = tmp_path / "worker.py"
+    script.write_text(HANGING_WORKER)
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    for name in ("a", "hang", "b"):
+        (swc_dir / f"{name}.swc").write_text(SWC)
+    command = [sys.executable, str(script)]
+
+    # The worker's own deadline, then a restarted worker for the next request
+    worker = LmWorker(command=command, timeout=1)
+    try:
+        with pytest.raises(WorkerTimeout):
+            worker.extract(str(swc_dir / "hang.swc"), {"Length": "-f1,0,0,10.0"}, "3.0")
+        assert worker.extract(str(swc_dir / "a.swc"), {"Length": "-f1,0,0,10.0"}, "3.0") == {"Length": [1.0]}
+    finally:
+        worker.close()
+
+    # A worker without a deadline is stopped by the pool-level timeout of run_batch, serial runs included
+    for jobs in (1, 2):
+        lm = LMeasureWrapper(backend="worker", worker=LmWorker(command=command), neuron_timeout=2)
+        out = tmp_path / f"out{jobs}"
+        lm.run_batch(str(swc_dir), str(out), ["3.0"], features_mode=["all", "branch"], jobs=jobs)
+        assert [(f["swc_file"], f["error"]) for f in lm.last_failures] == [("hang.swc", "TimeoutError")]
+        assert lm.last_plan_stats["timed_out_files"] == 1
+        assert (out / "basal_dendrites" / "Branch_Morphometrics_a.csv").exists()
+        assert (out / "basal_dendrites" / "Branch_Morphometrics_b.csv").exists()
+
+
+def test_sidecar_round_trip_and_invalidation(swc_path, tmp_path):
+    sidecar_dir = tmp_path / "sidecars"
+    parsed = load_swc(swc_path, sidecar=str(sidecar_dir))
+    assert len(list(sidecar_dir.iterdir())) == 1
+    reopened = load_swc(swc_path, sidecar=str(sidecar_dir))
+    # Topology comes from the sidecar instead of being recomputed
+    assert "terminal_degree" in reopened.__dict__
+    assert np.array_equal(reopened.nodes, parsed.nodes)
+    assert np.array_equal(reopened.terminal_degree, parsed.terminal_degree)
+    lm = LMeasureWrapper(backend="native", swc_sidecar=str(sidecar_dir))
+    assert lm.extract_features(swc_path, features, "3.0").equals(
+        LMeasureWrapper(backend="native").extract_features(swc_path, features, "3.0")
+    )
+
+    with open(swc_path, "a") as f:
+        f.write("8 4 0 20 0 0.5 7\n")
+    assert len(load_swc(swc_path, sidecar=str(sidecar_dir))) == 8
+
+
+def test_open_swc_shares_unchanged_trees(swc_path):
+    tree = open_swc(swc_path)
+    assert open_swc(swc_path) is tree
+    with open(swc_path, "a") as f:
+        f.write("8 4 0 20 0 0.5 7\n")
+    assert len(open_swc(swc_path)) == 8
+
+
+def test_sholl_counts_every_crossing(swc_path):
+    sholl = {name: flag.replace("10.0", "5.0") for name, flag in sholl_features.items()}
+    df = LMeasureWrapper(backend="native").extract_features(swc_path, sholl, "3.0")
+    assert column(df, "Sholl_Intersections") == [1, 1, 2, 1]
+    assert column(df, "Sholl_Critical_Radius") == [15]
+    assert column(df, "Sholl_Max_Intersections") == [2]
+    r = np.array([5.0, 10.0, 15.0, 20.0])
+    slope = np.polyfit(r, np.log10(np.array([1, 1, 2, 1]) / (np.pi * r ** 2)), 1)[0]
+    assert column(df, "Sholl_Regression") == pytest.approx([-slope])
+
+    # A compartment that passes closer to the soma than both of its ends crosses a sphere twice
+    tree = parse_swc("1 1 0 0 0 1 -1\n2 3 12 -12 0 1 1\n3 3 12 12 0 1 2\n")
+    mask = np.ones(len(tree), dtype=bool)
+    assert native.sholl_function(tree, 100, mask, 5.0)[0].tolist() == [1, 1, 3]
+
+
+def test_sholl_features_are_opt_in(swc_path, tmp_path):
+    lm = LMeasureWrapper(backend="native")
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    (swc_dir / "neuron.swc").write_text(SWC)
+    lm.run_batch(str(swc_dir), str(tmp_path / "default"), ["3.0"], features_mode=["all", "branch"])
+    summary = (tmp_path / "default" / "All_Morphometrics_basal.csv").read_text()
+    branch = (tmp_path / "default" / "basal_dendrites" / "Branch_Morphometrics_neuron.csv").read_text()
+    assert "Sholl" not in summary and "Sholl" not in branch
+
+    lm.run_batch(str(swc_dir), str(tmp_path / "sholl"), ["3.0"], features_mode=["all", "branch"],
+                 features_dict={**features, **sholl_features})
+    with_sholl = (tmp_path / "sholl" / "All_Morphometrics_basal.csv").read_text()
+    rows = [line.split(",")[0] for line in with_sholl.splitlines()]
+    assert rows == [line.split(",")[0] for line in summary.splitlines()] + list(sholl_features)
+
+
+def test_parent_cycles_are_rejected():
+    with pytest.raises(ValueError, match="own parent: 1"):
+        parse_swc("1 1 0 0 0 1 1\n")
+    with pytest.raises(ValueError, match="cycle through samples 2, 3"):
+        parse_swc("1 1 0 0 0 1 -1\n2 3 1 0 0 1 3\n3 3 2 0 0 1 2\n4 3 3 0 0 1 3\n")
+    assert len(parse_swc("1 1 0 0 0 1 -1\n2 3 1 0 0 1 1\n")) == 2
@@ -0,0 +1,38 @@
+import pandas as pd
+
+from morphomeasure import output
+from morphomeasure.output import write_summary_tables
+
+
+def reference_wide(rows, features, suffix):
+    # Column-by-column assembly used before the tables were built in one allocation
+    df_out = pd.DataFrame({"Features": features})
+    for neuron, row in rows.items():
+        df = pd.DataFrame({suffix: row})
+        df.insert(0, "Features", df.index)
+        df1 = df.set_index("Features")[df.columns[1]]
+        df_out[f"{neuron.replace('.swc', '')}_{suffix}"] = df1.reindex(features).values
+    return df_out
+
+
+def test_streamed_wide_csv_matches_column_by_column_assembly(tmp_path, monkeypatch):
+    # Streamed from the summary rows, without the (feature x neuron) matrix
+    monkeypatch.setattr(output, "_matrix", None)
+    features = ["Length", "ABEL", "N_tips"]
+    rows = {f"n{i:03d}.swc": {"Length": i / 3, "ABEL": None if i % 2 else i * 1e-7, "N_tips": float(i)} for i in range(50)}
+    write_summary_tables(str(tmp_path), ["7.0"], {"7.0": rows}, rows, features=features, chunk_columns=7)
+    expected = tmp_path / "expected.csv"
+    reference_wide(rows, features, "glia_processes").to_csv(expected, index=False)
+    assert (tmp_path / "All_Morphometrics_glia.csv").read_bytes() == expected.read_bytes()
+
+
+def test_long_layout(tmp_path):
+    rows = {"a.swc": {"Length": 1.0, "N_tips": 2.0}, "b.swc": {"Length": 3.0}}
+    write_summary_tables(str(tmp_path), ["3.0"], {"3.0": rows}, rows, layout="long", features=["Length", "N_tips"])
+    df = pd.read_csv(tmp_path / "All_Morphometrics_basal.csv")
+    assert list(df.columns) == ["neuron", "tag", "feature", "value"]
+    assert df["neuron"].tolist() == ["a", "a", "b", "b"]
+    assert set(df["tag"]) == {"basal_dendrites"}
+    assert df["feature"].tolist() == ["Length", "N_tips", "Length", "N_tips"]
+    assert df["value"][:3].tolist() == [1.0, 2.0, 3.0]
+    assert pd.isna(df["value"][3])
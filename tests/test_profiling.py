@@ -0,0 +1,35 @@
+from morphomeasure.profiling import NULL_PROFILER, Profiler
+
+
+def test_null_profiler_records_nothing():
+    with NULL_PROFILER.span("feature", "lm", tag="3.0"):
+        pass
+    assert NULL_PROFILER.drain() == []
+    assert NULL_PROFILER.span("a", "lm") is NULL_PROFILER.span("b", "parse")
+
+
+def test_overlapping_spans_get_separate_rows():
+    profiler = Profiler()
+    profiler.extend([
+        {"name": "neuron", "cat": "neuron", "start": 0, "dur": 100, "pid": 1, "args": {}},
+        {"name": "A", "cat": "lm", "start": 10, "dur": 50, "pid": 1, "args": {}},
+        {"name": "B", "cat": "lm", "start": 20, "dur": 50, "pid": 1, "args": {}},
+        {"name": "C", "cat": "lm", "start": 70, "dur": 10, "pid": 1, "args": {}},
+    ])
+    rows = {e["name"]: e["tid"] for e in profiler.chrome_trace()["traceEvents"]}
+    # A and C nest in the neuron span, B overlaps A and needs a row of its own
+    assert rows["neuron"] == rows["A"] == rows["C"]
+    assert rows["B"] != rows["A"]
+    assert list(profiler.totals("lm")) == ["A", "B", "C"]
+
+
+def test_report_adds_native_and_lmeasure_feature_times():
+    profiler = Profiler()
+    profiler.extend([
+        {"name": "Length", "cat": "lm", "start": 0, "dur": 2e9, "pid": 1, "args": {}},
+        {"name": "Length", "cat": "compute", "start": 0, "dur": 1e9, "pid": 2, "args": {}},
+        {"name": "Sholl", "cat": "compute", "start": 0, "dur": 5e8, "pid": 2, "args": {}},
+    ])
+    rows = profiler.report().split("Slowest features")[1].splitlines()[1:3]
+    assert rows[0].split() == ["Length", "3.000", "2"]
+    assert rows[1].split() == ["Sholl", "0.500", "1"]
@@ -0,0 +1,80 @@
+import asyncio
+import subprocess
+import sys
+import time
+
+import pytest
+
+from morphomeasure.scheduler import LmScheduler
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_runs_concurrently_under_the_limit():
+    scheduler = LmScheduler(max_concurrency=3)
+
+    async def run_all():
+        return await asyncio.gather(*(
+            scheduler.run(python(f"import time; time.sleep(0.4); print({i})")) for i in range(6)
+        ))
+
+    start = time.perf_counter()
+    results = scheduler.execute(run_all())
+    elapsed = time.perf_counter() - start
+    assert [r.stdout.strip() for r in results] == [str(i) for i in range(6)]
+    # Two waves of three: faster than six sequential sleeps, never more than three at once
+    assert 0.8 <= elapsed < 2.0
+
+
+def test_hung_process_is_killed_and_retried():
+    scheduler = LmScheduler(timeout=0.3, retries=1, retry_delay=0)
+    start = time.perf_counter()
+    with pytest.raises(subprocess.TimeoutExpired):
+        scheduler.execute(scheduler.run(python("import time; time.sleep(30)")))
+    assert time.perf_counter() - start < 10
+    assert scheduler.retried == 1
+
+
+def _running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Field 3 is the state; a killed child not yet reaped by init is a zombie ('Z')
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc")
+def test_timeout_kills_the_process_tree(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    child = python("import time; time.sleep(30)")
+    code = f"import subprocess, time; p = subprocess.Popen({child!r}); open({str(pid_file)!r}, 'w').write(str(p.pid)); time.sleep(30)"
+    scheduler = LmScheduler(timeout=1.0, retries=0)
+    start = time.perf_counter()
+    with pytest.raises(subprocess.TimeoutExpired):
+        scheduler.execute(scheduler.run(python(code)))
+    # The orphaned child would otherwise hold the output pipes open until it exits
+    assert time.perf_counter() - start < 10
+    pid = int(pid_file.read_text())
+    deadline = time.monotonic() + 5
+    while _running(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _running(pid)
+
+
+def test_rejected_result_is_retried(tmp_path):
+    marker = tmp_path / "attempted"
+    code = f"import os, sys; p = {str(marker)!r}; first = not os.path.exists(p); open(p, 'w'); sys.exit(1 if first else 0)"
+    scheduler = LmScheduler(retries=2, retry_delay=0)
+    result = scheduler.execute(scheduler.run(python(code), accept=lambda r: r.returncode == 0))
+    assert result.returncode == 0
+    assert scheduler.retried == 1
+
+
+def test_missing_program_is_not_retried(tmp_path):
+    scheduler = LmScheduler(retries=3, retry_delay=0)
+    with pytest.raises(FileNotFoundError):
+        scheduler.execute(scheduler.run([str(tmp_path / "missing")]))
+    assert scheduler.retried == 0
@@ -0,0 +1,151 @@
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from benchmarks.synthetic import synthetic_swc
+from morphomeasure import LMeasureWrapper
+from morphomeasure.features import features
+from morphomeasure.lmwrapper import branch_table
+from morphomeasure.server import ExtractionService, ServiceBusy, make_server
+from morphomeasure.summary import summarize
+
+
+class HangingWrapper(LMeasureWrapper):
+    """Never finishes the extraction of files named hang.swc."""
+
+    def _extract_arrays(self, swc_file, *args, **kwargs):
+        if os.path.basename(swc_file) == "hang.swc":
+            time.sleep(60)
+        return super()._extract_arrays(swc_file, *args, **kwargs)
+
+
+@pytest.fixture
+def swc_files(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"n{i}.swc"
+        path.write_text(synthetic_swc(80 + 20 * i, depth=2, tags=(3, 4), seed=i))
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def server(tmp_path):
+    service = ExtractionService(LMeasureWrapper(backend="native"), batch_window=0.05)
+    httpd = make_server(service, port=0, swc_root=str(tmp_path))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    service.close()
+
+
+def post(httpd, body, content_type="application/json", query=""):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{httpd.server_address[1]}/extract{query}",
+        data=body if isinstance(body, bytes) else json.dumps(body).encode(),
+        headers={"Content-Type": content_type},
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.headers["Content-Type"], response.read()
+
+
+def test_concurrent_requests_are_batched_and_match_extract_features(server, swc_files):
+    responses = [None] * len(swc_files)
+
+    def request(i):
+        responses[i] = json.loads(post(server, {"path": swc_files[i], "tags": ["3.0", "4.0"]})[1])
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(len(swc_files))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    health = server.service.health()
+    assert health["requests"] == len(swc_files) and health["batches"] < len(swc_files)
+
+    lm = LMeasureWrapper(backend="native")
+    for path, response in zip(swc_files, responses):
+        frames = [(path, tag, lm.extract_features(path, features, tag)) for tag in ("3.0", "4.0")]
+        tag_summaries, combined = summarize(frames)
+        for _, tag, frame in frames:
+            expected = branch_table(frame)
+            assert list(response["tags"][tag]["branch"]) == list(expected.columns)
+            assert response["tags"][tag]["branch"]["Length"] == pytest.approx(expected["Length"].dropna().tolist())
+            assert response["tags"][tag]["summary"]["Length"] == pytest.approx(tag_summaries[(path, tag)]["Length"])
+        assert response["combined"]["N_tips"] == combined[path]["N_tips"]
+
+
+def test_upload_arrow_and_errors(server, swc_files, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    with open(swc_files[0], "rb") as f:
+        content_type, body = post(server, f.read(), "text/plain", "?tag=3.0&format=arrow")
+    assert content_type == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(io.BytesIO(body)).read_all()
+    assert set(table.column("tag").to_pylist()) == {"3.0"}
+    summary = json.loads(table.schema.metadata[b"morphomeasure.summary"])
+    assert summary["neuron"] == "upload" and "Length" in summary["tags"]["3.0"]
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        post(server, {"path": "../outside.swc"})
+    assert e.value.code == 403
+    with pytest.raises(urllib.error.HTTPError) as e:
+        post(server, {"path": "missing.swc"})
+    assert e.value.code == 404
+
+
+def test_full_queue_rejects_requests(swc_files):
+    service = ExtractionService(LMeasureWrapper(backend="native"), max_queue=2, start=False)
+    futures = [service.submit(swc_files[0], ["3.0"]), service.submit(swc_files[1], ["3.0"])]
+    with pytest.raises(ServiceBusy):
+        service.submit(swc_files[2], ["3.0"])
+    assert service.health()["rejected"] == 1
+    service.start()
+    assert [f.result()["neuron"] for f in futures] == ["n0", "n1"]
+    service.close()
+
+
+def test_path_requests_need_a_root(swc_files):
+    service = ExtractionService(LMeasureWrapper(backend="native"))
+    httpd = make_server(service, port=0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as e:
+            post(httpd, {"path": swc_files[0]})
+        assert e.value.code == 403
+        with pytest.raises(urllib.error.HTTPError) as e:
+            post(httpd, {"path": "/no/such/file.swc"})
+        assert e.value.code == 403
+        with open(swc_files[0], "rb") as f:
+            assert json.loads(post(httpd, f.read(), "text/plain")[1])["neuron"] == "upload"
+    finally:
+        httpd.shutdown()
+        service.close()
+
+
+def test_stuck_requests_time_out_without_blocking_others(swc_files, tmp_path):
+    (tmp_path / "hang.swc").write_text(open(swc_files[0]).read())
+    service = ExtractionService(HangingWrapper(backend="native"), max_batch=1, timeout=2)
+    httpd = make_server(service, port=0, swc_root=str(tmp_path), request_timeout=0.5)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        start = time.monotonic()
+        with pytest.raises(urllib.error.HTTPError) as e:
+            post(httpd, {"path": "hang.swc", "tags": ["3.0"]})
+        assert e.value.code == 504 and time.monotonic() - start < 2
+        # The only worker is stuck until the service abandons the batch and replaces it
+        stuck = service.submit(str(tmp_path / "hang.swc"), ["3.0"])
+        later = service.submit(swc_files[1], ["3.0"])
+        with pytest.raises(TimeoutError):
+            stuck.result(timeout=30)
+        assert later.result(timeout=30)["neuron"] == "n1"
+        assert time.monotonic() - start < 30
+    finally:
+        httpd.shutdown()
+        service.close()
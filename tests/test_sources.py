@@ -0,0 +1,62 @@
+import gzip
+import io
+import tarfile
+import zipfile
+
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_swc
+from morphomeasure import LMeasureWrapper
+from morphomeasure.sources import iter_archive, scan_archive
+
+
+def _texts():
+    return {f"set{i % 2}/cell{i}.swc": synthetic_swc(200, depth=3, seed=i) for i in range(4)}
+
+
+def _summary(out):
+    return pd.read_csv(out / "All_Morphometrics_basal.csv", index_col=0)
+
+
+def test_archives_and_gzip_match_plain_directory(tmp_path):
+    texts = _texts()
+    plain = tmp_path / "plain"
+    gz = tmp_path / "gz"
+    for name, text in texts.items():
+        for root, data, suffix in ((plain, text.encode(), ""), (gz, gzip.compress(text.encode()), ".gz")):
+            (root / name).parent.mkdir(parents=True, exist_ok=True)
+            (root / (name + suffix)).write_bytes(data)
+    with zipfile.ZipFile(tmp_path / "cells.zip", "w") as z:
+        for name, text in texts.items():
+            z.writestr(name, text)
+    with tarfile.open(tmp_path / "cells.tar.gz", "w:gz") as t:
+        for name, text in texts.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(text.encode())
+            t.addfile(info, io.BytesIO(text.encode()))
+
+    lm = LMeasureWrapper(backend="native")
+    lm.run_batch(str(plain), str(tmp_path / "out_plain"), ["3.0"], features_mode=["all", "branch"])
+    expected = _summary(tmp_path / "out_plain")
+    for source in ("gz", "cells.zip", "cells.tar.gz"):
+        out = tmp_path / f"out_{source}"
+        lm.run_batch(str(tmp_path / source), str(out), ["3.0"], features_mode=["all", "branch"], jobs=2)
+        pd.testing.assert_frame_equal(_summary(out), expected)
+        assert (out / "basal_dendrites" / "set1" / "Branch_Morphometrics_cell3.csv").exists()
+        # Unchanged members are served from the manifest on the next run
+        lm.run_batch(str(tmp_path / source), str(out), ["3.0"], features_mode=["all", "branch"])
+        assert lm.last_plan_stats["skipped_files"] == len(texts)
+
+
+def test_archive_members_outside_root_are_skipped(tmp_path):
+    archive = tmp_path / "cells.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("../escape.swc", "1 1 0 0 0 1 -1\n")
+        z.writestr("/abs.swc", "1 1 0 0 0 1 -1\n")
+        z.writestr("./ok.swc.gz", gzip.compress(b"1 1 0 0 0 1 -1\n"))
+        z.writestr("notes.txt", "")
+    digests = scan_archive(str(archive))
+    assert list(digests) == ["ok.swc.gz"]
+    [member] = iter_archive(str(archive), digests)
+    assert member.data == b"1 1 0 0 0 1 -1\n"
+    assert member.digest == digests["ok.swc.gz"]
@@ -0,0 +1,58 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_swc
+from morphomeasure import LMeasureWrapper
+from morphomeasure.store import ResultStore
+
+
+def _updated(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return dict(conn.execute("SELECT neuron, updated FROM neurons"))
+
+
+def test_store_matches_outputs_and_updates_incrementally(tmp_path):
+    swc_dir = tmp_path / "swc"
+    (swc_dir / "labX").mkdir(parents=True)
+    for i, name in enumerate(["labX/a.swc", "labX/b.swc", "c.swc"]):
+        (swc_dir / name).write_text(synthetic_swc(200, depth=3, seed=i))
+    out = tmp_path / "out"
+    db_path = str(tmp_path / "results.db")
+    lm = LMeasureWrapper(backend="native")
+    run = dict(features_mode=["all", "branch"], store=db_path)
+    lm.run_batch(str(swc_dir), str(out), ["3.0", "4.0"], **run)
+
+    with ResultStore(db_path) as db:
+        summary = db.query("N_tips", tag="apical_dendrites", neuron="labX/*", level="summary")
+        assert list(summary["neuron"]) == ["labX/a", "labX/b"]
+        table = pd.read_csv(out / "All_Morphometrics_apical.csv", index_col=0)
+        assert list(summary["value"]) == [table.loc["N_tips", "labX/a_apical_dendrites"], table.loc["N_tips", "labX/b_apical_dendrites"]]
+        branch = db.query("Branch_pathlength", tag="3.0", neuron="c")
+        csv = pd.read_csv(out / "basal_dendrites" / "Branch_Morphometrics_c.csv")
+        np.testing.assert_allclose(branch["value"], csv["Branch_pathlength"].dropna())
+        assert set(db.query(tag="combined", level="summary")["neuron"]) == {"labX/a", "labX/b", "c"}
+
+    # Only the modified neuron is rewritten, and removed files leave the store
+    before = _updated(db_path)
+    (swc_dir / "labX" / "b.swc").write_text(synthetic_swc(200, depth=3, seed=7))
+    (swc_dir / "c.swc").unlink()
+    lm.run_batch(str(swc_dir), str(out), ["3.0", "4.0"], **run)
+    after = _updated(db_path)
+    assert set(after) == {"labX/a", "labX/b"}
+    assert after["labX/a"] == before["labX/a"] and after["labX/b"] != before["labX/b"]
+
+    # A new store is filled even though the run manifest is up to date
+    lm.run_batch(str(swc_dir), str(out), ["3.0", "4.0"], features_mode=["all", "branch"], store=str(tmp_path / "new.db"))
+    assert lm.last_plan_stats["skipped_files"] == 0
+    assert set(_updated(str(tmp_path / "new.db"))) == {"labX/a", "labX/b"}
+
+
+def test_store_upsert_removes_stale_rows(tmp_path):
+    with ResultStore(str(tmp_path / "r.db"), batch_size=1) as db:
+        db.add("n.swc", "d1", "c", {"3.0": pd.DataFrame({"Length": [1.0, 2.0, 3.0]})}, {"3.0": {"Length": 6.0}}, None)
+        db.add("n.swc", "d2", "c", {"3.0": pd.DataFrame({"Length": [1.0, 5.0]})}, {"3.0": {"Length": None}}, None)
+        assert list(db.query("Length")["value"]) == [1.0, 5.0]
+        assert db.query(level="summary").empty
+        assert db.current("n.swc", "d2", "c") and not db.current("n.swc", "d1", "c")
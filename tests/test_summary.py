@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from morphomeasure.features import summary_logic
+from morphomeasure.summary import summarize
+
+
+def frame(**columns):
+    length = max(len(v) for v in columns.values())
+    return pd.DataFrame({k: [str(x) for x in v] + [None] * (length - len(v)) for k, v in columns.items()})
+
+
+def test_summaries_match_reference_semantics():
+    basal = frame(Soma_Surface=[12.5], Length=[1, 2, 3], Branch_pathlength=[2, 4], Contraction=[0.5, 1.0])
+    apical = frame(Soma_Surface=[12.5], Length=[10], Branch_pathlength=[6], Contraction=[0.5])
+    tag_summaries, combined = summarize([("n", "3.0", basal), ("n", "4.0", apical)])
+    assert tag_summaries[("n", "3.0")]["Length"] == 6
+    assert tag_summaries[("n", "3.0")]["Soma_Surface"] == 12.5
+    assert tag_summaries[("n", "3.0")]["ABEL"] == pytest.approx((2 * 0.5 + 4 * 1.0) / 2)
+    assert tag_summaries[("n", "3.0")]["BAPL"] == pytest.approx(3)
+    assert tag_summaries[("n", "3.0")]["ABEL_Terminal"] is None
+    assert combined["n"]["Length"] == 16
+    assert combined["n"]["Soma_Surface"] == 12.5
+    assert combined["n"]["ABEL"] == pytest.approx((1 + 4 + 3) / 3)
+
+
+def test_extra_operations_and_empty_tables():
+    logic = {"Length": ("median", "Length_median"), "Diameter": ("p90", "Diameter_p90"), "N_tips": ("sum", "N_tips")}
+    df = frame(Length=[1, 2, 10], Diameter=list(range(11)), N_tips=[])
+    tag_summaries, combined = summarize([("n", "3.0", df), ("m", "3.0", df.iloc[:0])], logic, combined=False)
+    assert combined is None
+    assert tag_summaries[("n", "3.0")]["Length_median"] == 2
+    assert tag_summaries[("n", "3.0")]["Diameter_p90"] == pytest.approx(9)
+    assert tag_summaries[("n", "3.0")]["N_tips"] == 0
+    assert math.isnan(tag_summaries[("m", "3.0")]["Length_median"])
+    with pytest.raises(ValueError):
+        summarize([("n", "3.0", df)], {"Length": ("mode", "Length")})
+
+
+def reference_summary(df):
+    """The per-neuron summary of the original implementation, one pandas reduction per column."""
+    summary = {}
+    for col, (op, out_label) in summary_logic.items():
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors="coerce")
+            if op == "first":
+                summary[out_label] = values.iloc[0] if not values.empty else None
+            else:
+                summary[out_label] = getattr(values, op)()
+    summary["Sum_EucDistance"] = pd.to_numeric(df["EucDistance"], errors="coerce").sum()
+    length = pd.to_numeric(df["Branch_pathlength"], errors="coerce")
+    summary["ABEL"] = (length * pd.to_numeric(df["Contraction"], errors="coerce")).mean()
+    summary["BAPL"] = length.mean()
+    return summary
+
+
+def test_grouped_summaries_match_the_per_neuron_path():
+    rng = np.random.default_rng(7)
+    columns = ["Soma_Surface", "Length", "Diameter", "EucDistance", "Branch_pathlength", "Contraction", "N_tips"]
+    frames = []
+    # Neurons of every size, the tags of one neuron not adjacent, and a few missing values
+    for tag in ("3.0", "4.0"):
+        for neuron in range(12):
+            n = int(rng.integers(1, 3000))
+            values = rng.random((n, len(columns))) * 10.0 ** rng.uniform(-3, 4, (n, len(columns)))
+            values[rng.random(values.shape) < 0.05] = np.nan
+            frames.append((f"n{neuron}", tag, pd.DataFrame(values, columns=columns)))
+    tag_summaries, combined = summarize(frames)
+
+    def same(actual, expected):
+        return {k: actual[k] for k in expected} == pytest.approx(expected, rel=1e-12, nan_ok=True)
+
+    for neuron, tag, df in frames:
+        assert same(tag_summaries[(neuron, tag)], reference_summary(df))
+    for neuron in combined:
+        pooled = pd.concat([df for n, _, df in frames if n == neuron], ignore_index=True)
+        assert same(combined[neuron], reference_summary(pooled))
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_swc
+from morphomeasure import LMeasureWrapper
+from morphomeasure.watch import FolderWatcher, watch
+
+
+def test_watcher_waits_for_files_to_settle(tmp_path):
+    watcher = FolderWatcher(str(tmp_path))
+    (tmp_path / "a.swc").write_text("1 1 0 0 0 1 -1\n")
+    assert watcher.poll() is None
+    state = watcher.poll()
+    assert list(state) == ["a.swc"]
+    watcher.commit(state)
+    assert watcher.poll() is None
+
+    # A file being rewritten keeps its processed version until it settles
+    (tmp_path / "a.swc").write_text("1 1 0 0 0 2 -1\n")
+    assert watcher.poll() is None
+    assert watcher.poll()["a.swc"][1] != state["a.swc"][1]
+
+
+def test_watch_updates_outputs_incrementally(tmp_path):
+    swc_dir = tmp_path / "swc"
+    swc_dir.mkdir()
+    (swc_dir / "a.swc").write_text(synthetic_swc(200, depth=3, seed=1))
+    out = tmp_path / "out"
+    updates = []
+
+    def on_update(stats):
+        updates.append((stats["swc_files"], stats["skipped_files"]))
+        if len(updates) == 1:
+            (swc_dir / "b.swc").write_text(synthetic_swc(200, depth=3, seed=2))
+        elif len(updates) == 2:
+            (swc_dir / "a.swc").unlink()
+
+    lm = LMeasureWrapper(backend="native")
+    watch(
+        lm, str(swc_dir), str(out), ["3.0"], interval=0, max_polls=6, on_update=on_update,
+        features_mode=["all", "branch"],
+    )
+    # Only the new file is extracted; the removed one leaves the summary table
+    assert updates == [(1, 0), (2, 1), (1, 1)]
+    table = pd.read_csv(out / "All_Morphometrics_basal.csv", index_col=0)
+    assert list(table.columns) == ["b_basal_dendrites"]
+    assert (out / "basal_dendrites" / "Branch_Morphometrics_b.csv").exists()